@@ -0,0 +1,78 @@
+"""基准与浸泡测试共用的本地替身：立即返回的假模型、fakeredis、进程内的模拟 OpenAI 服务"""
+import os
+import socket
+import threading
+import time
+from typing import Any, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+class InstantChatModel(BaseChatModel):
+    """立即返回固定回复的聊天模型，支持 bind_tools 以便构建工具调用型代理"""
+
+    reply: str = "这个单词的意思是‘男孩’，你理解这个意思了吗？"
+
+    @property
+    def _llm_type(self) -> str:
+        return "instant"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply))])
+
+    def bind_tools(self, tools, **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+
+def use_fake_redis(redis_url: Optional[str] = None) -> None:
+    """未指定 Redis 时，让 RedisChatMessageHistory 和用量账本使用进程内的 fakeredis"""
+    if redis_url:
+        os.environ["REDIS_URL"] = redis_url
+        return
+    import fakeredis
+    import langchain_community.chat_message_histories.redis as redis_history
+    from src import Usage
+
+    server = fakeredis.FakeServer()
+    redis_history.get_client = lambda redis_url, **kwargs: fakeredis.FakeRedis(server=server)
+    Usage.redis_client = lambda url: fakeredis.FakeRedis(server=server, decode_responses=True)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_mock_openai(**settings: Any) -> str:
+    """
+    在后台线程启动 bench.mock_openai，并把所有模型相关环境变量指向它
+
+    Args:
+        **settings: 覆盖 MockSettings 的字段，例如 latency_ms=1, token_rate=0
+
+    Returns:
+        模拟服务的 base url（含 /v1）
+    """
+    import uvicorn
+    from bench import mock_openai
+
+    for key, value in settings.items():
+        setattr(mock_openai.settings, key, value)
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(mock_openai.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="mock-openai", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    base_url = f"http://127.0.0.1:{port}/v1"
+    for key in ("OPENAI_API_BASE", "DEEPSEEK_API_BASE", "BASE_URL", "EMBEDDING_API_BASE"):
+        os.environ[key] = base_url
+    for key in ("OPENAI_API_KEY", "DEEPSEEK_API_KEY", "MODEL_API_KEY", "EMBEDDING_API_KEY"):
+        os.environ[key] = "mock"
+    for key in ("BASE_MODEL", "BACKUP_MODEL", "MODEL_NAME"):
+        os.environ.setdefault(key, "mock-model")
+    return base_url
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+启动耗时基准：在独立子进程中用 `python -X importtime` 导入每个模块，
+统计各模块的累计导入耗时以及最重的第三方依赖。
+
+用法:
+    python -m bench.import_time                # 测量 src 下全部模块
+    python -m bench.import_time src.Agents -n 5 --top 15
+    python -m bench.import_time --json import_time.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = [
+    "src",
+    "src.Logger",
+    "src.Metrics",
+    "src.Models",
+    "src.Storage",
+    "src.Prompt",
+    "src.Memory",
+    "src.Tools",
+    "src.Agents",
+    "src.AddDoc",
+]
+
+
+def measure(module: str) -> dict:
+    """在全新解释器中导入模块，返回 {模块名: 累计耗时(微秒)}"""
+    code = f"import {module}" if module else "pass"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    timings = {}
+    for line in proc.stderr.splitlines():
+        # 格式: import time:   self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = int(cumulative)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="统计 src 各模块的导入耗时")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="每个模块重复测量次数，取中位数")
+    parser.add_argument("--top", type=int, default=10, help="列出最重的依赖数量")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    # 解释器启动时就会导入的模块（site、encodings 等）不计入结果
+    startup = set(measure(""))
+
+    report = {}
+    for module in args.modules:
+        try:
+            runs = [measure(module) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{module:<20} 导入失败: {e}")
+            report[module] = {"error": str(e)}
+            continue
+        total = statistics.median(run.get(module, 0) for run in runs) / 1000
+        heaviest = sorted(runs[-1].items(), key=lambda kv: kv[1], reverse=True)
+        top = [(name, us / 1000) for name, us in heaviest if name not in startup and not name.startswith(module)][:args.top]
+        report[module] = {"total_ms": total, "top": top}
+
+        print(f"{module:<20} {total:>9.1f} ms")
+        for name, ms in top:
+            print(f"    {name:<50} {ms:>9.1f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
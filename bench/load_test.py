@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+"""
+聊天接口压测：模拟 N 个并发学习者按固定脚本对话，统计吞吐与延迟分位数。
+
+支持的目标:
+    chat      src/server.py 的 POST /chat
+    ws        src/server.py 的 /ws（JSON 协议）
+    graph-ws  demo/main.py 的 /ws/chat（首条消息为单词，每轮以 [END] 结束）
+    word-ws   test/test_07.py 的 /ws/{word}（每轮一条回复）
+
+离线基线（配合 bench.mock_openai）:
+    python -m bench.mock_openai --port 9000 &
+    OPENAI_API_BASE=http://127.0.0.1:9000/v1 ... python -m src.server &
+    python -m bench.load_test chat --url http://127.0.0.1:8000 -c 50 -t 8 --json baseline.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import List
+
+import aiohttp
+
+from bench.stats import percentiles
+
+# 学习者的对话脚本，对应提示词中的固定指令
+SCRIPT = ["", "{word}", "详细用法", "固定搭配", "词根词缀", "例句", "选择题", "A"]
+WORDS = ["boy", "apple", "book", "happy", "river", "teacher", "window", "travel"]
+
+
+@dataclass
+class Recorder:
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    error_samples: List[str] = field(default_factory=list)
+
+    def ok(self, seconds: float) -> None:
+        self.latencies.append(seconds)
+
+    def fail(self, reason: str) -> None:
+        self.errors += 1
+        if len(self.error_samples) < 5:
+            self.error_samples.append(reason[:200])
+
+
+def _turns(word: str, count: int, skip_greeting: bool = False) -> List[str]:
+    script = SCRIPT[1:] if skip_greeting else SCRIPT
+    return [script[i % len(script)].format(word=word) for i in range(count)]
+
+
+async def _think(args) -> None:
+    if args.think_ms:
+        await asyncio.sleep(random.uniform(0, 2 * args.think_ms) / 1000)
+
+
+async def learner_chat(session, args, rec: Recorder, word: str) -> None:
+    user_id = f"learner-{uuid.uuid4().hex[:8]}"
+    for text in _turns(word, args.turns):
+        start = time.perf_counter()
+        try:
+            async with session.post(f"{args.url}/chat", json={"input": text, "user_id": user_id}) as resp:
+                body = await resp.json(content_type=None)
+            if resp.status != 200 or "error" in body:
+                rec.fail(f"{resp.status} {body}")
+            else:
+                rec.ok(time.perf_counter() - start)
+        except Exception as e:
+            rec.fail(repr(e))
+        await _think(args)
+
+
+async def learner_ws(session, args, rec: Recorder, word: str) -> None:
+    user_id = f"learner-{uuid.uuid4().hex[:8]}"
+    async with session.ws_connect(f"{args.ws_url}/ws") as ws:
+        for text in _turns(word, args.turns):
+            start = time.perf_counter()
+            try:
+                await ws.send_str(json.dumps({"input": text, "user_id": user_id}))
+                body = json.loads(await ws.receive_str(timeout=args.timeout))
+                if "error" in body:
+                    rec.fail(str(body))
+                else:
+                    rec.ok(time.perf_counter() - start)
+            except Exception as e:
+                rec.fail(repr(e))
+                return
+            await _think(args)
+
+
+async def _receive_until_end(ws, timeout: float) -> str:
+    reply = ""
+    while True:
+        text = await ws.receive_str(timeout=timeout)
+        if text == "[END]":
+            return reply
+        reply = text
+
+
+async def learner_graph_ws(session, args, rec: Recorder, word: str) -> None:
+    async with session.ws_connect(f"{args.ws_url}/ws/chat") as ws:
+        start = time.perf_counter()
+        try:
+            # 首条消息为学习单词，服务端回复欢迎语
+            await ws.send_str(word)
+            await _receive_until_end(ws, args.timeout)
+            rec.ok(time.perf_counter() - start)
+        except Exception as e:
+            rec.fail(repr(e))
+            return
+        for text in _turns(word, args.turns - 1, skip_greeting=True):
+            await _think(args)
+            start = time.perf_counter()
+            try:
+                await ws.send_str(text)
+                await _receive_until_end(ws, args.timeout)
+                rec.ok(time.perf_counter() - start)
+            except Exception as e:
+                rec.fail(repr(e))
+                return
+
+
+async def learner_word_ws(session, args, rec: Recorder, word: str) -> None:
+    start = time.perf_counter()
+    async with session.ws_connect(f"{args.ws_url}/ws/{word}") as ws:
+        try:
+            # 连接建立后服务端自动发送欢迎语
+            await ws.receive_str(timeout=args.timeout)
+            rec.ok(time.perf_counter() - start)
+        except Exception as e:
+            rec.fail(repr(e))
+            return
+        for text in _turns(word, args.turns - 1, skip_greeting=True):
+            await _think(args)
+            start = time.perf_counter()
+            try:
+                await ws.send_str(text)
+                await ws.receive_str(timeout=args.timeout)
+                rec.ok(time.perf_counter() - start)
+            except Exception as e:
+                rec.fail(repr(e))
+                return
+
+
+LEARNERS = {
+    "chat": learner_chat,
+    "ws": learner_ws,
+    "graph-ws": learner_graph_ws,
+    "word-ws": learner_word_ws,
+}
+
+
+async def run(args) -> dict:
+    rec = Recorder()
+    learner = LEARNERS[args.target]
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+
+    async def one(index: int):
+        # 按 ramp-up 时间均匀启动学习者
+        await asyncio.sleep(args.ramp * index / max(1, args.concurrency))
+        try:
+            await learner(session, args, rec, WORDS[index % len(WORDS)])
+        except Exception as e:
+            rec.fail(repr(e))
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies_ms = [x * 1000 for x in rec.latencies]
+    return {
+        "target": args.target,
+        "concurrency": args.concurrency,
+        "turns_per_learner": args.turns,
+        "elapsed_s": round(elapsed, 3),
+        "completed": len(rec.latencies),
+        "errors": rec.errors,
+        "throughput_rps": round(len(rec.latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {k: round(v, 1) for k, v in percentiles(latencies_ms).items()},
+        "error_samples": rec.error_samples,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="聊天接口压测")
+    parser.add_argument("target", choices=sorted(LEARNERS))
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="服务地址")
+    parser.add_argument("-c", "--concurrency", type=int, default=10, help="并发学习者数量")
+    parser.add_argument("-t", "--turns", type=int, default=len(SCRIPT), help="每个学习者的对话轮数")
+    parser.add_argument("--ramp", type=float, default=0.0, help="全部学习者启动完成所需秒数")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="两轮之间的平均思考时间")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单轮超时秒数")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+    args.url = args.url.rstrip("/")
+    args.ws_url = "ws" + args.url[len("http"):] if args.url.startswith("http") else args.url
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
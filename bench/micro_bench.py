@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+"""
+单轮对话框架开销微基准：模型替换为立即返回的假模型，只测量 LangChain/LangGraph
+与本项目代码本身的开销。
+
+覆盖:
+    prompt_structure     PromptClass.Prompt_Structure
+    agent_construction   create_tool_calling_agent + AgentExecutor 构建
+    agent_invoke         AgentExecutor 单轮执行（假模型、无记忆）
+    memory_set           MemoryClass.set_memory（默认使用 fakeredis，可用 --redis-url 指向本地 Redis）
+    langgraph_compile    test/test_07.py 中的 StateGraph 编译
+    langgraph_invoke     同一图的单轮执行
+    text_splitter        RecursiveCharacterTextSplitter 切分 1MB 文本
+
+用法:
+    python -m bench.micro_bench --save bench/baseline.json          # 生成基线
+    python -m bench.micro_bench --baseline bench/baseline.json      # 与基线比较，超过阈值返回非 0
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+# 假模型不会真正发请求，但 ChatOpenAI 构造时需要密钥
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("BASE_MODEL", "bench-model")
+os.environ.setdefault("MODEL_NAME", "bench-model")
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from bench.fakes import InstantChatModel, use_fake_redis
+from bench.stats import percentiles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 默认回归阈值：中位数比基线慢 25% 判定为退化
+DEFAULT_THRESHOLD = 0.25
+
+
+def _load_test_07():
+    """按路径加载 test/test_07.py 并把其中的模型链替换为假模型"""
+    spec = importlib.util.spec_from_file_location("bench_test_07", os.path.join(ROOT, "test", "test_07.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.llm_chain = module.prompt | InstantChatModel()
+    return module
+
+
+def build_benchmarks(args) -> Dict[str, Callable[[], Any]]:
+    use_fake_redis(args.redis_url)
+
+    from langchain.agents import AgentExecutor, create_tool_calling_agent
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    from src.Memory import MemoryClass
+    from src.Prompt import PromptClass
+    from src.Tools import search, get_info_from_local, word_usage, word_example, word_collocation, word_affix, word_quiz
+
+    model = InstantChatModel()
+    tools = [search, get_info_from_local, word_usage, word_example, word_collocation, word_affix, word_quiz]
+    prompt = PromptClass(memorykey="chat_history").Prompt_Structure(world="boy")
+    executor = AgentExecutor(agent=create_tool_calling_agent(model, tools, prompt), tools=tools)
+
+    memory = MemoryClass(memorykey="chat_history", model="bench-model")
+    history = memory.set_memory(session_id="bench-session").chat_memory
+    history.clear()
+    for i in range(args.history):
+        history.add_message(HumanMessage(content=f"第{i}轮提问"))
+        history.add_message(AIMessage(content=f"第{i}轮回答"))
+
+    graph_module = _load_test_07()
+    graph_app = graph_module.workflow.compile()
+    graph_state = {"messages": [HumanMessage(content="boy")], "word": "boy"}
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=50, length_function=len)
+    paragraph = "The boy reads a book by the river. 这个男孩在河边读书。\n"
+    large_doc = (paragraph * (1024 * 1024 // len(paragraph.encode()) + 1))
+
+    return {
+        "prompt_structure": lambda: PromptClass(memorykey="chat_history").Prompt_Structure(world="boy"),
+        "agent_construction": lambda: AgentExecutor(agent=create_tool_calling_agent(model, tools, prompt), tools=tools),
+        "agent_invoke": lambda: executor.invoke({"input": "boy", "chat_history": []}),
+        "memory_set": lambda: memory.set_memory(session_id="bench-session"),
+        "langgraph_compile": lambda: graph_module.workflow.compile(),
+        "langgraph_invoke": lambda: graph_app.invoke(graph_state),
+        "text_splitter": lambda: splitter.split_text(large_doc),
+    }
+
+
+def measure(func: Callable[[], Any], iterations: int, warmup: int) -> Dict[str, float]:
+    for _ in range(warmup):
+        func()
+    samples: List[float] = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    stats = percentiles(samples, points=(95,))
+    return {
+        "median_ms": round(statistics.median(samples), 4),
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "p95_ms": round(stats["p95"], 4),
+        "iterations": iterations,
+    }
+
+
+def compare(results: Dict[str, dict], baseline: dict, threshold: float) -> List[str]:
+    """返回退化的基准列表；基线中单项可用 threshold 字段覆盖全局阈值"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if not base:
+            continue
+        limit = base.get("threshold", threshold)
+        ratio = result["median_ms"] / base["median_ms"] if base["median_ms"] else 1.0
+        result["vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + limit:
+            regressions.append(f"{name}: {result['median_ms']}ms vs 基线 {base['median_ms']}ms (+{(ratio - 1) * 100:.0f}% > {limit * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="单轮对话框架开销微基准")
+    parser.add_argument("only", nargs="*", help="只运行指定的基准")
+    parser.add_argument("-n", "--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--history", type=int, default=20, help="预置的历史对话轮数")
+    parser.add_argument("--redis-url", help="使用真实 Redis，而不是 fakeredis")
+    parser.add_argument("--save", help="把结果保存为基线 JSON")
+    parser.add_argument("--baseline", help="与已有基线比较")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    benchmarks = build_benchmarks(args)
+    results = {}
+    for name, func in benchmarks.items():
+        if args.only and name not in args.only:
+            continue
+        # 切分大文本较慢，减少迭代次数
+        iterations = max(3, args.iterations // 10) if name == "text_splitter" else args.iterations
+        results[name] = measure(func, iterations, args.warmup)
+        print(f"{name:<20} median {results[name]['median_ms']:>10.3f} ms   p95 {results[name]['p95_ms']:>10.3f} ms")
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+    report = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "created": int(time.time())},
+        "benchmarks": results,
+    }
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if regressions:
+        print("性能退化:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
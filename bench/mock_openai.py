@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+"""
+本地 OpenAI 兼容模拟服务，用于离线压测与基准测试。
+支持 chat completions（含流式与工具调用）、embeddings 和 models 接口，
+可配置首 token 延迟、输出速率和错误注入。
+
+用法:
+    python -m bench.mock_openai --port 9000 --latency-ms 300 --token-rate 50 --error-rate 0.01
+
+被测服务指向模拟服务:
+    OPENAI_API_BASE=http://127.0.0.1:9000/v1 OPENAI_API_KEY=mock \\
+    DEEPSEEK_API_BASE=http://127.0.0.1:9000/v1 DEEPSEEK_API_KEY=mock \\
+    BASE_URL=http://127.0.0.1:9000/v1 MODEL_API_KEY=mock \\
+    EMBEDDING_API_BASE=http://127.0.0.1:9000/v1 EMBEDDING_API_KEY=mock \\
+    python -m src.server
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class MockSettings:
+    latency_ms: float = 200.0  # 首 token 延迟
+    jitter_ms: float = 50.0  # 延迟抖动（均匀分布）
+    token_rate: float = 50.0  # 流式输出速率 tokens/s，0 表示一次性返回
+    completion_tokens: int = 40  # 每次回复的 token 数
+    embedding_latency_ms: float = 30.0
+    embedding_dim: int = 1024
+    tool_call_rate: float = 0.0  # 携带 tools 的请求返回工具调用的概率
+    error_rate: float = 0.0  # 错误注入概率
+    error_status: int = 500  # 注入的错误状态码（如 429、500、503）
+
+
+settings = MockSettings()
+app = FastAPI(title="Mock OpenAI")
+
+# 回复内容按 token 切分，模拟逐 token 输出
+_REPLY_TOKENS = ["同学", "你好", "，", "这个", "单词", "的", "意思", "是", "“", "男孩", "”", "，", "你", "理解", "了", "吗", "？"]
+
+
+def _delay() -> float:
+    return max(0.0, settings.latency_ms + random.uniform(-settings.jitter_ms, settings.jitter_ms)) / 1000
+
+
+def _maybe_error():
+    if settings.error_rate and random.random() < settings.error_rate:
+        return JSONResponse(
+            status_code=settings.error_status,
+            content={"error": {"message": "injected error", "type": "mock_error", "code": settings.error_status}},
+            headers={"retry-after": "1"} if settings.error_status == 429 else None,
+        )
+    return None
+
+
+def _prompt_tokens(messages) -> int:
+    # 粗略估算：按字符数 / 4
+    return max(1, sum(len(str(m.get("content") or "")) for m in messages) // 4)
+
+
+def _tool_call(body):
+    """携带 tools 且最后一条不是工具结果时，按概率返回一次工具调用"""
+    tools = body.get("tools") or []
+    messages = body.get("messages") or []
+    if not tools or not settings.tool_call_rate or (messages and messages[-1].get("role") == "tool"):
+        return None
+    if random.random() >= settings.tool_call_rate:
+        return None
+    function = random.choice(tools)["function"]
+    params = list((function.get("parameters") or {}).get("properties", {}) or ["query"])
+    last_user = next((m.get("content") for m in reversed(messages) if m.get("role") == "user"), "") or ""
+    return {
+        "id": f"call_{uuid.uuid4().hex[:12]}",
+        "type": "function",
+        "function": {"name": function["name"], "arguments": json.dumps({params[0]: last_user}, ensure_ascii=False)},
+    }
+
+
+def _reply_tokens():
+    return [_REPLY_TOKENS[i % len(_REPLY_TOKENS)] for i in range(settings.completion_tokens)]
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "mock-model", "object": "model", "owned_by": "mock"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    error = _maybe_error()
+    if error is not None:
+        return error
+
+    model = body.get("model", "mock-model")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:16]}"
+    created = int(time.time())
+    prompt_tokens = _prompt_tokens(body.get("messages") or [])
+    tool_call = _tool_call(body)
+    tokens = [] if tool_call else _reply_tokens()
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(tokens) or 10,
+        "total_tokens": prompt_tokens + (len(tokens) or 10),
+    }
+    headers = {
+        "x-ratelimit-limit-requests": "1000",
+        "x-ratelimit-limit-tokens": "100000",
+        "x-ratelimit-remaining-requests": str(random.randint(100, 1000)),
+        "x-ratelimit-remaining-tokens": str(random.randint(10000, 100000)),
+        "x-ratelimit-reset-requests": "1s",
+        "x-ratelimit-reset-tokens": "1s",
+    }
+
+    if not body.get("stream"):
+        await asyncio.sleep(_delay() + (len(tokens) / settings.token_rate if settings.token_rate else 0))
+        message = {"role": "assistant", "content": None if tool_call else "".join(tokens)}
+        if tool_call:
+            message["tool_calls"] = [tool_call]
+        return JSONResponse(headers=headers, content={
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_call else "stop"}],
+            "usage": usage,
+        })
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+    async def stream():
+        def chunk(delta, finish_reason=None, **extra):
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **extra,
+            }
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        await asyncio.sleep(_delay())
+        if tool_call:
+            yield chunk({"role": "assistant", "tool_calls": [{"index": 0, **tool_call}]})
+            yield chunk({}, "tool_calls")
+        else:
+            yield chunk({"role": "assistant", "content": ""})
+            for token in tokens:
+                if settings.token_rate:
+                    await asyncio.sleep(1 / settings.token_rate)
+                yield chunk({"content": token})
+            yield chunk({}, "stop")
+        if include_usage:
+            data = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                    "model": model, "choices": [], "usage": usage}
+            yield f"data: {json.dumps(data)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=headers)
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    error = _maybe_error()
+    if error is not None:
+        return error
+    inputs = body.get("input")
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    await asyncio.sleep(settings.embedding_latency_ms / 1000)
+
+    data = []
+    for i, text in enumerate(inputs):
+        # 同一文本得到同一向量，保证检索结果可复现
+        seed = int.from_bytes(hashlib.sha256(str(text).encode()).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(settings.embedding_dim).astype(np.float32)
+        vector /= np.linalg.norm(vector)
+        data.append({"object": "embedding", "index": i, "embedding": vector.tolist()})
+    tokens = sum(len(str(t)) // 4 + 1 for t in inputs)
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "mock-embedding"),
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 兼容模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=settings.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=settings.jitter_ms)
+    parser.add_argument("--token-rate", type=float, default=settings.token_rate)
+    parser.add_argument("--completion-tokens", type=int, default=settings.completion_tokens)
+    parser.add_argument("--embedding-latency-ms", type=float, default=settings.embedding_latency_ms)
+    parser.add_argument("--embedding-dim", type=int, default=settings.embedding_dim)
+    parser.add_argument("--tool-call-rate", type=float, default=settings.tool_call_rate)
+    parser.add_argument("--error-rate", type=float, default=settings.error_rate)
+    parser.add_argument("--error-status", type=int, default=settings.error_status)
+    args = parser.parse_args()
+
+    for field in vars(settings):
+        setattr(settings, field, getattr(args, field))
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
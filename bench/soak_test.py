@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+"""
+内存泄漏浸泡测试：在进程内通过各入口驱动大量模拟会话（模型使用 bench.mock_openai，
+Redis 使用 fakeredis），按间隔记录 tracemalloc 与对象数量，若每会话的内存留存没有收敛则失败。
+
+入口:
+    server     src/server.py 的 /chat（每个会话一个新 user_id）
+    dingtalk   src/DingWebHook.py 的 EchoTextHandler.process（回复发送被替换为空操作）
+    word-ws    test/test_07.py 的 /ws/{word}
+    demo-ws    demo_06.py 的 /ws/chat（chats_by_session_id 按会话累积）
+
+用法:
+    python -m bench.soak_test server --sessions 2000 --turns 3
+    python -m bench.soak_test demo-ws --sessions 500 --max-bytes-per-session 1024 --json soak.json
+"""
+import argparse
+import asyncio
+import gc
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from typing import Callable, List
+
+from bench.fakes import start_mock_openai, use_fake_redis
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TURNS = ["boy", "详细用法", "例句", "选择题", "A"]
+
+
+def _load_module(name: str, relative_path: str):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _turns(count: int) -> List[str]:
+    return [TURNS[i % len(TURNS)] for i in range(count)]
+
+
+def server_session(args) -> Callable[[], None]:
+    from fastapi.testclient import TestClient
+    from src import server
+
+    client = TestClient(server.app)
+    client.__enter__()  # 运行 lifespan，启动预热
+    deadline = time.time() + 120
+    while client.get("/readyz").status_code != 200:
+        if time.time() > deadline:
+            raise RuntimeError("服务预热超时")
+        time.sleep(0.2)
+
+    def run():
+        user_id = f"soak-{uuid.uuid4().hex}"
+        for text in _turns(args.turns):
+            body = client.post("/chat", json={"input": text, "user_id": user_id}).json()
+            if "error" in body:
+                raise RuntimeError(body["error"])
+    return run
+
+
+def check_usage() -> None:
+    """首个会话后确认用量账本记录到了非零 token（流式调用需要模拟服务返回 usage）"""
+    from src.Usage import get_ledger
+
+    ledger = get_ledger()
+    ledger.flush()
+    rows = ledger.report("model")
+    if not any(row["prompt_tokens"] and row["completion_tokens"] for row in rows):
+        raise RuntimeError(f"用量账本没有记录 token: {rows}")
+    print("用量账本: " + ", ".join(f"{row['model']} {row['total_tokens']} tokens" for row in rows))
+
+
+def dingtalk_session(args) -> Callable[[], None]:
+    from dingtalk_stream import CallbackMessage
+    from src.DingWebHook import EchoTextHandler
+
+    class SilentHandler(EchoTextHandler):
+        def reply_text(self, text, incoming_message):
+            return None
+
+    handler = SilentHandler()
+
+    def run():
+        staff_id = f"soak-{uuid.uuid4().hex}"
+        for text in _turns(args.turns):
+            callback = CallbackMessage()
+            callback.data = {
+                "msgtype": "text",
+                "text": {"content": text},
+                "senderStaffId": staff_id,
+                "senderId": staff_id,
+                "conversationId": f"cid-{staff_id}",
+                "msgId": uuid.uuid4().hex,
+            }
+            asyncio.run(handler.process(callback))
+    return run
+
+
+def word_ws_session(args) -> Callable[[], None]:
+    from fastapi.testclient import TestClient
+
+    module = _load_module("soak_test_07", "test/test_07.py")
+    client = TestClient(module.fastapi_app)
+
+    def run():
+        with client.websocket_connect("/ws/boy") as ws:
+            ws.receive_text()  # 欢迎语
+            for text in _turns(args.turns):
+                ws.send_text(text)
+                ws.receive_text()
+    return run
+
+
+def demo_ws_session(args) -> Callable[[], None]:
+    from fastapi.testclient import TestClient
+
+    module = _load_module("soak_demo_06", "demo_06.py")
+    client = TestClient(module.app)
+
+    def receive_until_end(ws):
+        while ws.receive_text() != "[END]":
+            pass
+
+    def run():
+        with client.websocket_connect("/ws/chat") as ws:
+            ws.send_text("boy")
+            receive_until_end(ws)
+            for text in _turns(args.turns):
+                ws.send_text(text)
+                receive_until_end(ws)
+    return run
+
+
+ENTRY_POINTS = {
+    "server": server_session,
+    "dingtalk": dingtalk_session,
+    "word-ws": word_ws_session,
+    "demo-ws": demo_ws_session,
+}
+
+
+def _snapshot(done: int) -> dict:
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    return {"sessions": done, "bytes": current, "objects": len(gc.get_objects())}
+
+
+def _growth_per_session(samples: List[dict], key: str) -> float:
+    """用后半段采样的首尾差计算每会话增长，前半段视为缓存/连接池等的预热"""
+    tail = samples[len(samples) // 2:]
+    if len(tail) < 2 or tail[-1]["sessions"] == tail[0]["sessions"]:
+        return 0.0
+    return (tail[-1][key] - tail[0][key]) / (tail[-1]["sessions"] - tail[0]["sessions"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="内存泄漏浸泡测试")
+    parser.add_argument("entry", choices=sorted(ENTRY_POINTS))
+    parser.add_argument("--sessions", type=int, default=1000, help="模拟会话总数")
+    parser.add_argument("--turns", type=int, default=3, help="每个会话的对话轮数")
+    parser.add_argument("--interval", type=int, default=50, help="每隔多少个会话采样一次")
+    parser.add_argument("--max-bytes-per-session", type=float, default=2048, help="后半段每会话允许的内存增长")
+    parser.add_argument("--max-objects-per-session", type=float, default=20, help="后半段每会话允许的对象增长")
+    parser.add_argument("--top", type=int, default=10, help="失败时列出增长最多的分配位置数量")
+    parser.add_argument("--json", help="把采样结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    start_mock_openai(latency_ms=1, jitter_ms=0, token_rate=0, embedding_latency_ms=0)
+    use_fake_redis()
+    os.environ.setdefault("PERSIST_DIR", tempfile.mkdtemp(prefix="soak_qdrant_"))
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    run_session = ENTRY_POINTS[args.entry](args)
+    run_session()  # 首个会话不计入，完成模块和连接的初始化
+    if args.entry == "server":
+        check_usage()
+
+    tracemalloc.start(25)
+    samples = [_snapshot(0)]
+    mid_snapshot = None
+    start = time.perf_counter()
+    for done in range(1, args.sessions + 1):
+        run_session()
+        if done % args.interval == 0 or done == args.sessions:
+            samples.append(_snapshot(done))
+            print(f"会话 {done:>6}  内存 {samples[-1]['bytes'] / 1024:>10.1f} KiB  对象 {samples[-1]['objects']:>9}")
+        if mid_snapshot is None and done >= args.sessions // 2:
+            gc.collect()
+            mid_snapshot = tracemalloc.take_snapshot()
+
+    bytes_growth = _growth_per_session(samples, "bytes")
+    objects_growth = _growth_per_session(samples, "objects")
+    report = {
+        "entry": args.entry,
+        "sessions": args.sessions,
+        "turns": args.turns,
+        "elapsed_s": round(time.perf_counter() - start, 2),
+        "bytes_per_session": round(bytes_growth, 1),
+        "objects_per_session": round(objects_growth, 2),
+        "samples": samples,
+    }
+    print(f"后半段每会话增长: {bytes_growth:.1f} B, {objects_growth:.2f} 个对象")
+
+    failed = bytes_growth > args.max_bytes_per_session or objects_growth > args.max_objects_per_session
+    if failed:
+        gc.collect()
+        stats = tracemalloc.take_snapshot().compare_to(mid_snapshot, "traceback")[:args.top]
+        report["top_growth"] = [str(stat) for stat in stats]
+        top_types = Counter(type(obj).__name__ for obj in gc.get_objects()).most_common(args.top)
+        report["top_types"] = top_types
+        print("内存未收敛，增长最多的分配位置:")
+        for stat in stats:
+            print(f"  {stat}")
+            for line in stat.traceback.format()[-4:]:
+                print(f"      {line}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
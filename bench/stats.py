@@ -0,0 +1,15 @@
+import math
+from typing import Dict, List
+
+
+def percentiles(samples: List[float], points=(50, 90, 95, 99)) -> Dict[str, float]:
+    """计算延迟分位数（最近秩法），samples 为空时返回 0"""
+    if not samples:
+        return {f"p{p}": 0.0 for p in points} | {"max": 0.0}
+    ordered = sorted(samples)
+    result = {}
+    for p in points:
+        index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+        result[f"p{p}"] = ordered[index]
+    result["max"] = ordered[-1]
+    return result
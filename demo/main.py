@@ -12,6 +12,10 @@ from langchain_core.runnables import RunnablePassthrough
 from dotenv import load_dotenv
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 
+# 从 demo/ 目录直接运行时也能导入项目根目录下的 src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.Models import create_routed_model
+
 # LangGraph 相关导入
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.redis import RedisSaver
@@ -56,14 +60,15 @@ base_url = os.getenv("BASE_URL")
 model_api_key = os.getenv("MODEL_API_KEY")
 model_name = os.getenv("MODEL_NAME")
 
-llm = ChatOpenAI(
+# 配置了 BACKUP_MODEL 时，主模型出错或首 token 过慢由备用模型接管（见 src/Routing.py）
+llm = create_routed_model(ChatOpenAI(
     base_url=base_url,
     api_key=model_api_key,
     model=model_name,
     temperature=0.1,
     max_tokens=512,
     streaming=True
-)
+))
 
 # --- LangGraph 相关定义 ---
 
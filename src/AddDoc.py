@@ -1,14 +1,27 @@
 import tempfile
 import os
+import shutil
 import logging
-from typing import List, Union, Optional
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterable, Callable, Iterable, List, Union, Optional
 import uuid
 from dotenv import load_dotenv as _load_dotenv
 _load_dotenv()
 
+from .Logger import log_event, log_payload
+from .Metrics import INGESTED, track_stage
 
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.document_loaders import WebBaseLoader
+from .Models import create_embeddings
+from .Embedding import EmbeddingStage, content_hash
+from .RateLimit import background
+from .Fetcher import AsyncFetcher
+from .Manifest import SourceManifest, SourceRecord, collection_name as default_collection_name
+from . import Parsers, Snapshot
+from .Pipeline import Checkpoint, IngestProgress, SourceItem, batched
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_qdrant import QdrantVectorStore
 from langchain_core.documents import Document
@@ -17,38 +30,51 @@ from qdrant_client import QdrantClient
 from qdrant_client.http.models import Distance, VectorParams
 from qdrant_client.http import models as rest
 
+# 分块 ID 的命名空间：ID = uuid5(命名空间, 来源 + 内容哈希 + 同内容序号)，同一内容重复入库得到相同 ID
+CHUNK_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "xiaoxiao_documents/chunk")
+
+
+def chunk_id(source: str, digest: str, occurrence: int = 0) -> str:
+    """由来源和内容哈希得到确定的分块 ID；同一来源内容完全相同的分块用 occurrence 区分"""
+    return str(uuid.uuid5(CHUNK_NAMESPACE, f"{source}\n{digest}\n{occurrence}"))
+
+
 class DocumentProcessor:
     """用于处理和向量化不同类型文档的类"""
     
     def __init__(self, 
-                 collection_name: str = os.getenv("COLLECTION_NAME", "xiaoxiao_documents"),
+                 collection_name: Optional[str] = None,
                  embedding_model: str = os.getenv("EMBEDDING_MODEL", "Pro/BAAI/bge-m3"),
                  chunk_size: int = 800, 
                  chunk_overlap: int = 50,
-                 persist_directory: Optional[str] = None) -> None:
+                 persist_directory: Optional[str] = None,
+                 client: Optional[QdrantClient] = None,
+                 version: Optional[str] = None,
+                 store_lock: Optional[threading.RLock] = None) -> None:
         """
         初始化文档处理器
         
         Args:
-            collection_name: Qdrant集合名称
+            collection_name: 对外的集合名称，即检索端读取的 Qdrant 别名，实际数据写在别名指向的版本集合中；默认见 Manifest.collection_name
             embedding_model: OpenAI嵌入模型名称
             chunk_size: 文档分片大小
             chunk_overlap: 文档分片重叠大小
             persist_directory: 永久存储目录，None则使用临时目录
+            client: 已打开的 Qdrant 客户端；嵌入式 Qdrant 同一目录只能打开一次，与检索共用同一进程时传入
+            version: 写入指定的版本集合而不是别名当前指向的集合，rebuild 构建新版本时使用
+            store_lock: 访问 client 时持有的锁；与检索共用 client 时传入检索使用的同一把锁
         """
-        # 配置日志
-        logging.basicConfig(level=logging.INFO, 
-                           format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        # 日志输出由入口处的 setup_logging 统一配置
         self.logger = logging.getLogger("DocumentProcessor")
         
-        # 初始化嵌入模型
-        self.embeddings = OpenAIEmbeddings(
-            model=embedding_model,
-            api_key=os.getenv("EMBEDDING_API_KEY"),
-            base_url=os.getenv("EMBEDDING_API_BASE")
-            )
+        # 初始化嵌入模型；入库时通过 EmbeddingStage 分批并行嵌入并使用磁盘缓存
+        self.embedding_model = embedding_model
+        self.embeddings = create_embeddings(embedding_model)
+        self.embedder = EmbeddingStage.from_env(self.embeddings, embedding_model)
         
         # 配置文本分割器
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
         self.splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size, 
             chunk_overlap=chunk_overlap,
@@ -60,29 +86,78 @@ class DocumentProcessor:
         self.storage_dir = persist_directory or tempfile.mkdtemp(prefix="qdrant_")
         self.logger.info(f"使用存储目录: {self.storage_dir}")
         
-        # 初始化Qdrant客户端和集合
-        self.collection_name = collection_name
-        self.client = QdrantClient(path=self.storage_dir)
-        
-        # 检查并创建集合
-        self._ensure_collection_exists()
+        # 初始化Qdrant客户端和集合；本地模式的客户端不是线程安全的，流水线中并行的批次（以及共用客户端的检索）通过 _store_lock 串行访问
+        self.alias = collection_name or default_collection_name()
+        self.client = client or QdrantClient(path=self.storage_dir)
+        self._store_lock = store_lock or threading.RLock()
+        with self._store_lock:
+            if version is not None and version == self._live_collection():
+                raise RuntimeError(f"版本 {version} 是别名 {self.alias} 当前指向的线上集合，不能在其中构建新版本")
+            self.collection_name = version or self._resolve_collection()
+
+            # 检查并创建集合
+            self._ensure_collection_exists()
+
+            # 初始化向量存储
+            self.vector_store = QdrantVectorStore(
+                client=self.client,
+                collection_name=self.collection_name,
+                embedding=self.embeddings,
+            )
         
-        # 初始化向量存储
-        self.vector_store = QdrantVectorStore(
-            client=self.client,
-            collection_name=self.collection_name,
-            embedding=self.embeddings,
-        )
+        # 来源清单：每个版本集合一份，记录每个来源的校验信息和分块 ID，用于增量刷新
+        self.manifest = SourceManifest(self._manifest_path(self.collection_name))
     
+    def _manifest_path(self, collection: str) -> str:
+        return os.path.join(self.storage_dir, f"manifest_{collection}.sqlite")
+
+    def _new_version(self) -> str:
+        """
+        新版本集合名：别名 + 时间戳（精确到纳秒，按名称排序即按创建顺序），
+        同一秒内连续 rebuild / import_snapshot 也不会与线上版本或其他版本重名
+        """
+        existing = {collection.name for collection in self.client.get_collections().collections}
+        while True:
+            ns = time.time_ns()
+            version = f"{self.alias}_v{time.strftime('%Y%m%d%H%M%S', time.localtime(ns // 10**9))}{ns % 10**9:09d}"
+            if version not in existing and not os.path.exists(self._manifest_path(version)):
+                return version
+
+    def _live_collection(self) -> Optional[str]:
+        """别名当前指向的集合；还没有别名时为早期未版本化的同名集合（若存在）"""
+        target = self._aliases().get(self.alias)
+        if target:
+            return target
+        if any(collection.name == self.alias for collection in self.client.get_collections().collections):
+            return self.alias
+        return None
+
+    def _aliases(self) -> dict:
+        return {alias.alias_name: alias.collection_name for alias in self.client.get_aliases().aliases}
+
+    def _resolve_collection(self) -> str:
+        """
+        别名当前指向的版本集合；还没有任何集合时创建第一个版本并建立别名，
+        早期直接以该名称创建的集合原样使用，第一次 rebuild 时迁移为版本集合
+        """
+        live = self._live_collection()
+        if live:
+            return live
+        version = self._new_version()
+        self.collection_name = version
+        self._ensure_collection_exists()
+        self._swap_alias(version)
+        return version
+
     def _ensure_collection_exists(self) -> None:
-        """确保Qdrant集合存在，不存在则创建"""
+        """确保Qdrant集合存在，不存在则创建（向量维度取 EMBEDDING_DIM，默认 1024）"""
         try:
             collections = self.client.get_collections().collections
             if not any(collection.name == self.collection_name for collection in collections):
                 self.logger.info(f"创建新集合: {self.collection_name}")
                 self.client.create_collection(
                     collection_name=self.collection_name,
-                    vectors_config=VectorParams(size=1024, distance=Distance.COSINE),
+                    vectors_config=VectorParams(size=int(os.getenv("EMBEDDING_DIM", "1024")), distance=Distance.COSINE),
                     optimizers_config=rest.OptimizersConfigDiff(
                         indexing_threshold=10000,  # 优化索引阈值
                     ),
@@ -97,65 +172,630 @@ class DocumentProcessor:
             self.logger.error(f"创建集合时出错: {e}")
             raise
     
-    async def add_urls(self, urls: List[str]) -> dict:
+    async def add_urls(self, urls: List[str], prune: bool = False, checkpoint: Optional[Checkpoint] = None,
+                       on_progress: Optional[Callable[[IngestProgress], None]] = None) -> dict:
         """
         从URL加载文档并添加到向量存储
+        使用 AsyncFetcher 并发抓取（按站点限制并发、复用连接、超时重试），不阻塞事件循环；
+        按来源清单发送条件请求，返回 304 或内容哈希未变化的来源直接跳过，404/410 的来源删除其分块；
+        抓取结果直接流入 ingest 流水线，边抓取边入库
         
         Args:
             urls: 要加载的URL列表
+            prune: 为 True 时，清单中不在 urls 里的网页来源视为已下线并删除
+            checkpoint: 检查点，已记录的 URL 不再抓取，完成的来源写入检查点
+            on_progress: 每完成一个批次调用一次的进度回调
             
         Returns:
-            包含状态信息的字典
+            包含状态信息的字典，sources 汇总来源变化，抓取失败的 URL 列在 failed_urls 中
         """
         try:
-            self.logger.info(f"正在加载URLs: {urls}")
-            loader = WebBaseLoader(urls)
-            docs = loader.load()
-            print("-----------docs------------")
-            print(docs)
-            self.logger.info(f"已加载 {len(docs)} 个文档")
-            return await self._process_documents(docs)
+            todo = [url for url in urls if not (checkpoint and url in checkpoint)]
+            log_event(self.logger, "load_urls", url_count=len(urls), resumed_count=len(urls) - len(todo))
+            failed = []
+            unchanged = []
+            gone = []
+
+            def conditional_headers(url):
+                record = self.manifest.get(url)
+                return record.conditional_headers() if record else None
+
+            async def load():
+                async with AsyncFetcher.from_env() as fetcher:
+                    async for result in fetcher.fetch_all(todo, headers_for=conditional_headers):
+                        if result.status == 304:
+                            unchanged.append(result.url)
+                            continue
+                        if result.status in (404, 410):
+                            gone.append(result.url)
+                            continue
+                        if result.error or not result.text:
+                            failed.append({"url": result.url, "error": result.error or "空页面"})
+                            continue
+                        headers = {k.lower(): v for k, v in result.headers.items()}
+                        record = self.manifest.get(result.url)
+                        if record and record.content_hash == content_hash(result.text):
+                            # 服务器不支持条件请求但内容没变，只更新校验信息
+                            record.etag = headers.get("etag")
+                            record.last_modified = headers.get("last-modified")
+                            self.manifest.put(record)
+                            unchanged.append(result.url)
+                            continue
+                        yield SourceItem(
+                            source=result.url,
+                            docs=[Document(page_content=result.text, metadata={"source": result.url, "title": result.title})],
+                            etag=headers.get("etag"),
+                            last_modified=headers.get("last-modified"),
+                        )
+
+            progress = await self.ingest(load(), checkpoint=checkpoint, on_progress=on_progress)
+            progress.resumed += len(urls) - len(todo)
+            if prune:
+                wanted = set(urls)
+                gone.extend(source for source in self.manifest.sources("http") if source not in wanted)
+            progress.deleted += self._delete_sources(gone)
+            if checkpoint:
+                checkpoint.mark(unchanged + gone)
+            log_event(self.logger, "urls_done", unchanged_count=len(unchanged), gone_count=len(gone),
+                      failed_count=len(failed))
+            result = self._result(progress)
+            result["sources"] = {
+                "changed": progress.sources, "unchanged": len(unchanged), "deleted": len(gone), "failed": len(failed),
+            }
+            if failed:
+                result["failed_urls"] = failed
+            return result
         except Exception as e:
             self.logger.error(f"处理URL时出错: {e}")
             return {"error": str(e)}
+
+    async def refresh_urls(self, prune_urls: Optional[List[str]] = None, **kwargs) -> dict:
+        """
+        增量刷新清单中的所有网页来源，只重新处理内容有变化的来源
+
+        Args:
+            prune_urls: 传入完整的来源列表时，清单中不在其中的来源被删除，列表中新增的来源被入库
+        """
+        if prune_urls is not None:
+            return await self.add_urls(prune_urls, prune=True, **kwargs)
+        return await self.add_urls(self.manifest.sources("http"), **kwargs)
     
-    
-    async def _process_documents(self, docs: List[Document]) -> dict:
+    async def add_files(self, paths: List[str], checkpoint: Optional[Checkpoint] = None,
+                        on_progress: Optional[Callable[[IngestProgress], None]] = None,
+                        prune_prefix: Optional[str] = None, parse_workers: Optional[int] = None) -> dict:
         """
-        处理文档并添加到向量存储
+        解析本地文件（PDF、DOCX、Markdown、TXT、CSV）并添加到向量存储
+        解析在进程池中进行（INGEST_PARSE_WORKERS，默认 CPU 核数），结果直接流入 ingest 流水线；
+        文件哈希与清单一致的文件不解析、不入库
         
         Args:
-            docs: 文档列表
+            paths: 文件路径列表，不支持的扩展名被忽略
+            checkpoint: 检查点，已记录的文件直接跳过
+            on_progress: 每完成一个批次调用一次的进度回调
+            prune_prefix: 清单中以此为前缀但不在 paths 里的文件来源视为已删除
+            parse_workers: 解析进程数，默认 INGEST_PARSE_WORKERS
             
         Returns:
-            包含状态信息的字典
+            包含状态信息的字典，解析失败的文件列在 failed_files 中
         """
-        if not docs:
-            return {"status": "warning", "message": "没有文档需要处理"}
-            
         try:
-            # 分割文档
-            print("-----------docs------------")
-            print(docs)
-            chunks = self.splitter.split_documents(docs)
-            print("-----------chunks------------")
-            print(chunks)
-            self.logger.info(f"文档已分割为 {len(chunks)} 个块")
-            
-            # 生成 UUID 格式的 ID
-            ids = [str(uuid.uuid4()) for _ in range(len(chunks))]
-            self.vector_store.add_documents(documents=chunks, ids=ids)
-            
-            return {
-                "status": "success", 
-                "message": f"成功添加 {len(chunks)} 个文档块",
-                "document_count": len(docs),
-                "chunk_count": len(chunks)
+            sources = [os.path.abspath(path) for path in paths if Parsers.supported(path)]
+            todo = [source for source in sources if not (checkpoint and source in checkpoint)]
+            log_event(self.logger, "load_files", file_count=len(sources), resumed_count=len(sources) - len(todo))
+            failed = []
+            unchanged = []
+            workers = parse_workers or int(os.getenv("INGEST_PARSE_WORKERS", "0")) or os.cpu_count() or 1
+
+            async def load():
+                # spawn 启动的子进程只导入 Parsers（只依赖标准库），不继承父进程的线程和连接
+                with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    pending = set()
+                    queue = iter(todo)
+                    while True:
+                        for source in queue:
+                            record = self.manifest.get(source)
+                            known = record.content_hash if record else None
+                            pending.add(asyncio.wrap_future(pool.submit(Parsers.parse_file, source, known)))
+                            if len(pending) >= workers * 2:
+                                break
+                        if not pending:
+                            break
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for future in done:
+                            source, digest, records, error = future.result()
+                            if error:
+                                failed.append({"file": source, "error": error})
+                            elif records is None:
+                                unchanged.append(source)
+                            elif not records:
+                                failed.append({"file": source, "error": "没有可提取的文本"})
+                            else:
+                                yield SourceItem(
+                                    source=source,
+                                    docs=[Document(page_content=text, metadata={"source": source, **metadata})
+                                          for text, metadata in records],
+                                    digest=digest,
+                                )
+
+            progress = await self.ingest(load(), checkpoint=checkpoint, on_progress=on_progress)
+            progress.resumed += len(sources) - len(todo)
+            gone = []
+            if prune_prefix is not None:
+                wanted = set(sources)
+                gone = [source for source in self.manifest.sources(os.path.abspath(prune_prefix)) if source not in wanted]
+            progress.deleted += self._delete_sources(gone)
+            if checkpoint:
+                checkpoint.mark(unchanged + gone)
+            log_event(self.logger, "files_done", unchanged_count=len(unchanged), gone_count=len(gone),
+                      failed_count=len(failed))
+            result = self._result(progress)
+            result["sources"] = {
+                "changed": progress.sources, "unchanged": len(unchanged), "deleted": len(gone), "failed": len(failed),
             }
+            if failed:
+                result["failed_files"] = failed
+            return result
         except Exception as e:
-            self.logger.error(f"处理文档时出错: {e}")
+            self.logger.error(f"处理文件时出错: {e}")
             return {"error": str(e)}
+
+    async def add_directory(self, directory: str, recursive: bool = True, prune: bool = False, **kwargs) -> dict:
+        """
+        入库目录中所有支持的文件
+        
+        Args:
+            directory: 目录路径
+            recursive: 是否包含子目录
+            prune: 为 True 时，清单中属于该目录但已不存在的文件来源被删除
+        """
+        paths = []
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            paths.extend(os.path.join(root, name) for name in sorted(files) if Parsers.supported(name))
+            if not recursive:
+                break
+        prefix = os.path.join(os.path.abspath(directory), "") if prune else None
+        return await self.add_files(paths, prune_prefix=prefix, **kwargs)
+
+    async def refresh_files(self, **kwargs) -> dict:
+        """重新检查清单中的全部本地文件来源：已删除的文件删除其分块，其余按文件哈希增量入库"""
+        files = [source for source in self.manifest.sources() if not source.startswith(("http://", "https://"))]
+        result = await self.add_files([source for source in files if os.path.exists(source)], **kwargs)
+        if "error" not in result:
+            missing = [source for source in files if not os.path.exists(source)]
+            result["deleted"] = result.get("deleted", 0) + self._delete_sources(missing)
+            result["sources"]["deleted"] += len(missing)
+        return result
+
+    async def rebuild(self, sources: Optional[List[str]] = None, embedding_model: Optional[str] = None,
+                      chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None,
+                      on_progress: Optional[Callable[[IngestProgress], None]] = None) -> dict:
+        """
+        重建索引：在新的版本集合中重新入库全部来源，校验通过后原子切换别名，检索端始终读取完整的索引
+        构建期间线上集合不做任何修改；校验失败时删除新版本，别名保持不变。
+        嵌入缓存按模型和内容哈希复用，只改分块参数时大部分分块不需要重新请求嵌入接口
+        
+        Args:
+            sources: 要入库的来源（URL 或文件路径），默认为当前版本清单中的全部来源
+            embedding_model / chunk_size / chunk_overlap: 新版本使用的参数，默认沿用当前值
+            on_progress: 每完成一个批次调用一次的进度回调
+            
+        Returns:
+            包含新旧版本、入库统计和被清理版本的字典；完成后本实例改为写入新版本
+        """
+        sources = self.manifest.sources() if sources is None else sources
+        with self._store_lock:
+            version = self._new_version()
+        builder = DocumentProcessor(
+            collection_name=self.alias,
+            embedding_model=embedding_model or self.embedding_model,
+            chunk_size=chunk_size or self.chunk_size,
+            chunk_overlap=chunk_overlap if chunk_overlap is not None else self.chunk_overlap,
+            persist_directory=self.storage_dir,
+            client=self.client,
+            version=version,
+            store_lock=self._store_lock,
+        )
+        log_event(self.logger, "rebuild_started", version=version, source_count=len(sources))
+        urls = [source for source in sources if source.startswith(("http://", "https://"))]
+        files = [source for source in sources if not source.startswith(("http://", "https://")) and os.path.exists(source)]
+        try:
+            results = []
+            if urls:
+                results.append(await builder.add_urls(urls, on_progress=on_progress))
+            if files:
+                results.append(await builder.add_files(files, on_progress=on_progress))
+            errors = [result["error"] for result in results if "error" in result]
+            if errors:
+                raise RuntimeError(errors[0])
+            validation = await asyncio.to_thread(builder._validate, self.collection_name)
+        except Exception as e:
+            self.logger.error(f"重建版本 {version} 失败，别名保持不变: {e}")
+            builder._drop()
+            return {"error": str(e), "version": version}
+
+        previous = self.collection_name
+        self._swap_alias(version)
+        self._adopt(builder)
+        removed = self._gc_versions()
+        log_event(self.logger, "rebuild_finished", version=version, previous=previous, removed=removed, **validation)
+        return {
+            "status": "success",
+            "version": version,
+            "previous": previous,
+            "removed": removed,
+            "validation": validation,
+            "documents": sum(result.get("documents", 0) for result in results),
+            "chunks": sum(result.get("chunks", 0) for result in results),
+            "embedded": sum(result.get("embedded", 0) for result in results),
+            "failed": [item for result in results for item in result.get("failed_urls", []) + result.get("failed_files", [])],
+        }
+
+    def _validate(self, live: str) -> dict:
+        """
+        切换前校验新版本：非空、点数不少于线上版本的 REINDEX_MIN_RATIO（默认 0.9）、
+        向量维度与嵌入模型一致，且探测查询能返回结果
+        """
+        with self._store_lock:
+            count = self.client.count(self.collection_name, exact=True).count
+            live_count = self.client.count(live, exact=True).count if live != self.collection_name else 0
+            size = self.client.get_collection(self.collection_name).config.params.vectors.size
+        if count == 0:
+            raise ValueError("新版本集合为空")
+        ratio = float(os.getenv("REINDEX_MIN_RATIO", "0.9"))
+        if live_count and count < live_count * ratio:
+            raise ValueError(f"新版本只有 {count} 个点，少于线上版本 {live_count} 的 {ratio:.0%}")
+        with background():
+            probe = self.embeddings.embed_query("validation probe")
+        if len(probe) != size:
+            raise ValueError(f"嵌入维度 {len(probe)} 与集合维度 {size} 不一致，请设置 EMBEDDING_DIM")
+        with self._store_lock:
+            hits = self.client.query_points(self.collection_name, query=probe, limit=1).points
+        if not hits:
+            raise ValueError("探测查询没有返回结果")
+        return {"points": count, "live_points": live_count, "dimension": size}
+
+    def _swap_alias(self, version: str) -> None:
+        """在一次 update_collection_aliases 调用中删除旧别名并指向新版本，检索端不会看到中间状态"""
+        with self._store_lock:
+            operations = []
+            if self.alias in self._aliases():
+                operations.append(rest.DeleteAliasOperation(delete_alias=rest.DeleteAlias(alias_name=self.alias)))
+            elif any(collection.name == self.alias for collection in self.client.get_collections().collections):
+                # 早期未使用别名的同名集合：别名不能与集合重名，只能先删除（仅在第一次切换时发生）
+                self.logger.warning(f"迁移未版本化的集合 {self.alias}，切换期间检索短暂不可用")
+                self.client.delete_collection(self.alias)
+                if os.path.exists(self._manifest_path(self.alias)):
+                    os.remove(self._manifest_path(self.alias))
+            operations.append(rest.CreateAliasOperation(
+                create_alias=rest.CreateAlias(collection_name=version, alias_name=self.alias)
+            ))
+            self.client.update_collection_aliases(change_aliases_operations=operations)
+        log_event(self.logger, "alias_swapped", alias=self.alias, version=version)
+
+    def _adopt(self, builder: "DocumentProcessor") -> None:
+        """切换后改用新版本的集合、清单和分块/嵌入设置"""
+        self.manifest.close()
+        for name in ("collection_name", "manifest", "embedding_model", "embeddings", "embedder",
+                     "chunk_size", "chunk_overlap", "splitter", "vector_store"):
+            setattr(self, name, getattr(builder, name))
+
+    def _drop(self) -> None:
+        """删除未切换的版本集合及其清单；别名当前指向的线上集合永远不会被删除"""
+        self.manifest.close()
+        with self._store_lock:
+            if self.collection_name == self._live_collection():
+                self.logger.error(f"拒绝删除线上集合 {self.collection_name}")
+                return
+            self.client.delete_collection(self.collection_name)
+        if os.path.exists(self._manifest_path(self.collection_name)):
+            os.remove(self._manifest_path(self.collection_name))
+
+    def _gc_versions(self) -> List[str]:
+        """删除旧版本，除线上版本外保留最近 REINDEX_KEEP_VERSIONS 个（默认 1，用于回滚）"""
+        keep = int(os.getenv("REINDEX_KEEP_VERSIONS", "1"))
+        with self._store_lock:
+            versions = sorted(
+                collection.name for collection in self.client.get_collections().collections
+                if collection.name.startswith(f"{self.alias}_v") and collection.name != self.collection_name
+            )
+            removed = versions[:max(len(versions) - keep, 0)]
+            for name in removed:
+                self.client.delete_collection(name)
+                if os.path.exists(self._manifest_path(name)):
+                    os.remove(self._manifest_path(name))
+        return removed
+
+    def export_snapshot(self, path: str, quantize: bool = False) -> dict:
+        """
+        把当前版本集合导出为快照目录（见 Snapshot 模块），并附带来源清单
+        新副本可以用 VECTOR_SNAPSHOT 直接以内存映射方式打开，或用 import_snapshot 导入 Qdrant
+        
+        Args:
+            path: 快照目录，已存在时整体替换
+            quantize: 为 True 时向量量化为 int8
+        """
+        with self._store_lock:
+            count = self.client.count(self.collection_name, exact=True).count
+            dim = self.client.get_collection(self.collection_name).config.params.vectors.size
+
+            def points():
+                offset = None
+                while True:
+                    batch, offset = self.client.scroll(
+                        collection_name=self.collection_name, limit=256, offset=offset,
+                        with_payload=True, with_vectors=True,
+                    )
+                    for point in batch:
+                        yield point.id, point.vector, point.payload
+                    if offset is None:
+                        break
+
+            with track_stage("snapshot_export"):
+                info = Snapshot.export_snapshot(
+                    points(), count, dim, path, quantize=quantize,
+                    collection=self.alias, version=self.collection_name, embedding_model=self.embedding_model,
+                )
+        self.manifest.backup(os.path.join(path, "manifest.sqlite"))
+        log_event(self.logger, "snapshot_exported", path=path, **info)
+        return info
+
+    def import_snapshot(self, path: str) -> dict:
+        """
+        把快照导入为新的版本集合，校验后切换别名（与 rebuild 相同），快照中的清单随之生效，之后可以继续增量入库
+        不需要重新请求嵌入接口；快照的嵌入模型须与本实例一致
+        """
+        store = Snapshot.SnapshotStore(path, self.embeddings)
+        if store.meta.get("embedding_model") not in (None, self.embedding_model):
+            raise ValueError(f"快照的嵌入模型 {store.meta['embedding_model']} 与当前模型 {self.embedding_model} 不一致")
+        with self._store_lock:
+            version = self._new_version()
+        if os.path.exists(os.path.join(path, "manifest.sqlite")):
+            # 新版本名唯一，清单文件不会覆盖线上版本正在使用的清单
+            shutil.copyfile(os.path.join(path, "manifest.sqlite"), self._manifest_path(version))
+        builder = DocumentProcessor(
+            collection_name=self.alias, embedding_model=self.embedding_model, chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap, persist_directory=self.storage_dir, client=self.client, version=version,
+            store_lock=self._store_lock,
+        )
+        try:
+            with track_stage("snapshot_import"):
+                batch = []
+                for point_id, vector, payload in store.points():
+                    batch.append(rest.PointStruct(id=point_id, vector=vector.tolist(), payload=payload))
+                    if len(batch) >= 256:
+                        with self._store_lock:
+                            self.client.upsert(collection_name=version, points=batch)
+                        batch = []
+                if batch:
+                    with self._store_lock:
+                        self.client.upsert(collection_name=version, points=batch)
+            validation = builder._validate(self.collection_name)
+        except Exception:
+            builder._drop()
+            raise
+        finally:
+            store.close()
+        previous = self.collection_name
+        self._swap_alias(version)
+        self._adopt(builder)
+        removed = self._gc_versions()
+        log_event(self.logger, "snapshot_imported", path=path, version=version, previous=previous, **validation)
+        return {"status": "success", "version": version, "previous": previous, "removed": removed, "validation": validation}
+
+    async def ingest(self, items: Union[Iterable[SourceItem], AsyncIterable[SourceItem]],
+                     checkpoint: Optional[Checkpoint] = None,
+                     on_progress: Optional[Callable[[IngestProgress], None]] = None,
+                     batch_docs: Optional[int] = None, max_inflight: Optional[int] = None) -> IngestProgress:
+        """
+        流式入库：按批拉取来源，分割 -> 嵌入 -> 写入，内存占用只与批次大小和并行批次数有关，与语料规模无关
+        
+        Args:
+            items: 来源的同步或异步迭代器，只在有空闲批次时才拉取下一个
+            checkpoint: 每个批次完成后记录其中的来源，已记录的来源直接跳过
+            on_progress: 每完成一个批次调用一次的进度回调
+            batch_docs: 每个批次的文档数，默认 INGEST_BATCH_DOCS(32)
+            max_inflight: 同时处理的批次数，默认 INGEST_MAX_INFLIGHT(2)
+            
+        Returns:
+            累计的入库进度；某个批次失败时等待其余批次结束后抛出该异常，已完成的批次保留在检查点中
+        """
+        batch_docs = batch_docs or int(os.getenv("INGEST_BATCH_DOCS", "32"))
+        max_inflight = max_inflight or int(os.getenv("INGEST_MAX_INFLIGHT", "2"))
+        progress = IngestProgress()
+        start_tokens = self.embedder.tokens
+        pending = set()
+        errors = []
+
+        async def drain(return_when):
+            nonlocal pending
+            done, pending = await asyncio.wait(pending, return_when=return_when)
+            for task in done:
+                try:
+                    stats, sources = task.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                progress.add(stats)
+                progress.tokens = self.embedder.tokens - start_tokens
+                if checkpoint:
+                    checkpoint.mark(sources)
+                log_event(self.logger, "ingest_progress", **progress.as_dict())
+                if on_progress:
+                    on_progress(progress)
+
+        async for batch in batched(items, batch_docs):
+            if checkpoint:
+                skipped = [item for item in batch if item.source in checkpoint]
+                progress.resumed += len(skipped)
+                batch = [item for item in batch if item.source not in checkpoint]
+                if not batch:
+                    continue
+            if len(pending) >= max_inflight:
+                await drain(asyncio.FIRST_COMPLETED)
+            if errors:
+                break
+            # to_thread 会复制当前上下文，批次内的嵌入请求同样按后台流量限流
+            pending.add(asyncio.create_task(asyncio.to_thread(self._ingest_batch, batch)))
+        if pending:
+            await drain(asyncio.ALL_COMPLETED)
+        if errors:
+            raise errors[0]
+        return progress
+
+    def _ingest_batch(self, items: List[SourceItem]) -> tuple:
+        """
+        处理一个批次并返回 (统计, 来源列表)：分割、跳过已存在的分块、嵌入写入新分块，
+        最后更新来源清单并删除来源旧版本中已不存在的分块
+        """
+        docs = []
+        for item in items:
+            for doc in item.docs:
+                doc.metadata["source"] = item.source
+                docs.append(doc)
+        with track_stage("ingest_split"):
+            chunks = self.splitter.split_documents(docs)
+        log_payload(self.logger, "split_chunks", chunks)
+        
+        ids = self._assign_ids(chunks)
+        with self._store_lock:
+            existing = self._existing_ids(ids)
+            pending = [(i, c) for i, c in zip(ids, chunks) if i not in existing]
+        known_positions = self._existing_positions({c.metadata["source"] for _, c in pending})
+        updated = sum(
+            1 for _, c in pending if c.metadata["chunk_index"] in known_positions.get(c.metadata["source"], ())
+        )
+        stats = {"new": len(pending) - updated, "updated": updated, "skipped": len(chunks) - len(pending)}
+
+        # 已存在的分块不再嵌入；入库的嵌入请求按后台流量限流，为对话保留额度
+        if pending:
+            with background():
+                self._upsert([i for i, _ in pending], [c for _, c in pending])
+        with self._store_lock:
+            stats["deleted"] = self._update_manifest(items, chunks, ids)
+        INGESTED.labels("document").inc(len(docs))
+        for kind in ("new", "updated", "skipped"):
+            INGESTED.labels(f"chunk_{kind}").inc(stats[kind])
+        log_event(self.logger, "chunks_upserted", doc_count=len(docs), chunk_count=len(chunks), **stats)
+        stats.update(sources=len(items), documents=len(docs), chunks=len(chunks), embedded=len(pending))
+        return stats, [item.source for item in items]
+
+    @staticmethod
+    def _result(progress: IngestProgress) -> dict:
+        if not progress.documents:
+            return {"status": "success", "message": "没有变化的来源", **progress.as_dict()}
+        return {
+            "status": "success",
+            "message": f"新增 {progress.new} 个、更新 {progress.updated} 个、跳过 {progress.skipped} 个、删除 {progress.deleted} 个文档块",
+            "document_count": progress.documents,
+            "chunk_count": progress.chunks,
+            **progress.as_dict(),
+        }
     
+    def _upsert(self, ids: List[str], chunks: List[Document]) -> None:
+        """嵌入分块并直接写入 Qdrant，payload 与 QdrantVectorStore 的格式一致（page_content / metadata）"""
+        with track_stage("ingest_embed"):
+            vectors = self.embedder.embed([chunk.page_content for chunk in chunks])
+        with track_stage("ingest_upsert"), self._store_lock:
+            for start in range(0, len(ids), self.embedder.batch_size):
+                self.client.upsert(
+                    collection_name=self.collection_name,
+                    points=[
+                        rest.PointStruct(
+                            id=point_id,
+                            vector=vector.tolist(),
+                            payload={"page_content": chunk.page_content, "metadata": chunk.metadata},
+                        )
+                        for point_id, chunk, vector in zip(
+                            ids[start:start + self.embedder.batch_size],
+                            chunks[start:start + self.embedder.batch_size],
+                            vectors[start:start + self.embedder.batch_size],
+                        )
+                    ],
+                )
+
+    def _assign_ids(self, chunks: List[Document]) -> List[str]:
+        """为分块写入 source / chunk_index / content_hash 元数据并返回确定的 ID"""
+        ids = []
+        occurrences = {}
+        positions = {}
+        for chunk in chunks:
+            source = str(chunk.metadata.get("source") or "unknown")
+            digest = content_hash(chunk.page_content)
+            occurrence = occurrences.get((source, digest), 0)
+            occurrences[(source, digest)] = occurrence + 1
+            chunk.metadata["source"] = source
+            chunk.metadata["content_hash"] = digest
+            chunk.metadata["chunk_index"] = positions.get(source, 0)
+            positions[source] = chunk.metadata["chunk_index"] + 1
+            ids.append(chunk_id(source, digest, occurrence))
+        return ids
+
+    def _existing_ids(self, ids: List[str], batch_size: int = 256) -> set:
+        """集合中已经存在的 ID"""
+        existing = set()
+        for start in range(0, len(ids), batch_size):
+            points = self.client.retrieve(
+                collection_name=self.collection_name,
+                ids=ids[start:start + batch_size],
+                with_payload=False,
+                with_vectors=False,
+            )
+            existing.update(str(point.id) for point in points)
+        return existing
+
+    def _existing_positions(self, sources) -> dict:
+        """
+        各来源已入库分块的 chunk_index，用于区分新增与更新；
+        清单中的 chunk_ids 按 chunk_index 顺序保存，不需要按来源扫描集合
+        """
+        positions = {}
+        for source in sources:
+            record = self.manifest.get(source)
+            positions[source] = set(range(len(record.chunk_ids))) if record else set()
+        return positions
+
+    def _update_manifest(self, items: List[SourceItem], chunks: List[Document], ids: List[str]) -> int:
+        """写入各来源的最新状态，删除旧版本独有的分块，返回删除的分块数"""
+        ids_by_source = {item.source: [] for item in items}
+        for point_id, chunk in zip(ids, chunks):
+            ids_by_source.setdefault(chunk.metadata["source"], []).append(point_id)
+
+        deleted = 0
+        for item in items:
+            source_ids = ids_by_source[item.source]
+            previous = self.manifest.get(item.source)
+            stale = set(previous.chunk_ids) - set(source_ids) if previous else set()
+            deleted += self._delete_points(stale)
+            self.manifest.put(SourceRecord(
+                source=item.source,
+                etag=item.etag,
+                last_modified=item.last_modified,
+                content_hash=item.content_hash(),
+                chunk_ids=source_ids,
+            ))
+        return deleted
+
+    def _delete_sources(self, sources: List[str]) -> int:
+        """删除来源的全部分块及清单记录，返回删除的分块数"""
+        deleted = 0
+        for source in sources:
+            record = self.manifest.get(source)
+            if record is None:
+                continue
+            deleted += self._delete_points(record.chunk_ids)
+            self.manifest.delete(source)
+            log_event(self.logger, "source_deleted", source=source, chunk_count=len(record.chunk_ids))
+        return deleted
+
+    def _delete_points(self, ids) -> int:
+        ids = list(ids)
+        if ids:
+            with self._store_lock:
+                self.client.delete(collection_name=self.collection_name, points_selector=rest.PointIdsList(points=ids))
+            INGESTED.labels("chunk_deleted").inc(len(ids))
+        return len(ids)
+
     def __del__(self):
         """析构函数，清理临时资源"""
         if hasattr(self, 'is_temp_dir') and self.is_temp_dir and hasattr(self, 'storage_dir'):
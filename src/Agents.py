@@ -1,35 +1,48 @@
 # 导入必要的库和模块
 from langchain.agents import AgentExecutor,create_tool_calling_agent
-from langchain_openai import ChatOpenAI  # OpenAI聊天模型接口
-from langchain_deepseek import ChatDeepSeek  # DeepSeek聊天模型接口
+from .Models import create_chat_model, create_backup_model, create_routed_model  # 主模型(OpenAI)与备用模型(DeepSeek)
 from langchain_core.runnables import ConfigurableField
 from .Prompt import PromptClass  # 导入提示词管理类
 from .Memory import MemoryClass  # 导入记忆管理类
 from langchain_core.caches import InMemoryCache  # 内存缓存，用于加速响应
 from .Storage import get_user  # 获取用户信息的函数
+from .Logger import trace_callbacks  # 采样记录代理执行步骤
+from .Metrics import MetricsCallbackHandler, classify_intent, observe_turn, track_stage  # 性能指标
+from .Usage import UsageCallbackHandler  # token 用量账本
 
 # 导入各种工具函数
 from .Tools import search,get_info_from_local,word_usage,word_example,word_collocation,word_affix,word_quiz
 from dotenv import load_dotenv as _load_dotenv
 _load_dotenv()
 import os
+import threading
+import time
+from langchain_core.globals import set_llm_cache
 
 
-os.environ["LANGSMITH_TRACING"] = os.getenv("LANGSMITH_TRACING")
-os.environ["LANGSMITH_ENDPOINT"] = os.getenv("LANGSMITH_ENDPOINT")
-os.environ["LANGSMITH_API_KEY"] = os.getenv("LANGSMITH_API_KEY")
-os.environ["LANGSMITH_PROJECT"] = os.getenv("LANGSMITH_PROJECT")
-# 设置环境变量，包括API密钥和API基础URL
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-os.environ["OPENAI_API_BASE"] = os.getenv("OPENAI_API_BASE")
-os.environ["DEEPSEEK_API_KEY"] = os.getenv("DEEPSEEK_API_KEY")
-os.environ["DEEPSEEK_API_BASE"] = os.getenv("DEEPSEEK_API_BASE")
-
+_initialized = False
 
+def init_agents():
+    """
+    显式初始化代理运行环境（原先在导入时执行），重复调用无副作用
+    - 同步 LangSmith 与模型相关的环境变量，缺失的变量直接跳过
+    - 安装全局 LLM 缓存
+    """
+    global _initialized
+    if _initialized:
+        return
+    for var in [
+        "LANGSMITH_TRACING", "LANGSMITH_ENDPOINT", "LANGSMITH_API_KEY", "LANGSMITH_PROJECT",
+        # API密钥和API基础URL
+        "OPENAI_API_KEY", "OPENAI_API_BASE", "DEEPSEEK_API_KEY", "DEEPSEEK_API_BASE",
+    ]:
+        value = os.getenv(var)
+        if value is not None:
+            os.environ[var] = value
 
-# 添加缓存以提高性能，避免重复请求相同内容时消耗额外的API调用
-from langchain_core.globals import set_llm_cache
-set_llm_cache(InMemoryCache())
+    # 添加缓存以提高性能，避免重复请求相同内容时消耗额外的API调用
+    set_llm_cache(InMemoryCache())
+    _initialized = True
 
 
 class AgentClass:
@@ -38,14 +51,15 @@ class AgentClass:
     整合了语言模型、记忆系统和各种工具功能
     """
     def __init__(self, world=None):
+        init_agents()
         # 设置备用模型，当主模型不可用时使用
-        fallback_llm = ChatDeepSeek(model=os.getenv("BACKUP_MODEL"))
+        fallback_llm = create_backup_model(os.getenv("BACKUP_MODEL"))
         
         # 获取主模型名称
         self.modelname = os.getenv("BASE_MODEL")
         
-        # 创建主聊天模型，并配置备用模型
-        self.chatmodel = ChatOpenAI(model=self.modelname).with_fallbacks([fallback_llm])
+        # 创建主聊天模型，主模型出错或首 token 过慢时由备用模型接管
+        self.chatmodel = create_routed_model(create_chat_model(self.modelname), fallback_llm)
         
         # 设置可用的工具列表，这些工具可以被AI代理调用
         self.tools = [search,get_info_from_local,word_usage,word_example,word_collocation,word_affix,word_quiz]
@@ -53,56 +67,62 @@ class AgentClass:
         # 从环境变量获取记忆键名
         self.memorykey = os.getenv("MEMORY_KEY")
         
-        # 创建提示词结构
-        self.prompt = PromptClass(memorykey=self.memorykey).Prompt_Structure(world=world)
-        
         # 初始化记忆系统
         self.memory = MemoryClass(memorykey=self.memorykey,model=self.modelname)
         
-        # 创建工具调用型代理
-        self.agent = create_tool_calling_agent(
-            self.chatmodel,  # 使用的聊天模型
-            self.tools,      # 可用工具列表
-            self.prompt,     # 提示词结构
-        )
-        
-        # 创建代理执行器，整合代理、工具和记忆系统
-        self.agent_chain = AgentExecutor(
-            agent=self.agent,
-            tools=self.tools,
-            memory=self.memory.set_memory(),
-            verbose=True  # 启用详细输出，便于调试
-        )
+        # 按单词缓存的工具调用型代理；代理本身无状态，可在并发的对话间共用
+        self._agents = {}
+        self._agents_lock = threading.Lock()
+        self.prompt, self.agent = self._agent_for(world)
+
+    def _agent_for(self, world=None):
+        """返回 (prompt, agent)，每个单词只构建一次"""
+        with self._agents_lock:
+            if world not in self._agents:
+                if len(self._agents) >= 1024:
+                    self._agents.clear()
+                prompt = PromptClass(memorykey=self.memorykey).Prompt_Structure(world=world)
+                self._agents[world] = (prompt, create_tool_calling_agent(self.chatmodel, self.tools, prompt))
+            return self._agents[world]
 
-    def run_agent(self, input, world=None):
+    def run_agent(self, input, world=None, user_id=None):
         """
         运行AI代理处理用户输入
         参数:
             input: 用户输入的文本
             world: 当前单词（可选，切换时用）
+            user_id: 计入用量账本的用户（可选，默认取存储中的 userid）
         返回:
             包含AI回复的字典或流式生成器
         """
-        # 每次都用最新 world 构建 prompt 和 agent_chain
-        self.prompt = PromptClass(memorykey=self.memorykey).Prompt_Structure(world=world)
-        self.agent = create_tool_calling_agent(
-            self.chatmodel,
-            self.tools,
-            self.prompt,
-        )
-        self.agent_chain = AgentExecutor(
-            agent=self.agent,
-            tools=self.tools,
-            memory=self.memory.set_memory(),
-            verbose=True
-        )
-        config = {
-            "agent_memory": self.memory.set_memory(session_id=get_user("userid"))
-        }
-        if hasattr(self.agent_chain, "stream"):
-            for chunk in self.agent_chain.with_config(config).stream({"input": input}):
-                yield chunk.get("output", str(chunk))
-        else:
-            res = self.agent_chain.with_config(config).invoke({"input": input})
-            return res
+        intent = classify_intent(input)
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            # 服务在线程池中并发执行多轮对话，代理执行器和记忆都是本轮的局部变量，不写回共享的实例属性
+            with track_stage("prompt_build", self.modelname):
+                _, agent = self._agent_for(world)
+            agent_chain = AgentExecutor(
+                agent=agent,
+                tools=self.tools,
+                memory=self.memory.set_memory(),
+                verbose=False
+            )
+            session_id = get_user("userid")
+            usage = UsageCallbackHandler(user_id=user_id or session_id, session_id=session_id, intent=intent)
+            config = {
+                "agent_memory": self.memory.set_memory(session_id=session_id),
+                "callbacks": [MetricsCallbackHandler(), usage, *trace_callbacks()],
+            }
+            if hasattr(agent_chain, "stream"):
+                for chunk in agent_chain.with_config(config).stream({"input": input}):
+                    yield chunk.get("output", str(chunk))
+            else:
+                res = agent_chain.with_config(config).invoke({"input": input})
+                return res
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            observe_turn(self.modelname, intent, outcome, time.perf_counter() - start)
 
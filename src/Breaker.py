@@ -0,0 +1,171 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+from .Metrics import BREAKER_ERROR_RATE, BREAKER_LATENCY, BREAKER_STATE, BREAKER_TRANSITIONS
+
+logger = logging.getLogger("Breaker")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(RuntimeError):
+    """端点熔断中，调用被直接拒绝"""
+
+
+class CircuitBreaker:
+    """
+    单个上游端点的熔断器
+    - closed: 正常放行，按滚动窗口统计失败率（出错或耗时超过 slow_seconds 都算失败）
+    - 窗口内调用数不少于 min_calls 且失败率达到 failure_rate 时转为 open
+    - open: 拒绝调用，open_seconds 后转为 half_open
+    - half_open: 最多放行 probes 个探测请求，全部成功则恢复 closed，任一失败重新 open
+    """
+
+    def __init__(self, name: str, window: float = 30.0, min_calls: int = 5, failure_rate: float = 0.5,
+                 slow_seconds: float = 10.0, open_seconds: float = 30.0, probes: int = 1):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.state = CLOSED
+        self._calls: deque = deque()  # (时间, 是否失败, 耗时)
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+        BREAKER_STATE.labels(name).set(0)
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        logger.warning(f"端点 {self.name} 熔断状态 {self.state} -> {state}")
+        self.state = state
+        BREAKER_STATE.labels(self.name).set(_STATE_VALUES[state])
+        BREAKER_TRANSITIONS.labels(self.name, state).inc()
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        elif state == HALF_OPEN:
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        elif state == CLOSED:
+            self._calls.clear()
+
+    def _prune(self, now: float) -> None:
+        while self._calls and now - self._calls[0][0] > self.window:
+            self._calls.popleft()
+
+    def allow(self) -> bool:
+        """是否放行本次调用；half_open 时占用一个探测名额，调用结束后必须 record"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight >= self.probes:
+                    return False
+                self._probes_in_flight += 1
+            return True
+
+    def record(self, ok: bool, seconds: float) -> None:
+        """记录一次调用结果"""
+        failed = not ok or seconds > self.slow_seconds
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+                if failed:
+                    self._transition(OPEN)
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.probes:
+                        self._transition(CLOSED)
+                return
+            self._calls.append((now, failed, seconds))
+            self._prune(now)
+            error_rate = self.error_rate()
+            BREAKER_ERROR_RATE.labels(self.name).set(error_rate)
+            BREAKER_LATENCY.labels(self.name).set(sum(c[2] for c in self._calls) / len(self._calls))
+            if self.state == CLOSED and len(self._calls) >= self.min_calls and error_rate >= self.failure_rate:
+                self._transition(OPEN)
+
+    def error_rate(self) -> float:
+        if not self._calls:
+            return 0.0
+        return sum(1 for c in self._calls if c[1]) / len(self._calls)
+
+    def health(self) -> float:
+        """健康分 0~1：open 为 0，其余为 1 - 滚动失败率"""
+        with self._lock:
+            self._prune(time.monotonic())
+            if self.state == OPEN:
+                return 0.0
+            return 1.0 - self.error_rate()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """
+    进程内按端点名共享的熔断器，参数读取环境变量：
+    BREAKER_WINDOW(30) BREAKER_MIN_CALLS(5) BREAKER_FAILURE_RATE(0.5)
+    BREAKER_SLOW_SECONDS(10) BREAKER_OPEN_SECONDS(30) BREAKER_PROBES(1)
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(
+                name,
+                window=float(os.getenv("BREAKER_WINDOW", "30")),
+                min_calls=int(os.getenv("BREAKER_MIN_CALLS", "5")),
+                failure_rate=float(os.getenv("BREAKER_FAILURE_RATE", "0.5")),
+                slow_seconds=float(os.getenv("BREAKER_SLOW_SECONDS", "10")),
+                open_seconds=float(os.getenv("BREAKER_OPEN_SECONDS", "30")),
+                probes=int(os.getenv("BREAKER_PROBES", "1")),
+            )
+        return breaker
+
+
+def breaker_states() -> Dict[str, dict]:
+    """所有端点的熔断状态与健康分，供就绪检查展示"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {b.name: {"state": b.state, "health": round(b.health(), 3)} for b in breakers}
+
+
+class BreakerEmbeddings(Embeddings):
+    """为嵌入模型加上熔断：端点熔断时直接抛出 CircuitOpenError，不再等待超时"""
+
+    def __init__(self, inner: Embeddings, name: str):
+        self.inner = inner
+        self.breaker = get_breaker(name)
+
+    def _call(self, func, *args):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"嵌入端点 {self.breaker.name} 熔断中")
+        start = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception:
+            self.breaker.record(False, time.perf_counter() - start)
+            raise
+        self.breaker.record(True, time.perf_counter() - start)
+        return result
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._call(self.inner.embed_documents, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._call(self.inner.embed_query, text)
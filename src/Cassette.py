@@ -0,0 +1,252 @@
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+class CassetteMiss(KeyError):
+    """回放模式下找不到对应的录制记录"""
+
+
+class Cassette:
+    """
+    录制文件：每行一条 JSON 记录（路径以 .gz 结尾时使用 gzip 压缩）
+    同一请求可以有多条记录，回放时按录制顺序依次返回，到末尾后循环
+    """
+
+    def __init__(self, path: str, mode: str):
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[dict]] = {}
+        self._cursor: Dict[str, int] = {}
+        if mode == "replay":
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _open(self, mode: str):
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, mode + "t", encoding="utf-8")
+        return open(self.path, mode, encoding="utf-8")
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"录制文件不存在: {self.path}")
+        with self._open("r") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["key"], []).append(entry)
+
+    def record(self, entry: dict) -> None:
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock, self._open("a") as f:
+            f.write(line + "\n")
+
+    def play(self, key: str) -> dict:
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMiss(f"录制文件 {self.path} 中没有请求 {key[:12]}")
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            return entries[index % len(entries)]
+
+
+def request_key(kind: str, model: str, payload: Any) -> str:
+    """根据请求内容生成稳定的键"""
+    raw = json.dumps({"kind": kind, "model": model, "payload": payload}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _message_key(message) -> dict:
+    """参与请求键计算的消息字段，排除每次运行都会变化的 id、response_metadata 等"""
+    return {
+        "type": message.type,
+        "content": message.content,
+        "tool_calls": getattr(message, "tool_calls", None),
+        "tool_call_id": getattr(message, "tool_call_id", None),
+    }
+
+
+def _to_chunk(message) -> AIMessageChunk:
+    """把非流式录制的 AIMessage 转换为 AIMessageChunk"""
+    if isinstance(message, AIMessageChunk):
+        return message
+    return AIMessageChunk(
+        content=message.content,
+        additional_kwargs=message.additional_kwargs,
+        response_metadata=message.response_metadata,
+        usage_metadata=message.usage_metadata,
+        tool_call_chunks=[
+            {"name": call["name"], "args": json.dumps(call["args"], ensure_ascii=False), "id": call["id"], "index": i}
+            for i, call in enumerate(message.tool_calls)
+        ],
+    )
+
+
+def _sleep_until(start: float, offset: float) -> None:
+    delay = offset - (time.perf_counter() - start)
+    if delay > 0:
+        time.sleep(delay)
+
+
+class CassetteChatModel(BaseChatModel):
+    """
+    包装聊天模型：record 模式调用真实模型并录制请求/响应（含流式 chunk 时间），
+    replay 模式只读录制文件，realtime=True 时按原始时间间隔回放
+    """
+
+    inner: BaseChatModel
+    cassette: Any
+    realtime: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cassette-{self.inner._llm_type}"
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.inner, "model_name", None) or getattr(self.inner, "model", "") or ""
+
+    def bind_tools(self, tools, **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def get_num_tokens(self, text: str) -> int:
+        return self.inner.get_num_tokens(text)
+
+    def get_num_tokens_from_messages(self, messages, tools=None) -> int:
+        return self.inner.get_num_tokens_from_messages(messages)
+
+    def _key(self, messages, stop, kwargs) -> str:
+        return request_key("chat", self.model_name, {
+            "messages": [_message_key(m) for m in messages],
+            "stop": stop,
+            "kwargs": kwargs,
+        })
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        key = self._key(messages, stop, kwargs)
+        if self.cassette.mode == "replay":
+            entry = self.cassette.play(key)
+            if self.realtime:
+                time.sleep(entry["elapsed"])
+            message = messages_from_dict([entry["message"]])[0]
+            return ChatResult(generations=[ChatGeneration(message=message)], llm_output=entry.get("llm_output"))
+
+        start = time.perf_counter()
+        result = self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self.cassette.record({
+            "key": key,
+            "kind": "chat",
+            "elapsed": round(time.perf_counter() - start, 4),
+            "message": message_to_dict(result.generations[0].message),
+            "llm_output": result.llm_output,
+        })
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        key = self._key(messages, stop, kwargs)
+        start = time.perf_counter()
+        if self.cassette.mode == "replay":
+            entry = self.cassette.play(key)
+            if "chunks" not in entry:
+                # 非流式录制的记录整体作为一个 chunk 返回
+                entry = {**entry, "chunks": [[entry["elapsed"], entry["message"]]]}
+            for offset, data in entry["chunks"]:
+                if self.realtime:
+                    _sleep_until(start, offset)
+                chunk = ChatGenerationChunk(message=_to_chunk(messages_from_dict([data])[0]))
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            return
+
+        chunks = []
+        final: Optional[ChatGenerationChunk] = None
+        for chunk in self.inner._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            chunks.append([round(time.perf_counter() - start, 4), message_to_dict(chunk.message)])
+            final = chunk if final is None else final + chunk
+            yield chunk
+        self.cassette.record({
+            "key": key,
+            "kind": "chat",
+            "elapsed": round(time.perf_counter() - start, 4),
+            "message": message_to_dict(final.message) if final else None,
+            "chunks": chunks,
+        })
+
+
+def _encode_vector(vector: List[float]) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode_vector(data: str) -> List[float]:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).tolist()
+
+
+class CassetteEmbeddings(Embeddings):
+    """包装嵌入模型，按 (模型, 文本) 录制和回放向量，向量以 float32 + base64 存储"""
+
+    def __init__(self, inner: Embeddings, cassette: Cassette, model: str = "", realtime: bool = False):
+        self.inner = inner
+        self.cassette = cassette
+        self.model = model or getattr(inner, "model", "")
+        self.realtime = realtime
+
+    def _key(self, text: str) -> str:
+        return request_key("embedding", self.model, text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        if self.cassette.mode == "replay":
+            entries = [self.cassette.play(key) for key in keys]
+            if self.realtime and entries:
+                time.sleep(max(entry["elapsed"] for entry in entries))
+            return [_decode_vector(entry["vector"]) for entry in entries]
+
+        start = time.perf_counter()
+        vectors = self.inner.embed_documents(texts)
+        elapsed = round(time.perf_counter() - start, 4)
+        for key, vector in zip(keys, vectors):
+            self.cassette.record({"key": key, "kind": "embedding", "elapsed": elapsed, "vector": _encode_vector(vector)})
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+_cassette: Optional[Cassette] = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """
+    读取 LLM_CASSETTE_MODE（off/record/replay，默认 off）和 LLM_CASSETTE_PATH，
+    返回进程内共享的录制文件，关闭时返回 None
+    """
+    global _cassette
+    mode = os.getenv("LLM_CASSETTE_MODE", "off")
+    if mode not in ("record", "replay"):
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette(os.getenv("LLM_CASSETTE_PATH", "cassettes/llm.jsonl"), mode)
+    return _cassette
+
+
+def cassette_realtime() -> bool:
+    """LLM_CASSETTE_REALTIME=1 时按录制时的耗时回放"""
+    return os.getenv("LLM_CASSETTE_REALTIME") == "1"
@@ -2,23 +2,15 @@
 from dingtalk_stream import AckMessage, ChatbotMessage, DingTalkStreamClient, Credential,ChatbotHandler,CallbackMessage
 from src.Agents import AgentClass
 from src.Storage import add_user
+from src.Logger import setup_logging, log_event, log_payload
+from src import Profiler
 from dotenv import load_dotenv as _load_dotenv
 _load_dotenv()
 import os
-import logging
 
 
-def setup_logging():
-    """设置日志配置"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler("dingtalk_connection.log", encoding="utf-8")  # 添加 encoding
-        ]
-    )
-    return logging.getLogger("DingTalk")
+# 日志由后台线程写入文件，消息处理线程只负责入队
+logger = setup_logging("DingTalk", "dingtalk_connection.log")
 
 
 # 用户存储字典，用于保存用户相关信息
@@ -41,11 +33,9 @@ class EchoTextHandler(ChatbotHandler):
         Returns:
             元组: 状态码和状态消息
         """
-        logger = setup_logging()
         # 从回调数据中提取聊天消息
         incoming_message = ChatbotMessage.from_dict(callback.data)
-        logger.info(incoming_message)
-        logger.info(callback.data)
+        log_payload(logger, "incoming_message", callback.data)
         
         # 提取消息文本内容并去除前后空白
         text = incoming_message.text.content.strip()
@@ -55,14 +45,16 @@ class EchoTextHandler(ChatbotHandler):
         
         # 将用户添加到存储中
         add_user("userid", userid)
-        logger.info(f"用户{userid}已添加到存储中")
+        log_event(logger, "user_added", user_id=userid, source="dingtalk")
         
-        # 使用AI代理处理用户消息
-        msg = AgentClass().run_agent(text)
-        logger.info(msg)
+        # 使用AI代理处理用户消息，run_agent 为流式生成器，最后一个片段即最终回复
+        output = ""
+        for chunk in AgentClass().run_agent(text):
+            output = chunk
+        log_payload(logger, "agent_response", output)
         
         # 回复处理后的消息
-        self.reply_text(msg['output'], incoming_message)
+        self.reply_text(output, incoming_message)
         #固定回声回复
         #self.reply_text("你说的是: " + text, incoming_message)
         
@@ -71,11 +63,19 @@ class EchoTextHandler(ChatbotHandler):
 
 
 def main():
-    logger = setup_logging()
     logger.info("启动钉钉流客户端")
     # 从环境变量中获取钉钉的app id和app secret
     logger.info(f"应用ID: {os.getenv('DINGDING_ID')}")
     logger.info(f"使用凭证连接钉钉")
+
+    # 钉钉 worker 没有 HTTP 服务，按需单独暴露 Prometheus 指标端口
+    if os.getenv("METRICS_PORT"):
+        from prometheus_client import start_http_server
+        start_http_server(int(os.getenv("METRICS_PORT")))
+        logger.info(f"指标端口: {os.getenv('METRICS_PORT')}")
+
+    # kill -USR2 <pid> 触发一次采样，结果写入 logs/
+    Profiler.install_signal_handler()
     
     try:
         credential = Credential(os.getenv("DINGDING_ID"), os.getenv("DINGDING_SECRET"))
@@ -0,0 +1,236 @@
+import contextvars
+import hashlib
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from .Metrics import EMBEDDING_CACHE, LLM_TOKENS, track_stage
+from .RateLimit import estimate_tokens
+
+logger = logging.getLogger("Embedding")
+
+
+def content_hash(text: str) -> str:
+    """文本内容的 sha256，同时用作分块元数据和嵌入缓存的键"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    内容哈希 -> 向量的磁盘缓存
+    向量按行存放在 float32 的内存映射文件中（vectors.f32），SQLite 只保存 哈希 -> 行号 的索引，
+    读取时由操作系统按页加载，不需要把整个缓存读入内存；不同嵌入模型使用不同子目录
+
+    同一目录可以被多个实例（CLI 与服务、多个进程）同时打开：新行号在 SQLite 写事务（BEGIN IMMEDIATE）
+    中按 MAX(row)+1 分配，写文件和扩容也在该事务内完成，row 上的唯一索引保证两个哈希不会指向同一行
+    """
+
+    def __init__(self, directory: str, model: str):
+        self.directory = os.path.join(directory, re.sub(r"[^\w.-]+", "_", model))
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # 自动提交模式，写事务由 put_many 显式开启
+        self._db = sqlite3.connect(
+            os.path.join(self.directory, "index.sqlite"), check_same_thread=False, isolation_level=None, timeout=60
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS vectors (hash TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._ensure_unique_rows()
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        self.dim: Optional[int] = int(row[0]) if row else None
+        self._path = os.path.join(self.directory, "vectors.f32")
+        self._mm: Optional[np.memmap] = None
+
+    def _ensure_unique_rows(self) -> None:
+        """创建 row 上的唯一索引；旧版本多实例写入可能让多个哈希共用一行，这些记录无法判断归属，直接删除"""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            removed = self._db.execute(
+                "DELETE FROM vectors WHERE row IN (SELECT row FROM vectors GROUP BY row HAVING COUNT(*) > 1)"
+            ).rowcount
+            if removed > 0:
+                logger.warning(f"嵌入缓存 {self.directory} 中有 {removed} 条记录共用行号，已删除，对应文本会重新嵌入")
+            self._db.execute("CREATE UNIQUE INDEX IF NOT EXISTS vectors_row ON vectors (row)")
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+    def _map(self, rows: int) -> np.memmap:
+        """
+        映射至少 rows 行；文件已被其他实例扩容时按当前大小重新映射，仍不足时按倍数扩容
+        （扩容只在 put_many 的写事务中发生，读取的行都已在提交前写入文件）
+        """
+        if self._mm is not None and self._mm.shape[0] >= rows:
+            return self._mm
+        current = os.path.getsize(self._path) // (4 * self.dim) if os.path.exists(self._path) else 0
+        capacity = max(current, 1024)
+        while capacity < rows:
+            capacity *= 2
+        if capacity > current:
+            with open(self._path, "ab") as f:
+                f.truncate(capacity * self.dim * 4)
+        if self._mm is not None:
+            self._mm.flush()
+        self._mm = np.memmap(self._path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        return self._mm
+
+    def get_many(self, hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+        if not hashes:
+            return {}
+        found = {}
+        with self._lock:
+            if self.dim is None:
+                # 其他实例可能已经写入了第一批向量
+                row = self._db.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+                if row is None:
+                    return {}
+                self.dim = int(row[0])
+            for start in range(0, len(hashes), 500):
+                batch = list(hashes[start:start + 500])
+                rows = self._db.execute(
+                    f"SELECT hash, row FROM vectors WHERE hash IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                if rows:
+                    mm = self._map(max(row for _, row in rows) + 1)
+                    for digest, row in rows:
+                        found[digest] = np.array(mm[row])
+        return found
+
+    def put_many(self, vectors: Dict[str, np.ndarray]) -> None:
+        if not vectors:
+            return
+        with self._lock:
+            # 写事务同时是跨实例的锁：行号分配、扩容和写文件期间其他实例只能读
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if self.dim is None:
+                    self._db.execute(
+                        "INSERT OR IGNORE INTO meta VALUES ('dim', ?)", (str(len(next(iter(vectors.values())))),)
+                    )
+                    self.dim = int(self._db.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()[0])
+                known = {
+                    digest for digest, in self._db.execute(
+                        f"SELECT hash FROM vectors WHERE hash IN ({','.join('?' * len(vectors))})", list(vectors)
+                    )
+                }
+                new = [(digest, vector) for digest, vector in vectors.items() if digest not in known]
+                if not new:
+                    self._db.execute("COMMIT")
+                    return
+                first = self._db.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM vectors").fetchone()[0]
+                mm = self._map(first + len(new))
+                rows = []
+                for offset, (digest, vector) in enumerate(new):
+                    mm[first + offset] = vector
+                    rows.append((digest, first + offset))
+                # 先落盘向量再提交索引，中途崩溃最多留下未被引用的行
+                mm.flush()
+                self._db.executemany("INSERT INTO vectors VALUES (?, ?)", rows)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def close(self) -> None:
+        with self._lock:
+            if self._mm is not None:
+                self._mm.flush()
+                self._mm = None
+            self._db.close()
+
+
+class EmbeddingStage:
+    """
+    入库用的嵌入阶段
+    - 先查磁盘缓存，同一批中重复的文本只嵌入一次
+    - 未命中的文本按 batch_size 分批，最多 max_parallel 个批次并行请求
+    - 单个批次失败时按指数退避重试 retries 次
+    - tokens 累计实际发出的嵌入请求的预估 token 数（嵌入接口不返回用量）
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: Optional[EmbeddingCache] = None, batch_size: int = 64,
+                 max_parallel: int = 4, retries: int = 3, backoff: float = 1.0, model: str = ""):
+        self.embeddings = embeddings
+        self.model = model
+        self.tokens = 0
+        self._tokens_lock = threading.Lock()
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_parallel = max_parallel
+        self.retries = retries
+        self.backoff = backoff
+
+    @classmethod
+    def from_env(cls, embeddings: Embeddings, model: str) -> "EmbeddingStage":
+        """
+        读取 EMBED_BATCH_SIZE(64) EMBED_PARALLEL(4) EMBED_RETRIES(3)，
+        EMBEDDING_CACHE_DIR（默认 ./embedding_cache，设为空字符串关闭缓存）
+        """
+        cache_dir = os.getenv("EMBEDDING_CACHE_DIR", "./embedding_cache")
+        return cls(
+            embeddings,
+            cache=EmbeddingCache(cache_dir, model) if cache_dir else None,
+            batch_size=int(os.getenv("EMBED_BATCH_SIZE", "64")),
+            max_parallel=int(os.getenv("EMBED_PARALLEL", "4")),
+            retries=int(os.getenv("EMBED_RETRIES", "3")),
+            model=model,
+        )
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(self.retries + 1):
+            try:
+                with track_stage("embed_batch"):
+                    vectors = self.embeddings.embed_documents(texts)
+                tokens = estimate_tokens(texts, max_tokens=0)
+                with self._tokens_lock:
+                    self.tokens += tokens
+                LLM_TOKENS.labels(self.model, "embed", "prompt").inc(tokens)
+                return vectors
+            except Exception as e:
+                if attempt >= self.retries:
+                    raise
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                logger.warning(f"嵌入批次失败（第 {attempt + 1} 次），{delay:.1f}s 后重试: {e}")
+                time.sleep(delay)
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """返回 (len(texts), dim) 的 float32 数组，行顺序与输入一致"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        hashes = [content_hash(text) for text in texts]
+        found = self.cache.get_many(list(set(hashes))) if self.cache else {}
+        EMBEDDING_CACHE.labels("hit").inc(sum(1 for digest in hashes if digest in found))
+
+        missing: Dict[str, str] = {}
+        for digest, text in zip(hashes, texts):
+            if digest not in found:
+                missing.setdefault(digest, text)
+        EMBEDDING_CACHE.labels("miss").inc(len(missing))
+        if missing:
+            digests = list(missing)
+            batches = [digests[i:i + self.batch_size] for i in range(0, len(digests), self.batch_size)]
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_parallel, len(batches)))) as pool:
+                # 复制上下文，让限流优先级（后台流量）在工作线程中同样生效
+                futures = [
+                    pool.submit(contextvars.copy_context().run, self._embed_batch, [missing[d] for d in batch])
+                    for batch in batches
+                ]
+                for batch, future in zip(batches, futures):
+                    vectors = {d: np.asarray(v, dtype=np.float32) for d, v in zip(batch, future.result())}
+                    found.update(vectors)
+                    if self.cache:
+                        self.cache.put_many(vectors)
+        return np.stack([found[digest] for digest in hashes])
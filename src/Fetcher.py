@@ -0,0 +1,200 @@
+import asyncio
+import codecs
+import logging
+import os
+import random
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+import aiohttp
+
+logger = logging.getLogger("Fetcher")
+
+# 不包含正文的标签，其中的文本全部丢弃
+_SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "head"}
+# 块级标签前后换行，保留段落结构
+_BLOCK_TAGS = {
+    "p", "div", "br", "li", "ul", "ol", "tr", "table", "section", "article", "header", "footer",
+    "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "hr", "dd", "dt",
+}
+# 值得重试的状态码
+_RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# Retry-After 的上限（秒），避免单个站点让任务长时间停住
+_MAX_RETRY_AFTER = 60
+
+
+class HTMLTextExtractor(HTMLParser):
+    """增量解析 HTML：可以分块 feed，只保留可见文本和 <title>，不在内存中构建 DOM"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._parts: List[str] = []
+        self._skip_depth = 0
+        self._in_title = False
+        self.title = ""
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag in _BLOCK_TAGS:
+            self._parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif tag == "title":
+            self._in_title = False
+        elif tag in _BLOCK_TAGS:
+            self._parts.append("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth:
+            self._parts.append(data)
+
+    def text(self) -> str:
+        """合并文本：每行去掉首尾空白，丢弃空行"""
+        lines = (" ".join(line.split()) for line in "".join(self._parts).splitlines())
+        return "\n".join(line for line in lines if line)
+
+
+@dataclass
+class FetchResult:
+    """一次抓取的结果；error 不为空时表示最终失败"""
+
+    url: str
+    status: int = 0
+    text: str = ""
+    title: str = ""
+    headers: Dict[str, str] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+class AsyncFetcher:
+    """
+    异步网页抓取器
+    - 同一个 ClientSession 复用连接，limit 控制总并发，limit_per_host 控制单个站点并发
+    - 连接/读取超时，对网络错误和 429/5xx 按指数退避重试（429 优先使用 Retry-After）
+    - 响应体按块读取并增量解析为纯文本，超过 max_bytes 的部分丢弃
+    """
+
+    def __init__(self, limit: int = 32, limit_per_host: int = 4, timeout: float = 30.0,
+                 retries: int = 3, backoff: float = 0.5, max_bytes: int = 10 * 1024 * 1024,
+                 user_agent: str = "xiaoxiao-bot/1.0"):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout, sock_connect=min(timeout, 10))
+        self.retries = retries
+        self.backoff = backoff
+        self.max_bytes = max_bytes
+        self.headers = {"User-Agent": user_agent}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @classmethod
+    def from_env(cls) -> "AsyncFetcher":
+        """读取 FETCH_CONCURRENCY(32) FETCH_PER_HOST(4) FETCH_TIMEOUT(30) FETCH_RETRIES(3) FETCH_MAX_BYTES(10MB)"""
+        return cls(
+            limit=int(os.getenv("FETCH_CONCURRENCY", "32")),
+            limit_per_host=int(os.getenv("FETCH_PER_HOST", "4")),
+            timeout=float(os.getenv("FETCH_TIMEOUT", "30")),
+            retries=int(os.getenv("FETCH_RETRIES", "3")),
+            max_bytes=int(os.getenv("FETCH_MAX_BYTES", str(10 * 1024 * 1024))),
+        )
+
+    async def __aenter__(self) -> "AsyncFetcher":
+        connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host, ttl_dns_cache=300)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers=self.headers)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _read_text(self, response: aiohttp.ClientResponse) -> tuple:
+        """按块读取响应体，HTML 增量解析，其余文本类型直接解码；返回 (正文, 标题)"""
+        try:
+            decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+        except LookupError:
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        is_html = "html" in (response.content_type or "")
+        parser = HTMLTextExtractor() if is_html else None
+        parts: List[str] = []
+        received = 0
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            received += len(chunk)
+            if received > self.max_bytes:
+                logger.warning(f"{response.url} 超过 {self.max_bytes} 字节，截断")
+                break
+            text = decoder.decode(chunk)
+            if parser is not None:
+                parser.feed(text)
+            else:
+                parts.append(text)
+        tail = decoder.decode(b"", final=True)
+        if parser is not None:
+            parser.feed(tail)
+            parser.close()
+            return parser.text(), " ".join(parser.title.split())
+        return "".join(parts) + tail, ""
+
+    def _retry_delay(self, attempt: int, response: Optional[aiohttp.ClientResponse] = None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), _MAX_RETRY_AFTER)
+        return self.backoff * (2 ** attempt) * (0.5 + random.random())
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        """抓取单个 URL，重试用尽后返回带 error 的结果而不是抛出异常"""
+        if self._session is None:
+            raise RuntimeError("AsyncFetcher 需要在 async with 中使用")
+        error = ""
+        for attempt in range(self.retries + 1):
+            delay = None
+            try:
+                async with self._session.get(url, headers=headers) as response:
+                    if response.status in _RETRY_STATUS and attempt < self.retries:
+                        error = f"HTTP {response.status}"
+                        delay = self._retry_delay(attempt, response)
+                    else:
+                        result = FetchResult(url=url, status=response.status, headers=dict(response.headers))
+                        if response.status >= 400:
+                            result.error = f"HTTP {response.status}"
+                        elif response.status != 304:
+                            result.text, result.title = await self._read_text(response)
+                        return result
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = f"{type(e).__name__}: {e}"
+                if attempt < self.retries:
+                    delay = self._retry_delay(attempt)
+            if delay is not None:
+                # 退出 async with 后再等待，退避期间不占用连接池中的连接
+                await asyncio.sleep(delay)
+        logger.warning(f"抓取失败 {url}: {error}")
+        return FetchResult(url=url, error=error)
+
+    async def fetch_all(self, urls: Iterable[str],
+                        headers_for: Optional[Callable[[str], Dict[str, str]]] = None) -> AsyncIterator[FetchResult]:
+        """
+        并发抓取，按完成顺序产出结果；并发度由连接池限制，不会一次性创建全部任务
+
+        Args:
+            urls: 要抓取的 URL
+            headers_for: 返回单个 URL 额外请求头的函数，例如条件请求的 If-None-Match
+        """
+        pending = set()
+        for url in urls:
+            if len(pending) >= self.limit * 2:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+            headers = headers_for(url) if headers_for else None
+            pending.add(asyncio.create_task(self.fetch(url, headers=headers or None)))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
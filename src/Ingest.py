@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+"""
+入库命令行工具：URL、URL 列表文件、本地文件与目录，或按来源清单增量刷新
+
+用法:
+    python -m src.Ingest https://example.com/a https://example.com/b
+    python -m src.Ingest ./materials --prune
+    python -m src.Ingest --url-list urls.txt --batch-docs 64 --embed-batch 128 --embed-parallel 8
+    python -m src.Ingest --refresh
+    python -m src.Ingest --rebuild --chunk-size 600      # 构建新版本集合，校验后切换别名
+    python -m src.Ingest --export-snapshot ./snapshot --quantize
+    python -m src.Ingest --import-snapshot ./snapshot
+    python -m src.Ingest ./materials --dry-run
+    python -m src.Ingest ./materials --resume          # 进程崩溃后从检查点继续
+
+结束时输出文档数、分块数、每秒处理量以及嵌入请求的预估 token 用量，--json 可写入文件
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from dotenv import load_dotenv as _load_dotenv
+_load_dotenv()
+
+from .Logger import setup_logging
+from . import Parsers
+from .Manifest import SourceManifest, collection_name
+from .Pipeline import Checkpoint
+
+_COUNTS = ("documents", "chunks", "new", "updated", "skipped", "deleted", "embedded", "tokens", "resumed")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="文档入库")
+    parser.add_argument("inputs", nargs="*", help="URL、文件或目录")
+    parser.add_argument("--url-list", action="append", default=[], help="每行一个 URL 的文本文件，可重复")
+    parser.add_argument("--refresh", action="store_true", help="增量刷新来源清单中的全部来源")
+    parser.add_argument("--rebuild", action="store_true", help="重建到新的版本集合，校验通过后切换别名")
+    parser.add_argument("--chunk-size", type=int, help="重建时使用的分块大小")
+    parser.add_argument("--chunk-overlap", type=int, help="重建时使用的分块重叠")
+    parser.add_argument("--embedding-model", help="重建时使用的嵌入模型")
+    parser.add_argument("--export-snapshot", metavar="DIR", help="把当前版本导出为快照目录")
+    parser.add_argument("--quantize", action="store_true", help="导出快照时把向量量化为 int8")
+    parser.add_argument("--import-snapshot", metavar="DIR", help="把快照导入为新版本并切换别名")
+    parser.add_argument("--prune", action="store_true", help="删除清单中已不在输入里的来源（URL 列表 / 目录）")
+    parser.add_argument("--no-recursive", action="store_true", help="目录不包含子目录")
+    parser.add_argument("--collection", default=collection_name())
+    parser.add_argument("--storage", default=os.getenv("PERSIST_DIR", "./vector_store"), help="Qdrant 本地存储目录")
+    parser.add_argument("--concurrency", type=int, help="并发抓取数（FETCH_CONCURRENCY）")
+    parser.add_argument("--per-host", type=int, help="单个站点并发抓取数（FETCH_PER_HOST）")
+    parser.add_argument("--parse-workers", type=int, help="文件解析进程数（INGEST_PARSE_WORKERS）")
+    parser.add_argument("--batch-docs", type=int, help="每个批次的文档数（INGEST_BATCH_DOCS）")
+    parser.add_argument("--inflight", type=int, help="同时处理的批次数（INGEST_MAX_INFLIGHT）")
+    parser.add_argument("--embed-batch", type=int, help="每个嵌入请求的文本数（EMBED_BATCH_SIZE）")
+    parser.add_argument("--embed-parallel", type=int, help="并行嵌入请求数（EMBED_PARALLEL）")
+    parser.add_argument("--dry-run", action="store_true", help="只列出将要处理的来源，不抓取、不嵌入、不写入")
+    parser.add_argument("--resume", action="store_true", help="跳过检查点中已完成的来源")
+    parser.add_argument("--checkpoint", help="检查点文件，默认按输入生成在 <storage>/checkpoints 下")
+    parser.add_argument("--json", help="把报告写入 JSON 文件")
+    return parser.parse_args(argv)
+
+
+def apply_settings(args: argparse.Namespace) -> None:
+    """命令行参数覆盖对应的环境变量，各组件按原有方式读取配置"""
+    for option, name in (
+        ("concurrency", "FETCH_CONCURRENCY"),
+        ("per_host", "FETCH_PER_HOST"),
+        ("parse_workers", "INGEST_PARSE_WORKERS"),
+        ("batch_docs", "INGEST_BATCH_DOCS"),
+        ("inflight", "INGEST_MAX_INFLIGHT"),
+        ("embed_batch", "EMBED_BATCH_SIZE"),
+        ("embed_parallel", "EMBED_PARALLEL"),
+    ):
+        value = getattr(args, option)
+        if value is not None:
+            os.environ[name] = str(value)
+
+
+def collect(args: argparse.Namespace) -> Tuple[List[str], List[str], List[str]]:
+    """把输入分成 URL、文件、目录"""
+    urls, files, directories = [], [], []
+    for path in args.url_list:
+        with open(path, encoding="utf-8") as f:
+            urls.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    for item in args.inputs:
+        if item.startswith(("http://", "https://")):
+            urls.append(item)
+        elif os.path.isdir(item):
+            directories.append(item)
+        elif os.path.isfile(item):
+            files.append(item)
+        else:
+            raise SystemExit(f"找不到输入: {item}")
+    return list(dict.fromkeys(urls)), files, directories
+
+
+def manifest_path(args: argparse.Namespace) -> str:
+    """
+    别名当前指向的版本集合的清单；dry-run 不打开 Qdrant（避免加载集合和与服务争用存储目录），
+    直接读取嵌入式 Qdrant 保存在 meta.json 中的别名
+    """
+    collection = args.collection
+    try:
+        with open(os.path.join(args.storage, "meta.json"), encoding="utf-8") as f:
+            collection = json.load(f).get("aliases", {}).get(args.collection, collection)
+    except (OSError, ValueError):
+        pass
+    return os.path.join(args.storage, f"manifest_{collection}.sqlite")
+
+
+def default_checkpoint(args: argparse.Namespace, urls: List[str], files: List[str], directories: List[str]) -> str:
+    """同一组输入得到同一个检查点文件，重新运行相同命令即可继续"""
+    key = json.dumps([args.collection, args.refresh, sorted(urls), sorted(map(os.path.abspath, files)),
+                      sorted(map(os.path.abspath, directories))])
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(args.storage, "checkpoints", f"ingest_{digest}.jsonl")
+
+
+def expand(files: List[str], directories: List[str], recursive: bool) -> List[str]:
+    paths = [path for path in files if Parsers.supported(path)]
+    for directory in directories:
+        for root, dirs, names in os.walk(directory):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            paths.extend(os.path.join(root, name) for name in sorted(names) if Parsers.supported(name))
+            if not recursive:
+                break
+    return [os.path.abspath(path) for path in paths]
+
+
+def dry_run(args: argparse.Namespace, urls: List[str], files: List[str], directories: List[str],
+            checkpoint: Checkpoint) -> dict:
+    """只读清单：URL 区分新增/已知（是否变化需要抓取后才知道），文件按哈希区分新增/变化/未变化"""
+    manifest = SourceManifest(manifest_path(args)) if os.path.exists(manifest_path(args)) else None
+    known = set(manifest.sources()) if manifest else set()
+    if args.refresh or (args.rebuild and not (urls or files or directories)):
+        urls = [source for source in known if source.startswith("http")] + urls
+        files = files + [source for source in known if not source.startswith("http") and os.path.exists(source)]
+    report: Dict[str, Dict[str, int]] = {"urls": {}, "files": {}}
+
+    def count(kind, status):
+        report[kind][status] = report[kind].get(status, 0) + 1
+
+    for url in urls:
+        count("urls", "resumed" if url in checkpoint else ("known" if url in known else "new"))
+    for path in expand(files, directories, not args.no_recursive):
+        if path in checkpoint:
+            count("files", "resumed")
+            continue
+        record = manifest.get(path) if manifest else None
+        if record is None:
+            count("files", "new")
+        else:
+            count("files", "unchanged" if record.content_hash == Parsers.file_hash(path) else "changed")
+    if manifest:
+        manifest.close()
+    return report
+
+
+async def run(args: argparse.Namespace, urls: List[str], files: List[str], directories: List[str],
+              checkpoint: Checkpoint) -> dict:
+    from .AddDoc import DocumentProcessor
+
+    processor = DocumentProcessor(collection_name=args.collection, persist_directory=args.storage)
+    last_report = [0.0]
+
+    def on_progress(progress):
+        if time.time() - last_report[0] >= 5:
+            last_report[0] = time.time()
+            data = progress.as_dict()
+            print(f"  已处理 {data['documents']} 个文档 / {data['chunks']} 个分块，"
+                  f"{data['documents_per_second']} 文档/s，{data['embedded_per_second']} 嵌入/s", file=sys.stderr)
+
+    if args.rebuild:
+        # 重建写入新的版本集合，中断后重新运行即可（嵌入缓存让已完成的部分无需再次请求），不使用检查点
+        sources = (urls + expand(files, directories, not args.no_recursive)) or None
+        result = await processor.rebuild(sources, embedding_model=args.embedding_model, chunk_size=args.chunk_size,
+                                         chunk_overlap=args.chunk_overlap, on_progress=on_progress)
+        if "error" not in result:
+            print(f"别名 {args.collection} -> {result['version']}（原 {result['previous']}），"
+                  f"清理旧版本 {result['removed'] or '无'}")
+        return merge([result])
+
+    options = {"checkpoint": checkpoint, "on_progress": on_progress}
+    results = []
+    if args.refresh:
+        results.append(await processor.refresh_urls(**options))
+        results.append(await processor.refresh_files(**options))
+    if urls:
+        results.append(await processor.add_urls(urls, prune=args.prune, **options))
+    if files:
+        results.append(await processor.add_files(files, **options))
+    for directory in directories:
+        results.append(await processor.add_directory(directory, recursive=not args.no_recursive,
+                                                     prune=args.prune, **options))
+    return merge(results)
+
+
+def merge(results: List[dict]) -> dict:
+    report = {key: 0 for key in _COUNTS}
+    report["sources"] = {"changed": 0, "unchanged": 0, "deleted": 0, "failed": 0}
+    report["failed"] = []
+    report["errors"] = []
+    for result in results:
+        if "error" in result:
+            report["errors"].append(result["error"])
+            continue
+        for key in _COUNTS:
+            report[key] += result.get(key, 0)
+        for key, value in result.get("sources", {}).items():
+            report["sources"][key] += value
+        report["failed"].extend(result.get("failed_urls", []) + result.get("failed_files", []) + result.get("failed", []))
+    return report
+
+
+def print_report(report: dict) -> None:
+    elapsed = max(report["elapsed"], 1e-6)
+    print(f"耗时 {elapsed:.1f}s")
+    print(f"来源: 变化 {report['sources']['changed']}  未变化 {report['sources']['unchanged']}  "
+          f"删除 {report['sources']['deleted']}  失败 {report['sources']['failed']}  检查点跳过 {report['resumed']}")
+    print(f"文档 {report['documents']:>8}  {report['documents'] / elapsed:>8.2f}/s")
+    print(f"分块 {report['chunks']:>8}  {report['chunks'] / elapsed:>8.2f}/s  "
+          f"(新增 {report['new']}  更新 {report['updated']}  跳过 {report['skipped']}  删除 {report['deleted']})")
+    print(f"嵌入 {report['embedded']:>8}  {report['embedded'] / elapsed:>8.2f}/s  "
+          f"预估 token {report['tokens']}（缓存命中的分块不计）")
+    for item in report["failed"]:
+        print(f"失败 {item.get('url') or item.get('file')}: {item['error']}")
+    for error in report["errors"]:
+        print(f"错误 {error}")
+
+
+def snapshot(args: argparse.Namespace) -> int:
+    from .AddDoc import DocumentProcessor
+
+    processor = DocumentProcessor(collection_name=args.collection, persist_directory=args.storage)
+    start = time.time()
+    if args.import_snapshot:
+        result = processor.import_snapshot(args.import_snapshot)
+        print(f"别名 {args.collection} -> {result['version']}（{result['validation']['points']} 个点），"
+              f"耗时 {time.time() - start:.1f}s")
+    if args.export_snapshot:
+        info = processor.export_snapshot(args.export_snapshot, quantize=args.quantize)
+        print(f"导出 {info['count']} 个点（{info['dtype']}，维度 {info['dim']}）到 {args.export_snapshot}，"
+              f"耗时 {time.time() - start:.1f}s")
+    return 0
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    setup_logging("Ingest")
+    apply_settings(args)
+    urls, files, directories = collect(args)
+    if args.export_snapshot or args.import_snapshot:
+        return snapshot(args)
+    if not (urls or files or directories or args.refresh or args.rebuild):
+        print("没有输入，使用 --help 查看用法", file=sys.stderr)
+        return 2
+
+    path = args.checkpoint or default_checkpoint(args, urls, files, directories)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    checkpoint = Checkpoint(path)
+    if len(checkpoint) and not args.resume:
+        print(f"忽略已有检查点 {path}（{len(checkpoint)} 个来源），使用 --resume 继续上次的任务", file=sys.stderr)
+        if args.dry_run:
+            checkpoint = Checkpoint(os.devnull)
+        else:
+            checkpoint.clear()
+
+    if args.dry_run:
+        report = dry_run(args, urls, files, directories, checkpoint)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    start = time.time()
+    try:
+        report = asyncio.run(run(args, urls, files, directories, checkpoint))
+    except KeyboardInterrupt:
+        print(f"已中断，使用 --resume 从检查点 {path} 继续", file=sys.stderr)
+        return 130
+    report["elapsed"] = round(time.time() - start, 3)
+    report["checkpoint"] = path
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if report["errors"]:
+        print(f"任务未完成，使用 --resume 从检查点 {path} 继续", file=sys.stderr)
+        return 1
+    # 全部完成后删除检查点；失败的来源没有写入检查点，重新运行会再次尝试
+    checkpoint.clear()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""
+服务内的后台入库任务队列
+
+- 任务在专用的工作线程中执行，每个任务使用独立的事件循环，抓取和批次线程都不占用服务的事件循环与默认线程池
+- 工作线程数（INGEST_JOB_WORKERS，默认 1）和排队上限（INGEST_JOB_QUEUE，默认 100）限制入库占用的容量
+- 嵌入请求按后台流量限流（见 RateLimit.background），文件解析进程数默认只用一半 CPU，为对话保留额度和算力
+- 任务状态只保存在当前进程内（嵌入式 Qdrant 本身也只能被一个进程打开）
+- 检索使用只读快照（VECTOR_SNAPSHOT）时拒绝所有任务，见 ReadOnlyStore
+"""
+import asyncio
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from .Logger import log_event
+from .Manifest import collection_name
+from .Snapshot import configured_snapshot
+
+logger = logging.getLogger("Jobs")
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+class QueueFull(Exception):
+    """排队的任务已达上限"""
+
+
+class ReadOnlyStore(Exception):
+    """检索使用只读快照（VECTOR_SNAPSHOT），入库的内容不会被检索到"""
+
+
+@dataclass
+class IngestJob:
+    """一个入库任务；progress 在每个批次完成后更新，result 为 DocumentProcessor 返回的字典"""
+
+    kind: str
+    inputs: List[str]
+    options: dict = field(default_factory=dict)
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    progress: dict = field(default_factory=dict)
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        # 只返回输入数量，完整列表可能很长
+        data["inputs"] = len(self.inputs)
+        return data
+
+
+class JobQueue:
+    """有界的入库任务队列，processor_factory 在第一个任务开始时调用一次"""
+
+    def __init__(self, processor_factory: Callable, workers: int = 1, max_queued: int = 100, keep: int = 200,
+                 read_only: Optional[str] = None):
+        self.processor_factory = processor_factory
+        # 不为空时拒绝所有任务，内容为拒绝原因
+        self.read_only = read_only
+        self.workers = workers
+        self.keep = keep
+        self._queue: "queue.Queue[IngestJob]" = queue.Queue(maxsize=max_queued)
+        self._jobs: Dict[str, IngestJob] = {}
+        self._lock = threading.Lock()
+        self._processor = None
+        self._threads: List[threading.Thread] = []
+
+    def _ensure_workers(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"ingest-job-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind: str, inputs: List[str], **options) -> IngestJob:
+        if self.read_only:
+            log_event(logger, "ingest_job_rejected", logging.WARNING, kind=kind, reason=self.read_only)
+            raise ReadOnlyStore(self.read_only)
+        job = IngestJob(kind=kind, inputs=inputs, options=options)
+        with self._lock:
+            self._jobs[job.id] = job
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                del self._jobs[job.id]
+                raise QueueFull(f"排队的入库任务已达上限 {self._queue.maxsize}")
+            self._trim()
+        self._ensure_workers()
+        log_event(logger, "ingest_job_queued", job_id=job.id, kind=kind, input_count=len(inputs))
+        return job
+
+    def _trim(self) -> None:
+        """只保留最近 keep 个已结束的任务"""
+        finished = [job for job in self._jobs.values() if job.status in (SUCCEEDED, FAILED)]
+        for job in sorted(finished, key=lambda j: j.created_at)[:max(len(finished) - self.keep, 0)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> List[IngestJob]:
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+    def _get_processor(self):
+        with self._lock:
+            if self._processor is None:
+                self._processor = self.processor_factory()
+            return self._processor
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            job.status = RUNNING
+            job.started_at = time.time()
+            log_event(logger, "ingest_job_started", job_id=job.id, kind=job.kind)
+            try:
+                result = asyncio.run(self._run(job))
+                job.result = result
+                job.error = result.get("error")
+                job.status = FAILED if job.error else SUCCEEDED
+            except Exception as e:
+                logger.error(f"入库任务 {job.id} 失败: {e}", exc_info=True)
+                job.error = str(e)
+                job.status = FAILED
+            finally:
+                job.finished_at = time.time()
+                log_event(logger, "ingest_job_finished", job_id=job.id, status=job.status,
+                          elapsed=round(job.finished_at - job.started_at, 3))
+                self._queue.task_done()
+
+    async def _run(self, job: IngestJob) -> dict:
+        processor = self._get_processor()
+
+        def on_progress(progress):
+            job.progress = progress.as_dict()
+
+        if job.kind == "urls":
+            return await processor.add_urls(job.inputs, on_progress=on_progress, **job.options)
+        if job.kind == "files":
+            workers = int(os.getenv("INGEST_SERVER_PARSE_WORKERS", "0")) or max(1, (os.cpu_count() or 2) // 2)
+            return await processor.add_files(job.inputs, on_progress=on_progress, parse_workers=workers, **job.options)
+        if job.kind == "rebuild":
+            return await processor.rebuild(job.inputs or None, on_progress=on_progress, **job.options)
+        raise ValueError(f"未知的任务类型: {job.kind}")
+
+
+def upload_path(filename: str) -> str:
+    """上传文件的保存路径：INGEST_UPLOAD_DIR 下的同名文件，重复上传覆盖旧文件并按哈希增量入库"""
+    directory = os.path.abspath(os.getenv("INGEST_UPLOAD_DIR", "./uploads"))
+    os.makedirs(directory, exist_ok=True)
+    name = re.sub(r"[^\w.\-]+", "_", os.path.basename(filename)).strip("._")
+    if not name:
+        raise ValueError("无效的文件名")
+    return os.path.join(directory, name)
+
+
+_job_queue: Optional[JobQueue] = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """进程内共享的任务队列，DocumentProcessor 与检索共用同一个 Qdrant 客户端和 Tools.vector_store_lock"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            def processor_factory():
+                from .AddDoc import DocumentProcessor
+                from .Tools import get_vector_store, vector_store_lock
+                return DocumentProcessor(
+                    collection_name=collection_name(),
+                    persist_directory=os.getenv("PERSIST_DIR", "./vector_store"),
+                    client=get_vector_store().client,
+                    # 与检索共用客户端，访问时持有同一把锁
+                    store_lock=vector_store_lock,
+                )
+
+            snapshot = configured_snapshot()
+            _job_queue = JobQueue(
+                processor_factory,
+                workers=int(os.getenv("INGEST_JOB_WORKERS", "1")),
+                max_queued=int(os.getenv("INGEST_JOB_QUEUE", "100")),
+                # 快照是只读的：写入 Qdrant 的内容在重新导出快照并重启之前不会被检索到，直接拒绝
+                read_only=(
+                    f"检索使用只读快照 VECTOR_SNAPSHOT={snapshot}，请用 python -m src.Ingest 写入 Qdrant "
+                    f"后重新导出快照（--export-snapshot）并重启服务"
+                ) if snapshot else None,
+            )
+    return _job_queue
@@ -0,0 +1,125 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from typing import Any, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# 全局的队列监听器，整个进程只配置一次
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# 标准 LogRecord 自带的属性，序列化时跳过
+_RESERVED = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """把日志记录格式化为单行 JSON，附带 extra 中的结构化字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def setup_logging(name: str = "xiaoxiao", log_file: Optional[str] = None) -> logging.Logger:
+    """
+    配置进程级日志：业务线程只把记录放入队列，由后台 QueueListener 负责格式化和写文件
+
+    Args:
+        name: 返回的 logger 名称
+        log_file: 日志文件路径，None 则只输出到控制台
+
+    Returns:
+        logging.Logger 实例
+    """
+    global _listener
+    if _listener is None:
+        level = os.getenv("LOG_LEVEL", "INFO").upper()
+        if os.getenv("LOG_FORMAT", "json") == "json":
+            formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+        handlers = [logging.StreamHandler()]
+        if log_file:
+            handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        root = logging.getLogger()
+        root.handlers = [logging.handlers.QueueHandler(log_queue)]
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+    return logging.getLogger(name)
+
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields: Any) -> None:
+    """
+    记录一条结构化事件，级别未开启时直接返回，不做任何格式化
+
+    Args:
+        logger: 使用的 logger
+        event: 事件名称
+        level: 日志级别
+        **fields: 附加的结构化字段
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"event": event, **fields})
+
+
+def log_payload(logger: logging.Logger, event: str, payload: Any) -> None:
+    """
+    输出完整的数据内容（文档列表、模型输出等），仅在 DEBUG 且 LOG_PAYLOADS=1 时生效
+    payload 的字符串化在后台监听线程中完成，不占用请求路径
+    """
+    if os.getenv("LOG_PAYLOADS") == "1" and logger.isEnabledFor(logging.DEBUG):
+        logger.debug(event, extra={"event": event, "payload": payload})
+
+
+class SampledTraceHandler(BaseCallbackHandler):
+    """按采样率记录 Agent 执行步骤，替代 AgentExecutor(verbose=True) 的全量输出"""
+
+    def __init__(self, logger: Optional[logging.Logger] = None):
+        self.logger = logger or logging.getLogger("AgentTrace")
+        self.started = time.perf_counter()
+
+    def _elapsed(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    def on_agent_action(self, action, **kwargs: Any) -> None:
+        log_event(self.logger, "agent_action", tool=action.tool, tool_input=action.tool_input, elapsed_ms=self._elapsed())
+
+    def on_tool_end(self, output: Any, **kwargs: Any) -> None:
+        log_event(self.logger, "tool_end", output=str(output)[:500], elapsed_ms=self._elapsed())
+
+    def on_agent_finish(self, finish, **kwargs: Any) -> None:
+        log_event(self.logger, "agent_finish", output=str(finish.return_values.get("output", ""))[:500], elapsed_ms=self._elapsed())
+
+    def on_chain_error(self, error: BaseException, **kwargs: Any) -> None:
+        log_event(self.logger, "agent_error", logging.WARNING, error=repr(error), elapsed_ms=self._elapsed())
+
+
+def trace_callbacks() -> list:
+    """根据 AGENT_TRACE_SAMPLE_RATE（0~1，默认0）决定本次执行是否记录详细步骤"""
+    rate = float(os.getenv("AGENT_TRACE_SAMPLE_RATE", "0"))
+    if rate > 0 and random.random() < rate:
+        return [SampledTraceHandler()]
+    return []
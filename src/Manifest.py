@@ -0,0 +1,109 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+
+def collection_name() -> str:
+    """检索和入库共用的集合名（Qdrant 别名）：EMBEDDING_COLLECTION，未设置时为 COLLECTION_NAME（默认 xiaoxiao_documents）"""
+    return os.getenv("EMBEDDING_COLLECTION") or os.getenv("COLLECTION_NAME", "xiaoxiao_documents")
+
+
+@dataclass
+class SourceRecord:
+    """一个来源（URL 或文件）最近一次入库的状态"""
+
+    source: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_hash: Optional[str] = None
+    chunk_ids: List[str] = field(default_factory=list)
+    updated_at: float = 0.0
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """条件请求头，服务器据此返回 304"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class SourceManifest:
+    """
+    来源清单，保存在 SQLite 中：记录每个来源的 ETag、Last-Modified、内容哈希和分块 ID，
+    增量刷新时据此跳过未变化的来源并删除过期分块
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sources ("
+            "source TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT, "
+            "chunk_ids TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _record(row) -> SourceRecord:
+        return SourceRecord(
+            source=row[0], etag=row[1], last_modified=row[2], content_hash=row[3],
+            chunk_ids=json.loads(row[4]), updated_at=row[5],
+        )
+
+    def get(self, source: str) -> Optional[SourceRecord]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT source, etag, last_modified, content_hash, chunk_ids, updated_at FROM sources WHERE source = ?",
+                (source,),
+            ).fetchone()
+        return self._record(row) if row else None
+
+    def put(self, record: SourceRecord) -> None:
+        record.updated_at = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?, ?)",
+                (record.source, record.etag, record.last_modified, record.content_hash,
+                 json.dumps(record.chunk_ids), record.updated_at),
+            )
+            self._conn.commit()
+
+    def delete(self, source: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sources WHERE source = ?", (source,))
+            self._conn.commit()
+
+    def sources(self, prefix: str = "") -> List[str]:
+        """已记录的来源，可按前缀筛选（例如只取 http 来源）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source FROM sources WHERE substr(source, 1, ?) = ? ORDER BY source", (len(prefix), prefix)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def __iter__(self) -> Iterator[SourceRecord]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, etag, last_modified, content_hash, chunk_ids, updated_at FROM sources"
+            ).fetchall()
+        return (self._record(row) for row in rows)
+
+    def backup(self, path: str) -> None:
+        """把清单复制到 path（SQLite 在线备份，复制期间清单仍可读写）"""
+        with self._lock:
+            target = sqlite3.connect(path)
+            try:
+                self._conn.backup(target)
+            finally:
+                target.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,23 +1,37 @@
 from langchain.memory import ConversationBufferMemory
 from langchain_community.chat_message_histories import RedisChatMessageHistory
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_openai import ChatOpenAI
+from src.Models import create_chat_model
 from src.Prompt import PromptClass
+from src.Logger import log_event, log_payload
+from src.Metrics import track_stage
+from src.Usage import UsageCallbackHandler
 from dotenv import load_dotenv
 load_dotenv()
 import os
+import logging
+
+logger = logging.getLogger("Memory")
 
 redis_url = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
 # print(f"Redis URL: {redis_url}")
 
 
+class TimedConversationBufferMemory(ConversationBufferMemory):
+    """记录每轮对话写回 Redis 的耗时"""
+
+    def save_context(self, inputs, outputs) -> None:
+        with track_stage("memory_write"):
+            super().save_context(inputs, outputs)
+
+
 class MemoryClass:
     def __init__(self, memorykey="chat_history", model=os.getenv("BASE_MODEL")):
         self.memorykey = memorykey
         self.memory = []
-        self.chatmodel = ChatOpenAI(model=model)
+        self.chatmodel = create_chat_model(model)
 
-    def summary_chain(self, store_message):
+    def summary_chain(self, store_message, session_id=None):
         try:
             SystemPrompt = PromptClass().SystemPrompt
             prompt = ChatPromptTemplate.from_messages([
@@ -25,45 +39,48 @@ class MemoryClass:
                 ("user", "{input}")
             ])
             chain = prompt | self.chatmodel
-            summary = chain.invoke({"input": store_message})
+            with track_stage("summarize", self.chatmodel.model_name):
+                # 摘要消耗的 token 计入对应会话，工具维度记为 summarizer
+                usage = UsageCallbackHandler(user_id=session_id, session_id=session_id, intent="summarize", tool="summarizer")
+                summary = chain.invoke({"input": store_message}, config={"callbacks": [usage]})
             return summary
         except KeyError as e:
-            print("总结出错")
-            print(e)
+            logger.error(f"总结出错: {e}")
 
     def get_memory(self, session_id: str = "session1"):
         try:
             # print("session_id:", session_id)
             # print("redis_url:", redis_url)
-            chat_message_history = RedisChatMessageHistory(
-                url=redis_url, session_id=session_id
-            )
+            with track_stage("memory_load"):
+                chat_message_history = RedisChatMessageHistory(
+                    url=redis_url, session_id=session_id
+                )
+                store_message = chat_message_history.messages
             # 对超长的聊天记录进行摘要
-            store_message = chat_message_history.messages
             if len(store_message) > 80:
                 str_message = ""
                 for message in store_message:
                     str_message += f"{type(message).__name__}: {message.content}"
-                summary = self.summary_chain(str_message)
+                summary = self.summary_chain(str_message, session_id=session_id)
                 chat_message_history.clear()  # 清空原有的对话
                 chat_message_history.add_message(summary)  # 保存总结
-                print("添加总结后:", chat_message_history.messages)
+                log_event(logger, "memory_summarized", session_id=session_id, message_count=len(store_message))
+                log_payload(logger, "memory_summary", summary)
                 return chat_message_history
             else:
-                print("go to next step")
                 return chat_message_history
         except Exception as e:
-            print(e)
+            logger.error(f"读取记忆出错: {e}")
             return None
 
     def set_memory(self, session_id: str = "session1"):
         chat_memory = self.get_memory(session_id=session_id)
         if chat_memory is None:
-            print("chat_memory is None")
+            log_event(logger, "memory_fallback", logging.WARNING, session_id=session_id)
             # 创建一个默认的 RedisChatMessageHistory 实例
             chat_memory = RedisChatMessageHistory(url=redis_url, session_id=session_id)
 
-        self.memory = ConversationBufferMemory(
+        self.memory = TimedConversationBufferMemory(
             llm=self.chatmodel,
             human_prefix="user",
             ai_prefix="小小助手",
@@ -0,0 +1,169 @@
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from .Timing import record_timing
+
+# 延迟分桶：覆盖从毫秒级的 Redis 读取到数十秒的长回答
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+STAGE_LATENCY = Histogram(
+    "xiaoxiao_stage_seconds", "单个处理阶段耗时", ["stage", "model", "outcome"], buckets=_BUCKETS
+)
+TURN_LATENCY = Histogram(
+    "xiaoxiao_turn_seconds", "一轮对话总耗时", ["model", "intent", "outcome"], buckets=_BUCKETS
+)
+TURNS = Counter("xiaoxiao_turns_total", "对话轮次", ["model", "intent", "outcome"])
+LLM_FIRST_TOKEN = Histogram(
+    "xiaoxiao_llm_first_token_seconds", "模型首个 token 延迟", ["model", "stage"], buckets=_BUCKETS
+)
+LLM_HEDGES = Counter(
+    "xiaoxiao_llm_route_total", "主/备模型路由结果（是否发出对冲或备用请求、胜出方）", ["model", "hedged", "winner"]
+)
+BREAKER_STATE = Gauge("xiaoxiao_breaker_state", "上游端点熔断状态（0 closed, 1 half_open, 2 open）", ["endpoint"])
+BREAKER_ERROR_RATE = Gauge("xiaoxiao_breaker_error_rate", "上游端点滚动窗口失败率（含慢调用）", ["endpoint"])
+BREAKER_LATENCY = Gauge("xiaoxiao_breaker_latency_seconds", "上游端点滚动窗口平均耗时", ["endpoint"])
+BREAKER_TRANSITIONS = Counter("xiaoxiao_breaker_transitions_total", "熔断状态切换次数", ["endpoint", "state"])
+PROVIDER_HEADROOM = Gauge("xiaoxiao_provider_headroom", "供应池端点剩余额度比例（0 表示冷却中）", ["pool", "endpoint"])
+PROVIDER_REROUTES = Counter("xiaoxiao_provider_reroutes_total", "端点被限流后改用其他端点的次数", ["pool", "endpoint"])
+RATE_LIMIT_WAIT = Histogram(
+    "xiaoxiao_rate_limit_wait_seconds", "等待上游限流额度的时间", ["priority"], buckets=_BUCKETS
+)
+LLM_TOKENS = Counter("xiaoxiao_llm_tokens_total", "模型 token 用量", ["model", "stage", "type"])
+EMBEDDING_CACHE = Counter("xiaoxiao_embedding_cache_total", "入库嵌入缓存命中情况", ["result"])
+INGESTED = Counter("xiaoxiao_ingested_total", "入库的文档与分块数量", ["kind"])
+WS_CONNECTIONS = Gauge("xiaoxiao_ws_connections", "当前 WebSocket 连接数", ["endpoint"])
+WS_MESSAGES = Counter("xiaoxiao_ws_messages_total", "WebSocket 消息数", ["endpoint", "outcome"])
+
+# 带有这些 tag 的模型调用按 tag 记为独立阶段，其余记为 llm
+LLM_STAGE_TAGS = ("condense", "answer")
+
+# 提示词规则中的固定指令 -> 意图标签
+_INTENTS = {
+    "详细用法": "usage",
+    "固定搭配": "collocation",
+    "词根词缀": "affix",
+    "例句": "example",
+    "选择题": "quiz",
+}
+
+
+def classify_intent(text: Optional[str]) -> str:
+    """按提示词中的对话规则粗略识别用户意图，用作指标标签（取值有限，避免标签爆炸）"""
+    text = (text or "").strip()
+    if not text:
+        return "greeting"
+    for keyword, intent in _INTENTS.items():
+        if keyword in text:
+            return intent
+    if text.upper() in ("A", "B", "C"):
+        return "answer"
+    if text.isascii() and text.isalpha():
+        return "word"
+    return "other"
+
+
+@contextmanager
+def track_stage(stage: str, model: str = ""):
+    """记录代码块耗时到 xiaoxiao_stage_seconds，异常时 outcome=error 并继续抛出"""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.labels(stage, model or "", outcome).observe(elapsed)
+        record_timing(stage, elapsed, model)
+
+
+def observe_turn(model: str, intent: str, outcome: str, seconds: float) -> None:
+    """记录一轮对话的结果与耗时"""
+    TURNS.labels(model or "", intent, outcome).inc()
+    TURN_LATENCY.labels(model or "", intent, outcome).observe(seconds)
+
+
+def render_metrics():
+    """返回 (内容, Content-Type)，供 /metrics 接口使用"""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """通过 LangChain 回调记录模型耗时、首 token 延迟、token 用量和工具耗时"""
+
+    def __init__(self):
+        self._runs: Dict[UUID, dict] = {}
+
+    @staticmethod
+    def _stage(tags) -> str:
+        for tag in tags or ():
+            if tag in LLM_STAGE_TAGS:
+                return tag
+        return "llm"
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, tags=None, metadata=None, **kwargs: Any) -> None:
+        params = kwargs.get("invocation_params") or {}
+        model = (metadata or {}).get("ls_model_name") or params.get("model") or params.get("model_name") or ""
+        self._runs[run_id] = {"start": time.perf_counter(), "model": model, "stage": self._stage(tags), "first": False}
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, tags=None, metadata=None, **kwargs: Any) -> None:
+        self.on_chat_model_start(serialized, prompts, run_id=run_id, tags=tags, metadata=metadata, **kwargs)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.get(run_id)
+        if run and not run["first"]:
+            run["first"] = True
+            LLM_FIRST_TOKEN.labels(run["model"], run["stage"]).observe(time.perf_counter() - run["start"])
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        elapsed = time.perf_counter() - run["start"]
+        STAGE_LATENCY.labels(run["stage"], run["model"], "ok").observe(elapsed)
+        record_timing(run["stage"], elapsed, run["model"])
+        prompt_tokens, completion_tokens = token_usage(response)
+        LLM_TOKENS.labels(run["model"], run["stage"], "prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels(run["model"], run["stage"], "completion").inc(completion_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            STAGE_LATENCY.labels(run["stage"], run["model"], "error").observe(time.perf_counter() - run["start"])
+
+    def on_tool_start(self, serialized, input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._runs[run_id] = {"start": time.perf_counter(), "model": "", "stage": f"tool:{(serialized or {}).get('name', 'unknown')}"}
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            elapsed = time.perf_counter() - run["start"]
+            STAGE_LATENCY.labels(run["stage"], "", "ok").observe(elapsed)
+            record_timing(run["stage"], elapsed)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            STAGE_LATENCY.labels(run["stage"], "", "error").observe(time.perf_counter() - run["start"])
+
+
+def token_usage(response) -> tuple:
+    """从 LLMResult 中取出 (prompt_tokens, completion_tokens)，兼容流式 usage_metadata 与 llm_output"""
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+    if not (prompt_tokens or completion_tokens):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+    return prompt_tokens, completion_tokens
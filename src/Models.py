@@ -0,0 +1,119 @@
+import os
+from functools import lru_cache
+from typing import Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from .Cassette import CassetteChatModel, CassetteEmbeddings, cassette_realtime, get_cassette
+from .Breaker import BreakerEmbeddings
+from .Providers import PooledEmbeddings, create_pooled_chat_model, get_pool
+from .RateLimit import RateLimitedChatModel, RateLimitedEmbeddings, bucket_for
+from .Routing import HedgedChatModel, hedge_settings
+
+
+def _with_cassette(model: BaseChatModel) -> BaseChatModel:
+    """开启录制/回放时包装模型"""
+    cassette = get_cassette()
+    if cassette is None:
+        return model
+    return CassetteChatModel(inner=model, cassette=cassette, realtime=cassette_realtime())
+
+
+def _with_rate_limit(model: BaseChatModel, api_key: Optional[str], base_url: Optional[str]) -> BaseChatModel:
+    """配置了 RATE_LIMIT_RPM / RATE_LIMIT_TPM 时，按 key 接入共享限流"""
+    bucket = bucket_for(api_key, base_url)
+    if bucket is None:
+        return model
+    return RateLimitedChatModel(inner=model, bucket=bucket)
+
+
+def create_chat_model(model: Optional[str] = None, **kwargs) -> BaseChatModel:
+    """
+    创建主聊天模型（OpenAI 兼容接口），模型在 PROVIDER_POOL_FILE 中配置了多个端点时按剩余额度分发
+
+    Args:
+        model: 模型名称，默认读取 BASE_MODEL
+        **kwargs: 透传给 ChatOpenAI 的参数
+    """
+    model = model or os.getenv("BASE_MODEL")
+    # 流式调用默认不返回用量，需显式请求，否则 token 统计与用量账本都记为 0
+    kwargs.setdefault("stream_usage", True)
+    pool = get_pool(model)
+    if pool is not None:
+        return _with_cassette(create_pooled_chat_model(pool, **kwargs))
+    chat = ChatOpenAI(model=model, **kwargs)
+    api_key = chat.openai_api_key.get_secret_value() if chat.openai_api_key else None
+    return _with_cassette(_with_rate_limit(chat, api_key, chat.openai_api_base))
+
+
+@lru_cache(maxsize=None)
+def _deepseek_class():
+    """
+    ChatDeepSeek 没有 ChatOpenAI 的 stream_usage 字段（传入会被当作请求参数发出），
+    流式调用时自行带上 stream_options，让最后一个 chunk 返回用量
+    """
+    from langchain_deepseek import ChatDeepSeek
+
+    class ChatDeepSeekWithUsage(ChatDeepSeek):
+        def _stream(self, *args, **kwargs):
+            kwargs.setdefault("stream_options", {"include_usage": True})
+            return super()._stream(*args, **kwargs)
+
+        async def _astream(self, *args, **kwargs):
+            kwargs.setdefault("stream_options", {"include_usage": True})
+            async for chunk in super()._astream(*args, **kwargs):
+                yield chunk
+
+    return ChatDeepSeekWithUsage
+
+
+def create_backup_model(model: Optional[str] = None, **kwargs) -> BaseChatModel:
+    """创建备用聊天模型（DeepSeek），默认读取 BACKUP_MODEL"""
+    chat = _deepseek_class()(model=model or os.getenv("BACKUP_MODEL"), **kwargs)
+    api_key = chat.api_key.get_secret_value() if chat.api_key else None
+    return _with_cassette(_with_rate_limit(chat, api_key, chat.api_base))
+
+
+def create_routed_model(primary: Optional[BaseChatModel] = None, backup: Optional[BaseChatModel] = None) -> BaseChatModel:
+    """
+    创建带熔断、对冲与故障切换的主/备模型，参数见 Routing.hedge_settings 与 Breaker.get_breaker
+
+    Args:
+        primary: 主模型，默认 create_chat_model()
+        backup: 备用模型，默认在配置了 BACKUP_MODEL 时使用 create_backup_model()，否则只对主模型熔断
+    """
+    primary = primary or create_chat_model()
+    if backup is None and os.getenv("BACKUP_MODEL"):
+        backup = create_backup_model()
+    return HedgedChatModel(primary=primary, backup=backup, **hedge_settings())
+
+
+def create_embeddings(model: Optional[str] = None) -> Embeddings:
+    """
+    创建嵌入模型，默认读取 EMBEDDING_MODEL / EMBEDDING_API_KEY / EMBEDDING_API_BASE，
+    在 PROVIDER_POOL_FILE 中配置了多个端点时在端点间轮换（熔断器按端点，见 PooledEmbeddings）
+
+    熔断器只包住上游调用，限流在熔断器之外：后台入库等待额度的时间不会被记为慢调用而熔断对话的检索
+    """
+    model = model or os.getenv("EMBEDDING_MODEL", "Pro/BAAI/bge-m3")
+    pool = get_pool(model)
+    if pool is not None:
+        embeddings = PooledEmbeddings(pool)
+    else:
+        embeddings = BreakerEmbeddings(
+            OpenAIEmbeddings(
+                model=model,
+                api_key=os.getenv("EMBEDDING_API_KEY"),
+                base_url=os.getenv("EMBEDDING_API_BASE")
+            ),
+            name=f"embedding:{model}",
+        )
+        bucket = bucket_for(os.getenv("EMBEDDING_API_KEY"), os.getenv("EMBEDDING_API_BASE"))
+        if bucket is not None:
+            embeddings = RateLimitedEmbeddings(embeddings, bucket)
+    cassette = get_cassette()
+    if cassette is None:
+        return embeddings
+    return CassetteEmbeddings(embeddings, cassette, model=model, realtime=cassette_realtime())
@@ -0,0 +1,144 @@
+"""
+本地文件解析：PDF、DOCX、Markdown、TXT、CSV 词表
+在 ProcessPoolExecutor 的子进程中运行，只依赖标准库（PDF 需要 pypdf），返回可序列化的 (正文, 元数据) 列表
+"""
+import csv
+import hashlib
+import io
+import os
+import zipfile
+from typing import Callable, Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+
+Record = Tuple[str, dict]
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+# 中文教材常见的编码，按顺序尝试
+_ENCODINGS = ("utf-8-sig", "gb18030")
+
+
+def file_hash(path: str) -> str:
+    """文件内容的 sha256，按块读取"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_text(path: str) -> str:
+    with open(path, "rb") as f:
+        data = f.read()
+    for encoding in _ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("utf-8", errors="replace")
+
+
+def parse_text(path: str) -> List[Record]:
+    return [(_read_text(path), {})]
+
+
+def parse_markdown(path: str) -> List[Record]:
+    """Markdown 保留原文（标题和列表结构有助于分割），第一个一级标题作为 title"""
+    text = _read_text(path)
+    title = next((line[2:].strip() for line in text.splitlines() if line.startswith("# ")), "")
+    return [(text, {"title": title} if title else {})]
+
+
+def parse_csv(path: str) -> List[Record]:
+    """词表每行转成一行 "列名: 值; ..."，没有表头时直接用逗号连接各列"""
+    text = _read_text(path)
+    sample = text[:4096]
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",\t;|")
+    except csv.Error:
+        dialect = csv.excel
+    try:
+        has_header = csv.Sniffer().has_header(sample)
+    except csv.Error:
+        has_header = False
+    reader = csv.reader(io.StringIO(text), dialect)
+    header = next(reader, None) if has_header else None
+    lines = []
+    for row in reader:
+        cells = [cell.strip() for cell in row]
+        if not any(cells):
+            continue
+        if header:
+            lines.append("; ".join(f"{name}: {cell}" for name, cell in zip(header, cells) if cell))
+        else:
+            lines.append(", ".join(cell for cell in cells if cell))
+    return [("\n".join(lines), {"rows": len(lines)})]
+
+
+def parse_docx(path: str) -> List[Record]:
+    """直接读取 word/document.xml 中的段落文本，不依赖 python-docx"""
+    with zipfile.ZipFile(path) as archive:
+        xml = archive.read("word/document.xml")
+    paragraphs = []
+    for paragraph in ElementTree.fromstring(xml).iter(f"{_W}p"):
+        parts = []
+        for node in paragraph.iter():
+            if node.tag == f"{_W}t" and node.text:
+                parts.append(node.text)
+            elif node.tag == f"{_W}tab":
+                parts.append("\t")
+            elif node.tag in (f"{_W}br", f"{_W}cr"):
+                parts.append("\n")
+        text = "".join(parts).strip()
+        if text:
+            paragraphs.append(text)
+    return [("\n".join(paragraphs), {})]
+
+
+def parse_pdf(path: str) -> List[Record]:
+    """每页一个文档，元数据记录页码"""
+    try:
+        from pypdf import PdfReader
+    except ImportError as e:
+        raise ImportError("解析 PDF 需要安装 pypdf") from e
+    reader = PdfReader(path)
+    records = []
+    for number, page in enumerate(reader.pages, start=1):
+        text = (page.extract_text() or "").strip()
+        if text:
+            records.append((text, {"page": number}))
+    return records
+
+
+PARSERS: Dict[str, Callable[[str], List[Record]]] = {
+    ".pdf": parse_pdf,
+    ".docx": parse_docx,
+    ".md": parse_markdown,
+    ".markdown": parse_markdown,
+    ".txt": parse_text,
+    ".csv": parse_csv,
+}
+
+
+def supported(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in PARSERS
+
+
+def parse_file(path: str, known_hash: Optional[str] = None) -> Tuple[str, str, Optional[List[Record]], Optional[str]]:
+    """
+    子进程入口：先计算文件哈希，与清单中的哈希相同则不解析
+
+    Returns:
+        (路径, 文件哈希, 解析结果 / 未变化时为 None, 错误信息)
+    """
+    try:
+        digest = file_hash(path)
+        if digest == known_hash:
+            return path, digest, None, None
+        parser = PARSERS[os.path.splitext(path)[1].lower()]
+        records = parser(path)
+        for _, metadata in records:
+            metadata.setdefault("title", os.path.basename(path))
+            metadata["file_type"] = os.path.splitext(path)[1].lower().lstrip(".")
+        return path, digest, [(text, metadata) for text, metadata in records if text.strip()], None
+    except Exception as e:
+        return path, "", None, f"{type(e).__name__}: {e}"
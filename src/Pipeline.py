@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Set, Union
+
+from langchain_core.documents import Document
+
+from .Embedding import content_hash
+
+
+@dataclass
+class SourceItem:
+    """流水线中的一个来源：同一来源的全部文档必须在同一个条目中，保证分块 ID 与清单按来源一致"""
+
+    source: str
+    docs: List[Document]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # 本地文件使用文件字节的哈希，下次入库时不必解析就能判断是否变化
+    digest: Optional[str] = None
+
+    def content_hash(self) -> str:
+        if self.digest:
+            return self.digest
+        return content_hash("\n".join(doc.page_content for doc in self.docs))
+
+
+@dataclass
+class IngestProgress:
+    """入库进度，每完成一个批次累加一次"""
+
+    sources: int = 0
+    documents: int = 0
+    chunks: int = 0
+    new: int = 0
+    updated: int = 0
+    skipped: int = 0
+    deleted: int = 0
+    embedded: int = 0
+    tokens: int = 0
+    resumed: int = 0
+    batches: int = 0
+    started_at: float = field(default_factory=time.time)
+
+    def add(self, stats: Dict[str, int]) -> None:
+        for key, value in stats.items():
+            if key not in ("started_at", "tokens") and hasattr(self, key):
+                setattr(self, key, getattr(self, key) + value)
+        self.batches += 1
+
+    def as_dict(self) -> dict:
+        """进度快照，附带耗时和每秒处理量"""
+        data = asdict(self)
+        elapsed = max(time.time() - self.started_at, 1e-6)
+        data["elapsed"] = round(elapsed, 3)
+        for key in ("documents", "chunks", "embedded"):
+            data[f"{key}_per_second"] = round(getattr(self, key) / elapsed, 2)
+        return data
+
+
+class Checkpoint:
+    """
+    可恢复入库的检查点：追加写入已完成的来源（每行一个 JSON 字符串），
+    批次完成后立即落盘，进程崩溃后重新运行会跳过这些来源
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._done: Set[str] = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._done.add(json.loads(line))
+                    except ValueError:
+                        # 崩溃时可能留下写了一半的最后一行
+                        continue
+
+    def __contains__(self, source: str) -> bool:
+        return source in self._done
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def mark(self, sources: Iterable[str]) -> None:
+        sources = [source for source in sources if source not in self._done]
+        if not sources:
+            return
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(source, ensure_ascii=False) + "\n" for source in sources))
+                f.flush()
+                os.fsync(f.fileno())
+            self._done.update(sources)
+
+    def clear(self) -> None:
+        """全部完成后删除检查点，下次运行从头开始（仍会按清单跳过未变化的内容）"""
+        with self._lock:
+            self._done.clear()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+async def batched(items: Union[Iterable[SourceItem], AsyncIterable[SourceItem]],
+                  max_docs: int) -> AsyncIterator[List[SourceItem]]:
+    """按文档数把来源分批，来源不会被拆到两个批次；同时接受同步和异步迭代器，只在需要时拉取下一个来源"""
+    batch: List[SourceItem] = []
+    size = 0
+
+    async def iterate():
+        if hasattr(items, "__aiter__"):
+            async for item in items:
+                yield item
+        else:
+            for item in items:
+                yield item
+
+    async for item in iterate():
+        if not item.docs:
+            continue
+        batch.append(item)
+        size += len(item.docs)
+        if size >= max_docs:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
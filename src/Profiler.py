@@ -0,0 +1,102 @@
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+logger = logging.getLogger("Profiler")
+
+# 同一时间只允许一次采样，避免并发请求叠加开销
+_profile_lock = threading.Lock()
+
+
+class StackSampler:
+    """
+    基于 sys._current_frames 的采样分析器：后台线程按固定间隔抓取所有线程的调用栈，
+    汇总为 collapsed stack 格式（flamegraph.pl / speedscope 可直接读取）
+    未运行时没有任何开销
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 128):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+    def _sample_once(self, own_ident: int) -> None:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_ident:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def run(self, seconds: float) -> "StackSampler":
+        """在当前线程中采样 seconds 秒"""
+        own_ident = threading.get_ident()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            self._sample_once(own_ident)
+            time.sleep(self.interval)
+        return self
+
+    def collapsed(self) -> str:
+        """输出 collapsed stack 文本：每行 `frame1;frame2;... count`"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+def profile(seconds: float, interval: float = 0.005) -> Optional[str]:
+    """
+    采样 seconds 秒并返回 collapsed stack 文本；已有采样在进行时返回 None
+
+    Args:
+        seconds: 采样时长，上限由 PROFILE_MAX_SECONDS 控制（默认 60）
+        interval: 采样间隔秒数
+    """
+    seconds = min(seconds, float(os.getenv("PROFILE_MAX_SECONDS", "60")))
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        sampler = StackSampler(interval=interval).run(seconds)
+        logger.info(f"采样完成: {seconds}s, {sampler.samples} 次采样, {len(sampler.stacks)} 个不同调用栈")
+        return sampler.collapsed()
+    finally:
+        _profile_lock.release()
+
+
+def install_signal_handler(output_dir: str = "logs", signum: int = getattr(signal, "SIGUSR2", 0)) -> bool:
+    """
+    注册信号处理：收到 SIGUSR2 后在后台线程采样 PROFILE_SECONDS 秒（默认 30），
+    结果写入 output_dir/profile-<pid>-<时间>.collapsed
+    用法: kill -USR2 <pid>
+
+    Returns:
+        是否注册成功（非主线程或平台不支持时返回 False）
+    """
+    if not signum or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def _worker():
+        result = profile(float(os.getenv("PROFILE_SECONDS", "30")))
+        if result is None:
+            logger.warning("已有采样在进行，忽略本次信号")
+            return
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(result)
+        logger.info(f"采样结果已写入 {path}")
+
+    def _handler(signum, frame):
+        threading.Thread(target=_worker, name="profiler", daemon=True).start()
+
+    signal.signal(signum, _handler)
+    return True
@@ -0,0 +1,345 @@
+"""
+同一模型的多 key / 多 base url 供应池
+
+PROVIDER_POOL_FILE 指向的 JSON 文件按模型名列出可用端点，api_key 可直接写或通过 api_key_env 引用环境变量：
+
+    {
+      "gpt-4o-mini": [
+        {"name": "main", "api_key_env": "OPENAI_API_KEY", "base_url": "https://api.openai.com/v1", "rpm": 500, "tpm": 200000},
+        {"name": "proxy", "api_key_env": "OPENAI_API_KEY_2", "base_url": "https://proxy.example.com/v1"}
+      ],
+      "Pro/BAAI/bge-m3": [
+        {"name": "sf-1", "api_key_env": "EMBEDDING_API_KEY", "base_url": "https://api.siliconflow.cn/v1"}
+      ]
+    }
+
+聊天请求按响应头 x-ratelimit-remaining-* 估算的剩余额度选择端点；遇到 429 时把该端点冷却到
+额度重置时间，并立即改用其他端点，而不是在原地等待重试
+端点的 rpm/tpm 用于共享限流（见 RateLimit.py），未填写时使用 RATE_LIMIT_RPM / RATE_LIMIT_TPM
+"""
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from .Breaker import BreakerEmbeddings, CircuitOpenError
+from .Metrics import PROVIDER_HEADROOM, PROVIDER_REROUTES
+from .RateLimit import Bucket, bucket_for, estimate_tokens, get_limiter
+
+logger = logging.getLogger("Providers")
+
+# 没有 Retry-After 等信息时，429 后的默认冷却秒数
+DEFAULT_COOLDOWN = 10.0
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class PoolExhausted(RuntimeError):
+    """池中所有端点都被限流或尝试失败"""
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """解析 x-ratelimit-reset-* 的时长格式，如 "1s"、"6m0s"、"20ms"，也接受纯数字秒"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _UNITS[unit] for number, unit in parts)
+
+
+class Endpoint:
+    """池中的一个 key + base url，记录最近一次响应头中的剩余额度"""
+
+    def __init__(self, pool: str, name: str, api_key: Optional[str], base_url: Optional[str],
+                 bucket: Optional[Bucket] = None):
+        self.pool = pool
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.bucket = bucket
+        self.remaining: Dict[str, float] = {}
+        self.limit: Dict[str, float] = {}
+        self.reset_at: Dict[str, float] = {}
+        self.cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    def headroom(self, now: float) -> float:
+        """剩余额度比例 0~1，请求数和 token 取较小者；未知或已过重置时间按 1 计算"""
+        with self._lock:
+            if now < self.cooldown_until:
+                return 0.0
+            ratios = []
+            for kind in ("requests", "tokens"):
+                if kind not in self.remaining or now >= self.reset_at.get(kind, 0):
+                    continue
+                limit = self.limit.get(kind) or max(self.remaining[kind], 1)
+                ratios.append(self.remaining[kind] / limit)
+            return min(ratios) if ratios else 1.0
+
+    def update(self, headers: Optional[Dict[str, str]]) -> None:
+        """根据响应头更新剩余额度"""
+        if not headers:
+            return
+        headers = {k.lower(): v for k, v in headers.items()}
+        now = time.monotonic()
+        with self._lock:
+            for kind in ("requests", "tokens"):
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if remaining is None:
+                    continue
+                try:
+                    self.remaining[kind] = float(remaining)
+                    if f"x-ratelimit-limit-{kind}" in headers:
+                        self.limit[kind] = float(headers[f"x-ratelimit-limit-{kind}"])
+                except ValueError:
+                    continue
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                self.reset_at[kind] = now + (reset if reset is not None else 60)
+        PROVIDER_HEADROOM.labels(self.pool, self.name).set(self.headroom(now))
+
+    def cool_down(self, headers: Optional[Dict[str, str]]) -> float:
+        """收到 429 后冷却到额度重置，返回冷却秒数"""
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        waits = [
+            parse_duration(headers.get(name))
+            for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+        ]
+        seconds = max([w for w in waits if w is not None] or [DEFAULT_COOLDOWN])
+        with self._lock:
+            self.cooldown_until = time.monotonic() + seconds
+        PROVIDER_HEADROOM.labels(self.pool, self.name).set(0)
+        return seconds
+
+
+class ProviderPool:
+    """同一模型的一组端点"""
+
+    def __init__(self, model: str, endpoints: List[Endpoint]):
+        self.model = model
+        self.endpoints = endpoints
+
+    def order(self) -> List[Endpoint]:
+        """按剩余额度从高到低排列，额度相同的随机打散；冷却中的端点排在最后"""
+        now = time.monotonic()
+        scored = [(endpoint.headroom(now), random.random(), endpoint) for endpoint in self.endpoints]
+        scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+        return [endpoint for _, _, endpoint in scored]
+
+    def acquire(self, tokens: int, tried: set) -> Optional[Endpoint]:
+        """
+        在未尝试过的端点中按剩余额度顺序选出第一个拿到共享限流额度的端点，
+        全部受限时等待最先恢复的一个；没有可选端点时返回 None
+        """
+        candidates = [endpoint for endpoint in self.order() if endpoint.name not in tried]
+        if not candidates:
+            return None
+        index = get_limiter().acquire_first([endpoint.bucket for endpoint in candidates], tokens)
+        tried.add(candidates[index].name)
+        return candidates[index]
+
+
+@lru_cache
+def load_pools() -> Dict[str, ProviderPool]:
+    """读取 PROVIDER_POOL_FILE，未配置时返回空字典（所有模型使用单一 key）"""
+    path = os.getenv("PROVIDER_POOL_FILE")
+    if not path:
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    pools = {}
+    for model, entries in config.items():
+        endpoints = [
+            Endpoint(
+                pool=model,
+                name=entry.get("name") or f"{i}",
+                api_key=entry.get("api_key") or os.getenv(entry.get("api_key_env", "")),
+                base_url=entry.get("base_url"),
+                bucket=bucket_for(
+                    entry.get("api_key") or os.getenv(entry.get("api_key_env", "")),
+                    entry.get("base_url"),
+                    rpm=entry.get("rpm"),
+                    tpm=entry.get("tpm"),
+                ),
+            )
+            for i, entry in enumerate(entries)
+        ]
+        if endpoints:
+            pools[model] = ProviderPool(model, endpoints)
+    logger.info(f"已加载供应池: {', '.join(f'{m}({len(p.endpoints)})' for m, p in pools.items())}")
+    return pools
+
+
+def get_pool(model: Optional[str]) -> Optional[ProviderPool]:
+    """返回模型对应的供应池；只有一个端点时不需要池化"""
+    pool = load_pools().get(model or "")
+    if pool is None or len(pool.endpoints) < 2:
+        return None
+    return pool
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def _error_headers(error: Exception) -> Dict[str, str]:
+    response = getattr(error, "response", None)
+    return dict(getattr(response, "headers", None) or {})
+
+
+def _response_headers(generation_info: Optional[dict], message=None) -> Optional[dict]:
+    headers = (generation_info or {}).get("headers")
+    if headers is None and message is not None:
+        headers = (getattr(message, "response_metadata", None) or {}).get("headers")
+    return headers
+
+
+class PooledChatModel(BaseChatModel):
+    """
+    把请求分发到供应池中的多个 ChatOpenAI 实例（每个端点一个，关闭 SDK 内置重试）
+    遇到 429 时冷却该端点并改用下一个端点；流式输出一旦开始就不再切换
+    """
+
+    pool: Any
+    models: Dict[str, BaseChatModel]
+
+    @property
+    def _llm_type(self) -> str:
+        return "pooled-openai"
+
+    @property
+    def model_name(self) -> str:
+        return self.pool.model
+
+    def bind_tools(self, tools, **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def get_num_tokens(self, text: str) -> int:
+        return next(iter(self.models.values())).get_num_tokens(text)
+
+    def get_num_tokens_from_messages(self, messages, tools=None) -> int:
+        return next(iter(self.models.values())).get_num_tokens_from_messages(messages)
+
+    def _reroute(self, endpoint: Endpoint, error: Exception) -> None:
+        seconds = endpoint.cool_down(_error_headers(error))
+        PROVIDER_REROUTES.labels(self.pool.model, endpoint.name).inc()
+        logger.warning(f"端点 {self.pool.model}/{endpoint.name} 被限流，冷却 {seconds:.1f}s 并改用其他端点")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        last_error: Optional[Exception] = None
+        tried: set = set()
+        estimate = estimate_tokens(messages, getattr(next(iter(self.models.values())), "max_tokens", None))
+        while (endpoint := self.pool.acquire(estimate, tried)) is not None:
+            try:
+                result = self.models[endpoint.name]._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                if not _is_rate_limited(e):
+                    raise
+                self._reroute(endpoint, e)
+                last_error = e
+                continue
+            generation = result.generations[0]
+            endpoint.update(_response_headers(generation.generation_info, generation.message))
+            return result
+        raise PoolExhausted(f"模型 {self.pool.model} 的所有端点均被限流") from last_error
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        last_error: Optional[Exception] = None
+        tried: set = set()
+        estimate = estimate_tokens(messages, getattr(next(iter(self.models.values())), "max_tokens", None))
+        while (endpoint := self.pool.acquire(estimate, tried)) is not None:
+            iterator = self.models[endpoint.name]._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            try:
+                first = next(iterator, None)
+            except Exception as e:
+                if not _is_rate_limited(e):
+                    raise
+                self._reroute(endpoint, e)
+                last_error = e
+                continue
+            if first is None:
+                return
+            endpoint.update(_response_headers(first.generation_info, first.message))
+            yield first
+            yield from iterator
+            return
+        raise PoolExhausted(f"模型 {self.pool.model} 的所有端点均被限流") from last_error
+
+
+def create_pooled_chat_model(pool: ProviderPool, **kwargs) -> PooledChatModel:
+    """为池中每个端点创建一个 ChatOpenAI（返回响应头以便读取剩余额度，流式调用也返回用量）"""
+    from langchain_openai import ChatOpenAI
+
+    kwargs.setdefault("stream_usage", True)
+    models = {
+        endpoint.name: ChatOpenAI(
+            model=pool.model,
+            api_key=endpoint.api_key,
+            base_url=endpoint.base_url,
+            include_response_headers=True,
+            max_retries=0,
+            **kwargs,
+        )
+        for endpoint in pool.endpoints
+    }
+    return PooledChatModel(pool=pool, models=models)
+
+
+class PooledEmbeddings(Embeddings):
+    """
+    嵌入请求按端点轮换（嵌入接口拿不到响应头，按冷却状态与随机打散选择），429 或端点熔断时改用其他端点；
+    每个端点有独立的熔断器 embedding:{模型}:{端点}，只统计上游调用本身，不包含等待限流额度的时间
+    """
+
+    def __init__(self, pool: ProviderPool):
+        from langchain_openai import OpenAIEmbeddings
+
+        self.pool = pool
+        self.model = pool.model
+        self.embeddings = {
+            endpoint.name: BreakerEmbeddings(
+                OpenAIEmbeddings(model=pool.model, api_key=endpoint.api_key, base_url=endpoint.base_url, max_retries=0),
+                name=f"embedding:{pool.model}:{endpoint.name}",
+            )
+            for endpoint in pool.endpoints
+        }
+
+    def _call(self, method: str, *args):
+        last_error: Optional[Exception] = None
+        tried: set = set()
+        texts = args[0] if isinstance(args[0], list) else [args[0]]
+        while (endpoint := self.pool.acquire(estimate_tokens(texts, max_tokens=0), tried)) is not None:
+            try:
+                return getattr(self.embeddings[endpoint.name], method)(*args)
+            except CircuitOpenError as e:
+                last_error = e
+                continue
+            except Exception as e:
+                if not _is_rate_limited(e):
+                    raise
+                seconds = endpoint.cool_down(_error_headers(e))
+                PROVIDER_REROUTES.labels(self.pool.model, endpoint.name).inc()
+                logger.warning(f"嵌入端点 {self.pool.model}/{endpoint.name} 被限流，冷却 {seconds:.1f}s")
+                last_error = e
+        raise PoolExhausted(f"嵌入模型 {self.pool.model} 的所有端点均被限流或熔断") from last_error
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._call("embed_documents", texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._call("embed_query", text)
@@ -0,0 +1,272 @@
+"""
+基于 Redis 的上游限流：每个供应商 key（api key + base url）一对令牌桶，分别限制每分钟请求数与 token 数，
+多个 uvicorn worker、钉钉 worker 与入库任务共享同一份额度
+
+- 令牌按每分钟额度匀速补充，请求与 token 在一个 Lua 脚本中原子扣减
+- 后台流量（入库等，见 background()）只能使用额度的 1 - RATE_LIMIT_INTERACTIVE_RESERVE，
+  剩余部分留给交互请求
+- Redis 不可用时放行，不因为限流组件故障阻断对话
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from .Metrics import RATE_LIMIT_WAIT
+
+logger = logging.getLogger("RateLimit")
+
+INTERACTIVE, BACKGROUND = "interactive", "background"
+
+_priority: ContextVar[str] = ContextVar("upstream_priority", default=INTERACTIVE)
+
+# KEYS: 请求桶, token 桶
+# ARGV: 当前时间(秒), 预留比例, 请求桶容量, 请求数, token 桶容量, token 数
+# 返回需要等待的毫秒数，0 表示已扣减
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local reserve = tonumber(ARGV[2])
+local wait = 0
+local levels = {}
+for i = 1, #KEYS do
+  local capacity = tonumber(ARGV[1 + i * 2])
+  local cost = tonumber(ARGV[2 + i * 2])
+  if capacity > 0 then
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    local rate = capacity / 60
+    tokens = math.min(capacity, tokens + math.max(now - ts, 0) * rate)
+    local need = math.min(cost + capacity * reserve, capacity)
+    if tokens < need then
+      wait = math.max(wait, (need - tokens) / rate)
+    end
+    levels[i] = tokens
+  end
+end
+if wait > 0 then
+  return math.ceil(wait * 1000)
+end
+for i = 1, #KEYS do
+  if levels[i] ~= nil then
+    local cost = tonumber(ARGV[2 + i * 2])
+    redis.call('HSET', KEYS[i], 'tokens', levels[i] - cost, 'ts', now)
+    redis.call('EXPIRE', KEYS[i], 120)
+  end
+end
+return 0
+"""
+
+
+class RateLimitTimeout(TimeoutError):
+    """在允许的最长等待时间内没有拿到额度"""
+
+
+@dataclass(frozen=True)
+class Bucket:
+    """一个供应商 key 的额度配置"""
+
+    name: str
+    rpm: int = 0
+    tpm: int = 0
+
+
+def bucket_for(api_key: Optional[str], base_url: Optional[str],
+               rpm: Optional[int] = None, tpm: Optional[int] = None) -> Optional[Bucket]:
+    """
+    按 api key + base url 生成桶（键名只包含哈希，不会把 key 写入 Redis）
+    未指定 rpm/tpm 时读取 RATE_LIMIT_RPM / RATE_LIMIT_TPM，两者都为 0 时不限流并返回 None
+    """
+    rpm = int(os.getenv("RATE_LIMIT_RPM", "0")) if rpm is None else rpm
+    tpm = int(os.getenv("RATE_LIMIT_TPM", "0")) if tpm is None else tpm
+    if not (rpm or tpm):
+        return None
+    digest = hashlib.sha1(f"{base_url or ''}|{api_key or ''}".encode("utf-8")).hexdigest()[:16]
+    return Bucket(name=digest, rpm=rpm, tpm=tpm)
+
+
+@contextmanager
+def background():
+    """在代码块内把上游调用标记为后台流量"""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+class RateLimiter:
+    """共享令牌桶限流器"""
+
+    def __init__(self, redis_url: str, reserve: float = 0.2):
+        self.redis_url = redis_url
+        self.reserve = reserve
+        self._client = None
+        self._script = None
+
+    def _acquire_script(self):
+        if self._script is None:
+            from .Usage import redis_client
+            self._client = redis_client(self.redis_url)
+            self._script = self._client.register_script(_ACQUIRE_SCRIPT)
+        return self._script
+
+    def try_acquire(self, bucket: Bucket, tokens: int, priority: Optional[str] = None) -> float:
+        """尝试扣减一次请求和 tokens 个 token，成功返回 0，否则返回需要等待的秒数"""
+        reserve = self.reserve if (priority or current_priority()) == BACKGROUND else 0
+        try:
+            wait_ms = self._acquire_script()(
+                keys=[f"ratelimit:{bucket.name}:requests", f"ratelimit:{bucket.name}:tokens"],
+                args=[time.time(), reserve, bucket.rpm, 1, bucket.tpm, tokens],
+            )
+        except Exception as e:
+            logger.warning(f"限流器不可用，直接放行: {e}")
+            return 0.0
+        return int(wait_ms) / 1000
+
+    def acquire_first(self, buckets: List[Optional[Bucket]], tokens: int) -> int:
+        """
+        按顺序尝试多个桶，返回第一个拿到额度的下标（None 表示该端点不限流）
+        全部需要等待时睡眠最短等待时间后重试，超过最长等待时间抛出 RateLimitTimeout
+        """
+        priority = current_priority()
+        max_wait = float(os.getenv("RATE_LIMIT_BACKGROUND_MAX_WAIT" if priority == BACKGROUND else "RATE_LIMIT_MAX_WAIT",
+                                   "300" if priority == BACKGROUND else "10"))
+        start = time.perf_counter()
+        while True:
+            waits = []
+            for index, bucket in enumerate(buckets):
+                if bucket is None:
+                    return index
+                wait = self.try_acquire(bucket, tokens, priority)
+                if wait <= 0:
+                    waited = time.perf_counter() - start
+                    if waited > 0.001:
+                        RATE_LIMIT_WAIT.labels(priority).observe(waited)
+                    return index
+                waits.append(wait)
+            remaining = max_wait - (time.perf_counter() - start)
+            if remaining <= 0:
+                RATE_LIMIT_WAIT.labels(priority).observe(time.perf_counter() - start)
+                raise RateLimitTimeout(f"{max_wait}s 内没有可用的上游额度")
+            time.sleep(min(min(waits), remaining))
+
+    def acquire(self, bucket: Bucket, tokens: int) -> None:
+        self.acquire_first([bucket], tokens)
+
+    def settle(self, bucket: Bucket, delta: int) -> None:
+        """按实际用量修正 token 桶（delta 为实际减预估，可以为负）"""
+        if not (bucket.tpm and delta):
+            return
+        try:
+            self._acquire_script()
+            self._client.hincrbyfloat(f"ratelimit:{bucket.name}:tokens", "tokens", -delta)
+        except Exception as e:
+            logger.warning(f"修正限流额度失败: {e}")
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            from .Memory import redis_url
+            _limiter = RateLimiter(redis_url, reserve=float(os.getenv("RATE_LIMIT_INTERACTIVE_RESERVE", "0.2")))
+    return _limiter
+
+
+def estimate_tokens(messages, max_tokens: Optional[int] = None) -> int:
+    """预估一次调用的 token：提示词按 4 个字符 1 个 token 粗算，加上回复上限（未设置时按 256）"""
+    chars = sum(len(str(getattr(m, "content", m) or "")) for m in messages)
+    return max(1, chars // 4) + (256 if max_tokens is None else max_tokens)
+
+
+def _actual_tokens(message) -> Optional[int]:
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return None
+    return usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+
+
+class RateLimitedChatModel(BaseChatModel):
+    """调用前从共享令牌桶扣减额度，调用后按实际 token 用量修正"""
+
+    inner: BaseChatModel
+    bucket: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return f"ratelimited-{self.inner._llm_type}"
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.inner, "model_name", None) or getattr(self.inner, "model", "") or ""
+
+    def bind_tools(self, tools, **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def get_num_tokens(self, text: str) -> int:
+        return self.inner.get_num_tokens(text)
+
+    def get_num_tokens_from_messages(self, messages, tools=None) -> int:
+        return self.inner.get_num_tokens_from_messages(messages)
+
+    def _estimate(self, messages) -> int:
+        return estimate_tokens(messages, getattr(self.inner, "max_tokens", None))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        limiter = get_limiter()
+        estimate = self._estimate(messages)
+        limiter.acquire(self.bucket, estimate)
+        result = self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        actual = _actual_tokens(result.generations[0].message)
+        if actual is not None:
+            limiter.settle(self.bucket, actual - estimate)
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        limiter = get_limiter()
+        estimate = self._estimate(messages)
+        limiter.acquire(self.bucket, estimate)
+        actual = None
+        for chunk in self.inner._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            tokens = _actual_tokens(chunk.message)
+            if tokens is not None:
+                actual = (actual or 0) + tokens
+            yield chunk
+        if actual is not None:
+            limiter.settle(self.bucket, actual - estimate)
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """嵌入请求按文本长度预估 token 并扣减额度"""
+
+    def __init__(self, inner: Embeddings, bucket: Bucket):
+        self.inner = inner
+        self.bucket = bucket
+        self.model = getattr(inner, "model", "")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        get_limiter().acquire(self.bucket, estimate_tokens(texts, max_tokens=0))
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        get_limiter().acquire(self.bucket, estimate_tokens([text], max_tokens=0))
+        return self.inner.embed_query(text)
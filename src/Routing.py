@@ -0,0 +1,196 @@
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel, generate_from_stream
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from .Breaker import CircuitBreaker, CircuitOpenError, get_breaker
+from .Metrics import LLM_HEDGES
+
+logger = logging.getLogger("Routing")
+
+_CHUNK, _ERROR, _DONE = "chunk", "error", "done"
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """在截止时间内没有任何模型完成响应"""
+
+
+class _Race:
+    """
+    在后台线程中运行主/备模型的调用，结果统一放入队列
+    第一个产出结果的一方获胜，另一方被标记取消，在下一个 chunk 到达时停止读取并关闭连接
+    每一方的首个结果耗时或失败都会记入对应端点的熔断器
+    """
+
+    def __init__(self, calls: Dict[str, Callable[[], Iterator[Any]]], breakers: Dict[str, CircuitBreaker]):
+        self.calls = calls
+        self.breakers = breakers
+        self.queue: "queue.Queue" = queue.Queue()
+        self.cancelled = {name: threading.Event() for name in calls}
+        self.attempted = []
+        self.started = []
+
+    def try_start(self, name: str) -> bool:
+        """熔断器放行时启动调用，否则返回 False；每一方最多尝试一次"""
+        self.attempted.append(name)
+        if not self.breakers[name].allow():
+            return False
+        self.started.append(name)
+        # 复制当前上下文，让限流优先级、耗时记录等 ContextVar 在工作线程中同样生效
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(self._worker, name), name=f"llm-{name}", daemon=True).start()
+        return True
+
+    def can_start(self, name: str) -> bool:
+        return name in self.calls and name not in self.attempted
+
+    def _worker(self, name: str) -> None:
+        iterator = None
+        start = time.perf_counter()
+        first = True
+        try:
+            iterator = self.calls[name]()
+            for item in iterator:
+                if first:
+                    first = False
+                    self.breakers[name].record(True, time.perf_counter() - start)
+                if self.cancelled[name].is_set():
+                    return
+                self.queue.put((name, _CHUNK, item))
+            if first:
+                self.breakers[name].record(True, time.perf_counter() - start)
+            self.queue.put((name, _DONE, None))
+        except Exception as e:
+            if first:
+                self.breakers[name].record(False, time.perf_counter() - start)
+            self.queue.put((name, _ERROR, e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def cancel(self, *names: str) -> None:
+        for name in names:
+            self.cancelled[name].set()
+
+
+def _model_name(model: BaseChatModel) -> str:
+    return getattr(model, "model_name", None) or getattr(model, "model", "") or ""
+
+
+class HedgedChatModel(BaseChatModel):
+    """
+    主/备模型路由：
+    - 主模型出错时立即改用备用模型（与 with_fallbacks 相同）
+    - 主模型超过 hedge_after 秒仍未返回首个 chunk 时，向备用模型发出对冲请求，先出 chunk 的一方胜出
+    - 整个调用超过 deadline 秒时抛出 LLMDeadlineExceeded
+    - 主/备模型各有熔断器（见 Breaker.py），熔断中的一方直接跳过
+    一旦某一方开始输出就不再切换，之后的错误直接抛出
+    """
+
+    primary: BaseChatModel
+    backup: Optional[BaseChatModel] = None
+    hedge_after: float = 2.0
+    deadline: float = 60.0
+
+    @property
+    def _llm_type(self) -> str:
+        return f"hedged-{self.primary._llm_type}"
+
+    @property
+    def model_name(self) -> str:
+        return _model_name(self.primary)
+
+    def bind_tools(self, tools, **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def get_num_tokens(self, text: str) -> int:
+        return self.primary.get_num_tokens(text)
+
+    def get_num_tokens_from_messages(self, messages, tools=None) -> int:
+        return self.primary.get_num_tokens_from_messages(messages)
+
+    def _breakers(self) -> Dict[str, CircuitBreaker]:
+        breakers = {"primary": get_breaker(f"chat:{_model_name(self.primary)}")}
+        if self.backup is not None:
+            breakers["backup"] = get_breaker(f"chat:{_model_name(self.backup)}")
+        return breakers
+
+    def _run(self, calls: Dict[str, Callable[[], Iterator[Any]]]) -> Iterator[Any]:
+        race = _Race(calls, self._breakers())
+        start = time.perf_counter()
+        deadline = start + self.deadline if self.deadline > 0 else float("inf")
+        hedge_at = start + self.hedge_after if self.hedge_after > 0 else float("inf")
+        if not race.try_start("primary"):
+            # 主模型熔断中，直接绕过，不再先试主模型再切换
+            if not (race.can_start("backup") and race.try_start("backup")):
+                raise CircuitOpenError(f"模型 {self.model_name} 及备用模型均处于熔断状态")
+            logger.info(f"主模型 {self.model_name} 熔断中，直接使用备用模型")
+        winner: Optional[str] = None
+        errors: Dict[str, Exception] = {}
+        try:
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    raise LLMDeadlineExceeded(f"模型调用超过 {self.deadline}s 截止时间")
+                wait = deadline - now
+                if winner is None and race.can_start("backup"):
+                    wait = min(wait, max(hedge_at - now, 0))
+                try:
+                    name, kind, payload = race.queue.get(timeout=wait)
+                except queue.Empty:
+                    if winner is None and race.can_start("backup") and time.perf_counter() >= hedge_at:
+                        if race.try_start("backup"):
+                            logger.info(f"主模型 {self.hedge_after}s 内无响应，发出对冲请求")
+                    continue
+                if winner is not None and name != winner:
+                    continue
+
+                if kind == _ERROR:
+                    if winner is not None:
+                        raise payload
+                    errors[name] = payload
+                    if race.can_start("backup") and race.try_start("backup"):
+                        logger.warning(f"主模型出错，改用备用模型: {payload}")
+                    elif len(errors) == len(race.started):
+                        raise errors.get("primary", payload)
+                    continue
+
+                if winner is None:
+                    winner = name
+                    race.cancel(*(other for other in race.started if other != name))
+                    LLM_HEDGES.labels(self.model_name, "yes" if len(race.started) > 1 else "no", name).inc()
+                if kind == _DONE:
+                    return
+                yield payload
+        finally:
+            race.cancel(*race.started)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        # 非流式调用同样按首个 chunk 对冲，再合并为完整结果；若按整个响应计时，
+        # 所有超过 hedge_after 的正常回答都会重复请求备用模型，熔断器也会把耗时长的回答记为慢调用
+        return generate_from_stream(self._stream(messages, stop=stop, **kwargs))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        calls = {"primary": lambda: self.primary._stream(messages, stop=stop, **kwargs)}
+        if self.backup is not None:
+            calls["backup"] = lambda: self.backup._stream(messages, stop=stop, **kwargs)
+        for chunk in self._run(calls):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+def hedge_settings() -> dict:
+    """读取 LLM_HEDGE_AFTER（默认 2 秒，0 表示只在出错时切换）与 LLM_DEADLINE（默认 60 秒，0 表示不限）"""
+    return {
+        "hedge_after": float(os.getenv("LLM_HEDGE_AFTER", "2")),
+        "deadline": float(os.getenv("LLM_DEADLINE", "60")),
+    }
@@ -0,0 +1,216 @@
+"""
+向量库快照：把集合导出为紧凑的目录，新副本启动时以内存映射方式打开，不需要从嵌入式 Qdrant 的 SQLite 中反序列化全部点
+
+目录格式（version 1）:
+    meta.json       集合、版本、点数、维度、向量类型（float32 / int8）、嵌入模型
+    vectors.npy     (count, dim) 连续数组；float32 为单位向量，int8 为按行对称量化后的单位向量
+    scales.npy      int8 时每行的缩放系数（float32）
+    payloads.jsonl  每行一个 {"id", "page_content", "metadata"}
+    offsets.npy     (count + 1,) int64，payloads.jsonl 中每行的字节偏移，按需读取命中的行
+"""
+import json
+import mmap
+import os
+import shutil
+import time
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+
+FORMAT_VERSION = 1
+# 检索时按块计算相似度，int8 反量化的临时内存与集合大小无关
+_SEARCH_BLOCK = 8192
+
+
+def configured_snapshot() -> Optional[str]:
+    """VECTOR_SNAPSHOT 指向的快照目录（存在 meta.json 时），检索据此改用只读快照"""
+    path = os.getenv("VECTOR_SNAPSHOT")
+    if path and os.path.exists(os.path.join(path, "meta.json")):
+        return path
+    return None
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def export_snapshot(points: Iterable[Tuple[Any, List[float], dict]], count: int, dim: int, path: str,
+                    quantize: bool = False, **meta: Any) -> dict:
+    """
+    写入快照目录：先写到临时目录，完成后替换 path，读取方不会看到写了一半的快照
+
+    Args:
+        points: (id, 向量, payload) 迭代器，payload 为 QdrantVectorStore 格式（page_content / metadata）
+        count: 点数，用于预分配内存映射数组
+        dim: 向量维度
+        quantize: 为 True 时向量按行量化为 int8，体积约为 float32 的四分之一
+        **meta: 写入 meta.json 的附加信息
+    """
+    tmp = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    dtype = np.int8 if quantize else np.float32
+    vectors = np.lib.format.open_memmap(os.path.join(tmp, "vectors.npy"), mode="w+", dtype=dtype, shape=(count, dim))
+    scales = np.ones(count, dtype=np.float32)
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    written = 0
+    with open(os.path.join(tmp, "payloads.jsonl"), "wb") as f:
+        for point_id, vector, payload in points:
+            if written >= count:
+                break
+            unit = _normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+            if quantize:
+                scales[written] = max(float(np.abs(unit).max()), 1e-12) / 127
+                vectors[written] = np.round(unit / scales[written]).astype(np.int8)
+            else:
+                vectors[written] = unit
+            payload = payload or {}
+            line = json.dumps(
+                {"id": str(point_id), "page_content": payload.get("page_content", ""), "metadata": payload.get("metadata", {})},
+                ensure_ascii=False,
+            ).encode("utf-8") + b"\n"
+            f.write(line)
+            offsets[written + 1] = offsets[written] + len(line)
+            written += 1
+    vectors.flush()
+    del vectors
+    if written < count:
+        # 导出期间有点被删除：截断到实际写入的行数
+        data = np.load(os.path.join(tmp, "vectors.npy"), mmap_mode="r")[:written].copy()
+        np.save(os.path.join(tmp, "vectors.npy"), data)
+    np.save(os.path.join(tmp, "offsets.npy"), offsets[:written + 1])
+    if quantize:
+        np.save(os.path.join(tmp, "scales.npy"), scales[:written])
+    info = {
+        "format": FORMAT_VERSION, "count": written, "dim": dim, "dtype": "int8" if quantize else "float32",
+        "distance": "cosine", "created_at": time.time(), **meta,
+    }
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+
+    if os.path.exists(path):
+        old = f"{path}.old-{os.getpid()}"
+        os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+    else:
+        os.replace(tmp, path)
+    return info
+
+
+class SnapshotStore(VectorStore):
+    """
+    只读的快照向量库：向量和 payload 都以内存映射方式打开，打开耗时与集合大小基本无关，
+    由操作系统按需加载页面；检索为分块的精确余弦相似度，接口与检索链使用的 QdrantVectorStore 一致
+    """
+
+    def __init__(self, path: str, embedding: Embeddings):
+        self.path = path
+        self._embedding = embedding
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != FORMAT_VERSION:
+            raise ValueError(f"不支持的快照格式: {self.meta.get('format')}")
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.scales = (
+            np.load(os.path.join(path, "scales.npy"), mmap_mode="r") if self.meta["dtype"] == "int8" else None
+        )
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self._payload_file = open(os.path.join(path, "payloads.jsonl"), "rb")
+        self._payloads = (
+            mmap.mmap(self._payload_file.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] else b""
+        )
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return int(self.meta["count"])
+
+    def _rows(self, start: int, stop: int) -> np.ndarray:
+        block = np.asarray(self.vectors[start:stop], dtype=np.float32)
+        if self.scales is not None:
+            block = block * np.asarray(self.scales[start:stop])[:, None]
+        return block
+
+    def _document(self, row: int) -> Document:
+        line = self._payloads[int(self.offsets[row]):int(self.offsets[row + 1])]
+        data = json.loads(line)
+        return Document(id=data["id"], page_content=data["page_content"], metadata=data["metadata"])
+
+    def _top(self, embedding: List[float], k: int) -> List[Tuple[int, float]]:
+        """分块计算余弦相似度，返回 (行号, 分数) 按分数倒序"""
+        query = _normalize(np.asarray(embedding, dtype=np.float32).reshape(1, -1))[0]
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, len(self), _SEARCH_BLOCK):
+            scores = self._rows(start, min(start + _SEARCH_BLOCK, len(self))) @ query
+            rows = np.arange(start, start + len(scores))
+            best_rows = np.concatenate([best_rows, rows])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_scores) > k:
+                keep = np.argpartition(-best_scores, k)[:k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+        order = np.argsort(-best_scores)
+        return [(int(best_rows[i]), float(best_scores[i])) for i in order]
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        return [(self._document(row), score) for row, score in self._top(embedding, k)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        return self._cosine_relevance_score_fn
+
+    def max_marginal_relevance_search_by_vector(self, embedding: List[float], k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, **kwargs: Any) -> List[Document]:
+        candidates = [row for row, _ in self._top(embedding, fetch_k)]
+        if not candidates:
+            return []
+        vectors = np.stack([self._rows(row, row + 1)[0] for row in candidates])
+        selected = maximal_marginal_relevance(np.asarray(embedding, dtype=np.float32), vectors, lambda_mult=lambda_mult, k=k)
+        return [self._document(candidates[i]) for i in selected]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20,
+                                      lambda_mult: float = 0.5, **kwargs: Any) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(self._embedding.embed_query(query), k, fetch_k, lambda_mult)
+
+    def preload(self) -> None:
+        """顺序读取一遍向量，把页面载入页缓存，避免首个查询触发大量缺页"""
+        for start in range(0, len(self), _SEARCH_BLOCK):
+            np.asarray(self.vectors[start:start + _SEARCH_BLOCK]).sum()
+
+    def points(self) -> Iterator[Tuple[str, np.ndarray, dict]]:
+        """按行产出 (id, 向量, payload)，用于把快照导入 Qdrant"""
+        for start in range(0, len(self), _SEARCH_BLOCK):
+            block = self._rows(start, min(start + _SEARCH_BLOCK, len(self)))
+            for offset, vector in enumerate(block):
+                doc = self._document(start + offset)
+                yield doc.id, vector, {"page_content": doc.page_content, "metadata": doc.metadata}
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        raise RuntimeError("快照向量库是只读的，请通过 DocumentProcessor 入库后重新导出")
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   **kwargs: Any) -> "SnapshotStore":
+        raise RuntimeError("快照只能由 DocumentProcessor.export_snapshot 生成")
+
+    def close(self) -> None:
+        if isinstance(self._payloads, mmap.mmap):
+            self._payloads.close()
+        self._payload_file.close()
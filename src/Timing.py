@@ -0,0 +1,54 @@
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+# 当前请求的阶段耗时记录；未开启调试时为 None，记录函数直接返回
+_current_trace: ContextVar[Optional[List[dict]]] = ContextVar("timing_trace", default=None)
+
+# 请求头开启方式: X-Debug-Timing: 1
+DEBUG_HEADER = "X-Debug-Timing"
+
+
+@contextmanager
+def timing_trace(enabled: bool = True):
+    """
+    在当前上下文中开启阶段耗时记录，产出记录列表
+
+    Args:
+        enabled: False 时不开启，产出 None
+    """
+    if not enabled:
+        yield None
+        return
+    trace: List[dict] = []
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def record_timing(stage: str, seconds: float, desc: str = "") -> None:
+    """记录一个阶段的耗时（毫秒精度），仅在 timing_trace 内生效"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.append({"stage": stage, "ms": round(seconds * 1000, 1), "desc": desc})
+
+
+def server_timing_header(trace: List[dict]) -> str:
+    """
+    把记录转换为 Server-Timing 头，例如:
+    prompt_build;dur=1.2, llm;desc="gpt-4o";dur=830.5, llm_2;desc="gpt-4o";dur=402.1
+    """
+    seen = {}
+    parts = []
+    for item in trace:
+        # 指标名必须是 token，工具名中的冒号等字符替换为下划线
+        name = re.sub(r"[^A-Za-z0-9_\-.]", "_", item["stage"])
+        seen[name] = seen.get(name, 0) + 1
+        if seen[name] > 1:
+            name = f"{name}_{seen[name]}"
+        desc = f';desc="{item["desc"]}"' if item["desc"] else ""
+        parts.append(f"{name}{desc};dur={item['ms']}")
+    return ", ".join(parts)
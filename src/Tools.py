@@ -1,24 +1,76 @@
-from typing import Optional
+from typing import List, Optional
+from contextlib import nullcontext
+from functools import lru_cache
+import logging
 import os
+import threading
 import time
 import requests
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
-from langchain.agents import tool
-from langchain_community.utilities import SerpAPIWrapper
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+from langchain_core.tools import tool
+from .Models import create_chat_model, create_embeddings, create_routed_model
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
 from .Memory import MemoryClass
 from .Storage import get_user
+from .Logger import log_event, log_payload
+from .Metrics import track_stage
+
+logger = logging.getLogger("Tools")
+
+
+# 嵌入式 Qdrant 客户端不是线程安全的：检索与服务内的入库任务（见 Jobs）共用同一个客户端，访问时都持有这把锁
+vector_store_lock = threading.RLock()
+
+
+@lru_cache(maxsize=None)
+def get_vector_store():
+    """
+    获取进程内共享的向量存储
+    嵌入式 Qdrant 同一目录只能被一个客户端打开，且加载集合开销较大，因此只创建一次
+    集合名见 Manifest.collection_name，是别名，DocumentProcessor.rebuild 切换版本后查询自动读取新版本
+    设置 VECTOR_SNAPSHOT 且快照存在时改用只读的内存映射快照（见 Snapshot 模块），启动时不加载 Qdrant 存储
+    """
+    from .Manifest import collection_name
+    from .Snapshot import SnapshotStore, configured_snapshot
+
+    snapshot = configured_snapshot()
+    if snapshot:
+        store = SnapshotStore(snapshot, create_embeddings())
+        log_event(logger, "snapshot_opened", path=snapshot, count=len(store), dtype=store.meta["dtype"])
+        model = os.getenv("EMBEDDING_MODEL", "Pro/BAAI/bge-m3")
+        if store.meta.get("embedding_model") not in (None, model):
+            logger.warning(f"快照的嵌入模型 {store.meta['embedding_model']} 与 EMBEDDING_MODEL={model} 不一致")
+        return store
+
+    from langchain_qdrant import QdrantVectorStore
+    from qdrant_client import QdrantClient
+
+    client = QdrantClient(path=os.getenv("PERSIST_DIR","./vector_store"))
+    return QdrantVectorStore(
+        client=client, 
+        collection_name=collection_name(),
+        embedding=create_embeddings()
+    )
+
+def retrieve_documents(query: str) -> List[Document]:
+    """MMR 检索，分别记录查询向量化和 Qdrant 检索的耗时"""
+    vector_store = get_vector_store()
+    with track_stage("embed"):
+        embedding = vector_store.embeddings.embed_query(query)
+    # 只读的快照没有 Qdrant 客户端，不需要加锁
+    lock = vector_store_lock if hasattr(vector_store, "client") else nullcontext()
+    with track_stage("qdrant_search"), lock:
+        return vector_store.max_marginal_relevance_search_by_vector(embedding, k=5, fetch_k=10)
 
 # 工具函数
 @tool
 def search(query: str) -> str:
     """只有需要了解实时信息或不知道的事情的时候才会使用这个工具."""
+    from langchain_community.utilities import SerpAPIWrapper
+    init_config()
     serp = SerpAPIWrapper()
     return serp.run(query)
 
@@ -32,10 +84,13 @@ def get_info_from_local(query: str) -> str:
     Returns:
         str: 从知识库中检索到的答案
     """
-    print("-------RAG-------------")
+    # 检索相关依赖较重，只在真正调用工具时导入
+    from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+
     userid = get_user("userid")
-    print(userid)
-    llm = ChatOpenAI(model=os.getenv("BASE_MODEL"))
+    log_event(logger, "rag_query", logging.DEBUG, user_id=userid)
+    llm = create_routed_model(create_chat_model(os.getenv("BASE_MODEL")))
     memory = MemoryClass(memorykey=os.getenv("MEMORY_KEY"),model=os.getenv("BASE_MODEL"))
     chat_history = memory.get_memory(session_id=userid).messages if userid else []
     
@@ -45,26 +100,12 @@ def get_info_from_local(query: str) -> str:
         ("human", "{input}"),
     ])
 
-    client = QdrantClient(path=os.getenv("PERSIST_DIR","./vector_store"))
-    vector_store = QdrantVectorStore(
-        client=client, 
-        collection_name=os.getenv("EMBEDDING_COLLECTION"), 
-        embedding=OpenAIEmbeddings(
-            model=os.getenv("EMBEDDING_MODEL", "Pro/BAAI/bge-m3"),
-            api_key=os.getenv("EMBEDDING_API_KEY"),
-            base_url=os.getenv("EMBEDDING_API_BASE")
-        )
-    )
-    
-    retriever = vector_store.as_retriever(
-        search_type="mmr",
-        search_kwargs={"k": 5, "fetch_k": 10}
-    )
+    retriever = RunnableLambda(retrieve_documents, name="retrieve_documents")
     
     qa_chain = create_retrieval_chain(
-        create_history_aware_retriever(llm, retriever, condense_question_prompt),
+        create_history_aware_retriever(llm.with_config(tags=["condense"]), retriever, condense_question_prompt),
         create_stuff_documents_chain(
-            llm,
+            llm.with_config(tags=["answer"]),
             ChatPromptTemplate.from_messages([
                 ("system", "你是回答问题的助手。使用下列检索到的上下文回答。这个问题。如果你不知道答案，就说你不知道。最多使用三句话，并保持回答简明扼要。\n\n{context}"),
                 ("placeholder", "{chat_history}"),
@@ -77,14 +118,13 @@ def get_info_from_local(query: str) -> str:
         "input": query,
         "chat_history": chat_history,
     })
-    print("-------RAG- OUTPUT------------")
-    print(res)
+    log_payload(logger, "rag_output", res)
     return res["answer"]
 
 @tool
 def word_usage(word: str) -> str:
     """返回该单词的详细用法"""
-    print("-------RAG- word_usage------------")
+    log_event(logger, "word_usage", logging.DEBUG, word=word)
     # 这里可以查数据库、查API或写死规则
     return f"{word} 的详细用法是..."
 
@@ -132,4 +172,12 @@ class Config:
             "OPENAI_API_BASE": os.getenv("OPENAI_API_BASE")
         })
 
-Config()
+
+_config = None
+
+def init_config() -> Config:
+    """显式初始化工具配置，只在第一次使用需要密钥的工具时执行，不再在导入时校验"""
+    global _config
+    if _config is None:
+        _config = Config()
+    return _config
@@ -0,0 +1,224 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from .Metrics import token_usage
+
+logger = logging.getLogger("Usage")
+
+# 支持统计的维度，对应 Redis 键 usage:{日期}:{维度}:{取值}
+DIMENSIONS = ("user", "session", "model", "intent", "tool")
+
+# Redis 不可用时内存中最多保留的键数，超出后丢弃，避免无限增长
+MAX_PENDING_KEYS = int(os.getenv("USAGE_MAX_PENDING_KEYS", "10000"))
+
+
+def redis_client(url: str):
+    """创建账本使用的 Redis 客户端，基准测试中会替换为 fakeredis"""
+    import redis
+    return redis.Redis.from_url(url, decode_responses=True)
+
+
+def _day(ts: Optional[float] = None) -> str:
+    return time.strftime("%Y%m%d", time.localtime(ts))
+
+
+class UsageLedger:
+    """
+    token 用量账本：内存中累加，后台线程按 USAGE_FLUSH_SECONDS（默认5秒）批量写入 Redis
+    每个维度取值一个哈希，字段为 `{模型}:prompt` / `{模型}:completion` / `{模型}:calls`，
+    并在 usage:{日期}:index:{维度} 集合中记录出现过的取值，便于管理接口列出
+    """
+
+    def __init__(self, redis_url: str, flush_interval: float = 5.0, ttl_days: int = 90):
+        self.redis_url = redis_url
+        self.flush_interval = flush_interval
+        self.ttl = ttl_days * 86400
+        self._pending: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+        self._client = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="usage-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = redis_client(self.redis_url)
+        return self._client
+
+    def add(self, dims: Dict[str, str], model: str, prompt_tokens: int, completion_tokens: int) -> None:
+        """累加一次模型调用的用量，只操作内存"""
+        day = _day()
+        model = model or "unknown"
+        with self._lock:
+            for dimension, value in dims.items():
+                if not value:
+                    continue
+                fields = self._pending[f"usage:{day}:{dimension}:{value}"]
+                fields[f"{model}:prompt"] += prompt_tokens
+                fields[f"{model}:completion"] += completion_tokens
+                fields[f"{model}:calls"] += 1
+
+    def flush(self) -> None:
+        """把累加的用量一次性写入 Redis，失败时放回内存等待下次写入"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+        if not pending:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, fields in pending.items():
+                for field, amount in fields.items():
+                    pipe.hincrby(key, field, amount)
+                pipe.expire(key, self.ttl)
+                _, day, dimension, value = key.split(":", 3)
+                index = f"usage:{day}:index:{dimension}"
+                pipe.sadd(index, value)
+                pipe.expire(index, self.ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"写入用量失败，稍后重试: {e}")
+            with self._lock:
+                if len(self._pending) + len(pending) > MAX_PENDING_KEYS:
+                    logger.error(f"待写入用量超过 {MAX_PENDING_KEYS} 个键，丢弃本批 {len(pending)} 个")
+                    return
+                for key, fields in pending.items():
+                    for field, amount in fields.items():
+                        self._pending[key][field] += amount
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self) -> None:
+        self._stop.set()
+        self.flush()
+
+    def report(self, dimension: str, day: Optional[str] = None, limit: int = 100) -> list:
+        """按总 token 倒序列出某维度各取值的用量"""
+        day = day or _day()
+        values = sorted(self.client.smembers(f"usage:{day}:index:{dimension}"))
+        pipe = self.client.pipeline(transaction=False)
+        for value in values:
+            pipe.hgetall(f"usage:{day}:{dimension}:{value}")
+        rows = []
+        for value, fields in zip(values, pipe.execute()):
+            row = summarize_fields(fields)
+            row[dimension] = value
+            rows.append(row)
+        rows.sort(key=lambda r: r["total_tokens"], reverse=True)
+        return rows[:limit]
+
+    def detail(self, dimension: str, value: str, day: Optional[str] = None) -> dict:
+        """某个取值按模型拆分的用量"""
+        fields = self.client.hgetall(f"usage:{day or _day()}:{dimension}:{value}")
+        return {dimension: value, **summarize_fields(fields)}
+
+
+def summarize_fields(fields: Dict[str, str]) -> dict:
+    """把哈希字段整理为 {prompt_tokens, completion_tokens, total_tokens, calls, models: {...}}"""
+    models: Dict[str, Dict[str, int]] = defaultdict(dict)
+    for field, amount in fields.items():
+        model, kind = field.rsplit(":", 1)
+        models[model][kind] = int(amount)
+    prompt = sum(m.get("prompt", 0) for m in models.values())
+    completion = sum(m.get("completion", 0) for m in models.values())
+    return {
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": prompt + completion,
+        "calls": sum(m.get("calls", 0) for m in models.values()),
+        "models": dict(models),
+    }
+
+
+_ledger: Optional[UsageLedger] = None
+_ledger_lock = threading.Lock()
+_no_usage_models: set = set()
+
+
+def get_ledger() -> UsageLedger:
+    """进程内共享的用量账本"""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            from .Memory import redis_url
+            _ledger = UsageLedger(
+                redis_url,
+                flush_interval=float(os.getenv("USAGE_FLUSH_SECONDS", "5")),
+                ttl_days=int(os.getenv("USAGE_TTL_DAYS", "90")),
+            )
+    return _ledger
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """
+    按用户、会话、模型、意图和工具归集 token 用量
+    模型调用若发生在某个工具内部（如本地知识库检索），计入该工具；否则按 tag 或默认的 agent 计入
+    """
+
+    def __init__(self, user_id: Optional[str] = None, session_id: Optional[str] = None,
+                 intent: str = "other", tool: str = "agent"):
+        self.user_id = user_id or "anonymous"
+        self.session_id = session_id or self.user_id
+        self.intent = intent
+        self.tool = tool
+        self._parents: Dict[UUID, Optional[UUID]] = {}
+        self._tools: Dict[UUID, str] = {}
+        self._models: Dict[UUID, str] = {}
+
+    def _owner_tool(self, run_id: UUID) -> str:
+        """沿父级链路向上查找所属工具"""
+        current = self._parents.get(run_id)
+        while current is not None:
+            if current in self._tools:
+                return self._tools[current]
+            current = self._parents.get(current)
+        return self.tool
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._parents[run_id] = parent_run_id
+
+    def on_tool_start(self, serialized, input_str: str, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._parents[run_id] = parent_run_id
+        self._tools[run_id] = (serialized or {}).get("name", "unknown")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                            metadata=None, **kwargs: Any) -> None:
+        self._parents[run_id] = parent_run_id
+        params = kwargs.get("invocation_params") or {}
+        self._models[run_id] = (metadata or {}).get("ls_model_name") or params.get("model") or params.get("model_name") or ""
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self.on_chat_model_start(serialized, prompts, run_id=run_id, parent_run_id=parent_run_id, **kwargs)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        model = self._models.pop(run_id, "")
+        prompt_tokens, completion_tokens = token_usage(response)
+        if not (prompt_tokens or completion_tokens):
+            # 流式调用未开启 stream_usage 时接口不返回用量，每个模型只提示一次
+            if model not in _no_usage_models:
+                _no_usage_models.add(model)
+                logger.warning(f"模型 {model or 'unknown'} 的调用未返回 token 用量，未计入账本")
+            return
+        get_ledger().add(
+            {
+                "user": self.user_id,
+                "session": self.session_id,
+                "model": model or "unknown",
+                "intent": self.intent,
+                "tool": self._owner_tool(run_id),
+            },
+            model,
+            prompt_tokens,
+            completion_tokens,
+        )
@@ -1,7 +1,26 @@
-from .Prompt import PromptClass
-from .Memory import MemoryClass
-from  .Tools import search,get_info_from_local
-from .Agents import AgentClass
-from .AddDoc import DocumentProcessor
+import importlib
 
-__all__ = ["PromptClass","MemoryClass","AgentClass","search","get_info_from_local","DocumentProcessor"]
\ No newline at end of file
+# 名称 -> 所在子模块，首次访问时才导入，避免 `import src` 拉起全部依赖
+_LAZY_ATTRS = {
+    "PromptClass": ".Prompt",
+    "MemoryClass": ".Memory",
+    "AgentClass": ".Agents",
+    "search": ".Tools",
+    "get_info_from_local": ".Tools",
+    "DocumentProcessor": ".AddDoc",
+}
+
+__all__ = ["PromptClass","MemoryClass","AgentClass","search","get_info_from_local","DocumentProcessor"]
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -1,28 +1,15 @@
 #!/usr/bin/env python
 from src.Agents import AgentClass
 from src.Storage import add_user
+from src.Logger import setup_logging
 from dotenv import load_dotenv as _load_dotenv
 _load_dotenv()
 import os
-import logging
 import uuid
 
 
-def setup_logging():
-    """设置日志配置"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler("main_connection.log", encoding="utf-8")  # 添加 encoding
-        ]
-    )
-    return logging.getLogger("DingTalk")
-
-
 def main():
-    logger = setup_logging()
+    logger = setup_logging("DingTalk", "main_connection.log")
     logger.info("启动服务器流客户端")
     logger.info(f"应用ID: {os.getenv('DINGDING_ID')}")
     logger.info(f"使用凭证连接服务器")
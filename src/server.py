@@ -1,16 +1,138 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, Header, Depends, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, PlainTextResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from typing import List, Optional
 from src.Agents import AgentClass
+from src.Prompt import PromptClass
 from src.Storage import add_user
+from src.Logger import setup_logging, log_event, log_payload
+from src.Breaker import breaker_states
+from src.Metrics import WS_CONNECTIONS, WS_MESSAGES, render_metrics
+from src.Timing import record_timing, server_timing_header, timing_trace
+from src import Jobs, Profiler, Usage
+import aiofiles
+import asyncio
+import hmac
 import json
 import logging
+import time
 from dotenv import load_dotenv
 import os
 
 # 加载环境变量
 load_dotenv()
 
+# Agent 在预热阶段创建
+agent = None
+
+# 预热状态，/readyz 据此判断是否可以接收流量
+warmup_state = {"ready": False, "failed": None, "steps": {}}
+
+
+def _warmup_step(name, func):
+    """执行单个预热步骤并记录耗时，失败只记录日志，不阻止服务就绪"""
+    start = time.perf_counter()
+    try:
+        func()
+        warmup_state["steps"][name] = {"ok": True, "ms": round((time.perf_counter() - start) * 1000, 1)}
+    except Exception as e:
+        warmup_state["steps"][name] = {"ok": False, "error": str(e)}
+        log_event(logger, "warmup_step_failed", logging.WARNING, step=name, error=str(e))
+
+
+def _preconnect_llm():
+    """向主模型和备用模型各发一次轻量请求，提前建立连接池中的 TLS 连接"""
+    if os.getenv("LLM_CASSETTE_MODE") == "replay":
+        return
+    for model in filter(None, [agent.chatmodel.primary, agent.chatmodel.backup]):
+        # 录制模式下模型被 CassetteChatModel 包装，取内部的真实客户端
+        model = getattr(model, "inner", model)
+        # 供应池模型对每个端点分别预连接
+        for client in getattr(model, "models", {"": model}).values():
+            client.root_client.models.list()
+
+
+def _open_vector_store():
+    """打开向量库（嵌入式 Qdrant 或 VECTOR_SNAPSHOT 快照）并预热嵌入模型连接，快照的向量预先读入页缓存"""
+    from src.Tools import get_vector_store
+    store = get_vector_store()
+    if hasattr(store, "preload"):
+        store.preload()
+    store.embeddings.embed_query("warmup")
+
+
+def _ping_redis():
+    import redis
+    from src.Memory import redis_url
+    redis.Redis.from_url(redis_url).ping()
+
+
+def _prefill_word(word):
+    """
+    以空历史执行一次欢迎语，把结果写入全局 LLM 缓存
+    使用不带记忆的执行器，避免预热对话写入真实会话
+    """
+    from langchain.agents import AgentExecutor, create_tool_calling_agent
+    memorykey = agent.memorykey or "chat_history"
+    prompt = PromptClass(memorykey=memorykey).Prompt_Structure(world=word)
+    executor = AgentExecutor(
+        agent=create_tool_calling_agent(agent.chatmodel, agent.tools, prompt),
+        tools=agent.tools,
+    )
+    executor.invoke({"input": "", memorykey: []})
+
+
+def _create_agent() -> bool:
+    """
+    创建 Agent，失败时按指数退避重试 WARMUP_RETRIES 次（默认 5，间隔从 WARMUP_RETRY_DELAY 秒开始，默认 2）
+    全部失败后记录到 warmup_state["failed"]，/healthz 随之返回 503，由编排系统重启进程
+    """
+    global agent
+    retries = int(os.getenv("WARMUP_RETRIES", "5"))
+    delay = float(os.getenv("WARMUP_RETRY_DELAY", "2"))
+    for attempt in range(retries + 1):
+        try:
+            agent = AgentClass()
+            return True
+        except Exception as e:
+            warmup_state["steps"]["agent"] = {"ok": False, "attempt": attempt + 1, "error": str(e)}
+            logger.error(f"创建Agent失败（第 {attempt + 1} 次）: {e}", exc_info=True)
+            if attempt < retries:
+                time.sleep(delay * (2 ** attempt))
+    warmup_state["failed"] = warmup_state["steps"]["agent"]["error"]
+    return False
+
+
+def warmup():
+    """
+    启动预热：创建 Agent、预连接模型与 Redis、打开向量库、加载分词器，
+    并按 WARMUP_WORDS（逗号分隔）预填欢迎语缓存，完成后标记就绪
+    """
+    global agent
+    start = time.perf_counter()
+    if not _create_agent():
+        return
+    _warmup_step("redis", _ping_redis)
+    _warmup_step("llm_pool", _preconnect_llm)
+    _warmup_step("vector_store", _open_vector_store)
+    _warmup_step("tokenizer", lambda: agent.memory.chatmodel.get_num_tokens("warmup"))
+    for word in filter(None, os.getenv("WARMUP_WORDS", "").split(",")):
+        _warmup_step(f"prefill:{word.strip()}", lambda w=word.strip(): _prefill_word(w))
+    warmup_state["ready"] = True
+    log_event(logger, "warmup_finished", elapsed_ms=round((time.perf_counter() - start) * 1000, 1), steps=warmup_state["steps"])
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 预热在后台线程执行，期间 /healthz 可用、/readyz 返回 503
+    app.state.warmup_task = asyncio.create_task(asyncio.to_thread(warmup))
+    # kill -USR2 <pid> 触发一次采样，结果写入 logs/
+    Profiler.install_signal_handler()
+    yield
+
+
 # 创建 FastAPI 应用并添加元数据
 app = FastAPI(
     title="Agent Bot API",
@@ -18,6 +140,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",  # Swagger UI 路径
     redoc_url="/redoc",  # ReDoc 路径
+    lifespan=lifespan,
 )
 
 # 添加CORS中间件
@@ -29,40 +152,185 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 初始化Agent
-agent = AgentClass()
-
 # 定义请求模型
 class ChatRequest(BaseModel):
     input: str
     user_id: str = "default_user"
 
 # 设置日志
-def setup_logging():
-    """设置日志配置"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler("server.log")
-        ]
-    )
-    return logging.getLogger("Server")
+logger = setup_logging("Server", "server.log")
+
+
+@app.get("/healthz")
+async def healthz():
+    """存活检查：进程能响应即返回 200；预热重试用尽（Agent 无法创建）时返回 503，让编排系统重启进程"""
+    if warmup_state["failed"]:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": warmup_state["failed"]})
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """就绪检查：预热完成前返回 503，负载均衡据此决定是否转发流量；附带各上游端点的熔断状态"""
+    status_code = 200 if warmup_state["ready"] else 503
+    return JSONResponse(status_code=status_code, content={**warmup_state, "breakers": breaker_states()})
 
-logger = setup_logging()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 指标"""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+def run_agent_once(input_text, user_id=None):
+    """
+    执行一轮对话并返回最终回复
+    run_agent 是流式生成器，最后一个片段即最终输出
+    """
+    start = time.perf_counter()
+    output = ""
+    for chunk in agent.run_agent(input_text, user_id=user_id):
+        output = chunk
+    record_timing("total", time.perf_counter() - start)
+    return {"output": output, "result": ""}
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """管理接口鉴权：未配置 ADMIN_TOKEN 时管理接口整体关闭"""
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        raise HTTPException(status_code=404)
+    # 常量时间比较，避免通过响应耗时逐字节猜测令牌
+    if not hmac.compare_digest((x_admin_token or "").encode(), token.encode()):
+        raise HTTPException(status_code=403, detail="无效的管理令牌")
+
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def admin_profile(seconds: float = Query(10, gt=0), interval: float = Query(0.005, ge=0.001)):
+    """
+    对整个进程采样 seconds 秒，返回 collapsed stack 文本
+    可用 flamegraph.pl 或 https://www.speedscope.app 查看
+    """
+    result = await asyncio.to_thread(Profiler.profile, seconds, interval)
+    if result is None:
+        raise HTTPException(status_code=409, detail="已有采样在进行")
+    return PlainTextResponse(result)
+
+
+@app.get("/admin/usage/{dimension}", dependencies=[Depends(require_admin)])
+async def admin_usage(dimension: str, day: Optional[str] = None, limit: int = 100):
+    """
+    按维度（user/session/model/intent/tool）列出某天的 token 用量，按总量倒序
+    day 格式 YYYYMMDD，默认当天；未写入 Redis 的用量会先刷新
+    """
+    if dimension not in Usage.DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"维度必须是 {', '.join(Usage.DIMENSIONS)} 之一")
+    ledger = Usage.get_ledger()
+    await asyncio.to_thread(ledger.flush)
+    return await asyncio.to_thread(ledger.report, dimension, day, limit)
+
+
+@app.get("/admin/usage/{dimension}/{value}", dependencies=[Depends(require_admin)])
+async def admin_usage_detail(dimension: str, value: str, day: Optional[str] = None):
+    """某个用户/会话/模型/意图/工具按模型拆分的 token 用量"""
+    if dimension not in Usage.DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"维度必须是 {', '.join(Usage.DIMENSIONS)} 之一")
+    ledger = Usage.get_ledger()
+    await asyncio.to_thread(ledger.flush)
+    return await asyncio.to_thread(ledger.detail, dimension, value, day)
+
+class IngestUrlsRequest(BaseModel):
+    urls: List[str]
+    prune: bool = False
+
+
+def _submit_job(kind, inputs, **options):
+    try:
+        job = Jobs.get_job_queue().submit(kind, inputs, **options)
+    except Jobs.QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except Jobs.ReadOnlyStore as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return JSONResponse(status_code=202, content=job.as_dict())
+
+
+@app.post("/admin/ingest/urls", dependencies=[Depends(require_admin)])
+async def admin_ingest_urls(request: IngestUrlsRequest):
+    """提交网页入库任务，立即返回任务信息，用 /admin/ingest/jobs/{id} 查询进度"""
+    if not request.urls:
+        raise HTTPException(status_code=400, detail="urls 不能为空")
+    return _submit_job("urls", request.urls, prune=request.prune)
+
+
+@app.post("/admin/ingest/files", dependencies=[Depends(require_admin)])
+async def admin_ingest_file(request: Request, filename: str):
+    """
+    上传单个文件（请求体为文件原始内容，文件名放在 filename 参数中）并提交入库任务
+    请求体按块写入磁盘，不在内存中保存整个文件
+    """
+    from src.Parsers import supported
+    if not supported(filename):
+        raise HTTPException(status_code=400, detail="只支持 PDF、DOCX、Markdown、TXT、CSV 文件")
+    try:
+        path = Jobs.upload_path(filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    partial = f"{path}.part"
+    async with aiofiles.open(partial, "wb") as f:
+        async for chunk in request.stream():
+            await f.write(chunk)
+    os.replace(partial, path)
+    return _submit_job("files", [path])
+
+
+class RebuildRequest(BaseModel):
+    sources: Optional[List[str]] = None
+    embedding_model: Optional[str] = None
+    chunk_size: Optional[int] = None
+    chunk_overlap: Optional[int] = None
+
+
+@app.post("/admin/ingest/rebuild", dependencies=[Depends(require_admin)])
+async def admin_ingest_rebuild(request: RebuildRequest):
+    """提交重建任务：构建新版本集合，校验通过后切换别名，检索不受影响"""
+    options = {k: v for k, v in request.model_dump().items() if k != "sources" and v is not None}
+    return _submit_job("rebuild", request.sources or [], **options)
+
+
+@app.get("/admin/ingest/jobs", dependencies=[Depends(require_admin)])
+async def admin_ingest_jobs():
+    """最近的入库任务，按提交时间倒序"""
+    return [job.as_dict() for job in Jobs.get_job_queue().jobs()]
+
+
+@app.get("/admin/ingest/jobs/{job_id}", dependencies=[Depends(require_admin)])
+async def admin_ingest_job(job_id: str):
+    """任务状态（queued/running/succeeded/failed）、批次进度和最终结果"""
+    job = Jobs.get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.as_dict()
 
 # 添加POST接口处理聊天请求
 @app.post("/chat")
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(
+    request: ChatRequest,
+    http_response: Response,
+    x_debug_timing: Optional[str] = Header(default=None),
+):
+    if not warmup_state["ready"]:
+        return JSONResponse(status_code=503, content={"error": "服务预热中，请稍后重试"})
     try:
         # 将用户添加到存储中
         add_user(request.user_id, {"connected": True, "last_input": request.input})
-        logger.info(f"添加用户 {request.user_id} 到存储 (来自HTTP请求)")
+        log_event(logger, "user_added", user_id=request.user_id, source="http")
         
-        # 使用Agent处理输入
-        response = agent.run_agent(request.input)
-        logger.info(f"Agent响应HTTP请求: {response}")
+        # 使用Agent处理输入，请求头 X-Debug-Timing: 1 时记录各阶段耗时
+        with timing_trace(x_debug_timing == "1") as trace:
+            # run_agent 是同步生成器，放到线程中执行，避免阻塞事件循环；to_thread 复制上下文，阶段耗时仍记录到 trace
+            response = await asyncio.to_thread(run_agent_once, request.input, request.user_id)
+        if trace is not None:
+            http_response.headers["Server-Timing"] = server_timing_header(trace)
+        log_payload(logger, "agent_response", response)
         
         # 返回响应
         return {
@@ -75,7 +343,12 @@ async def chat_endpoint(request: ChatRequest):
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    if not warmup_state["ready"]:
+        # 1013: Try Again Later
+        await websocket.close(code=1013)
+        return
     await websocket.accept()
+    WS_CONNECTIONS.labels("/ws").inc()
     try:
         while True:
             # 接收客户端消息
@@ -88,22 +361,29 @@ async def websocket_endpoint(websocket: WebSocket):
                 
                 # 将用户添加到存储中 - 参照DingWebHook的实现
                 add_user(user_id, {"connected": True, "last_input": input_text})
-                logger.info(f"添加用户 {user_id} 到存储")
+                log_event(logger, "user_added", user_id=user_id, source="ws")
                 
-                # 使用Agent处理输入
-                response = agent.run_agent(input_text)
-                logger.info(f"Agent响应: {response}")
+                # 使用Agent处理输入，消息中 debug_timing 为真时在回复中附带各阶段耗时
+                with timing_trace(bool(message.get("debug_timing"))) as trace:
+                    response = await asyncio.to_thread(run_agent_once, input_text, user_id)
+                log_payload(logger, "agent_response", response)
                 
                 # 发送响应
-                await websocket.send_text(json.dumps({
+                frame = {
                     "output": response.get("output", ""),
                     "result": response.get("result", "")
-                }))
+                }
+                if trace is not None:
+                    frame["trace"] = trace
+                await websocket.send_text(json.dumps(frame))
+                WS_MESSAGES.labels("/ws", "ok").inc()
             except json.JSONDecodeError:
+                WS_MESSAGES.labels("/ws", "invalid").inc()
                 await websocket.send_text(json.dumps({
                     "error": "无效的JSON格式"
                 }))
             except Exception as e:
+                WS_MESSAGES.labels("/ws", "error").inc()
                 logger.error(f"处理消息时出错: {e}")
                 await websocket.send_text(json.dumps({
                     "error": str(e)
@@ -113,6 +393,7 @@ async def websocket_endpoint(websocket: WebSocket):
     except Exception as e:
         logger.error(f"WebSocket错误: {e}")
     finally:
+        WS_CONNECTIONS.labels("/ws").dec()
         await websocket.close()
 
 if __name__ == "__main__":
@@ -9,6 +9,11 @@ from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query
 from fastapi.responses import HTMLResponse # 用于提供简单的前端页面
+import sys
+
+# 从 test/ 目录直接运行时也能导入项目根目录下的 src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.Models import create_routed_model
 
 # --- LangGraph 配置和初始化 (与您之前的代码基本相同) ---
 load_dotenv()
@@ -17,14 +22,15 @@ base_url = os.getenv("BASE_URL")
 model_api_key = os.getenv("MODEL_API_KEY")
 model_name = os.getenv("MODEL_NAME")
 
-llm = ChatOpenAI(
+# 配置了 BACKUP_MODEL 时，主模型出错或首 token 过慢由备用模型接管（见 src/Routing.py）
+llm = create_routed_model(ChatOpenAI(
     base_url=base_url,
     api_key=model_api_key,
     model=model_name,
     temperature=0.1,
     max_tokens=512,
     streaming=True
-)
+))
 
 SYSTEM_PROMPT_TEMPLATE = '''你是一位专业的英语单词学习助手，当前学习单词为“{word}”。
 【对话规则】
@@ -0,0 +1,57 @@
+"""
+AgentClass 并发测试：服务用 asyncio.to_thread 并发执行多轮对话，两个学习不同单词的对话不能串用对方的提示词和执行器
+
+运行: python -m pytest test/test_agents.py
+"""
+import os
+import re
+import threading
+from typing import Any
+
+from langchain_core.messages import AIMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from bench.fakes import InstantChatModel, use_fake_redis
+
+
+class WordEchoModel(InstantChatModel):
+    """回复系统提示词中的当前单词"""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        system = next(message.content for message in messages if isinstance(message, SystemMessage))
+        word = re.search(r"当前学习单词为“(.*?)”", system).group(1)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=word))])
+
+
+def test_concurrent_turns_keep_their_own_word(monkeypatch):
+    for key in ("OPENAI_API_KEY", "DEEPSEEK_API_KEY"):
+        monkeypatch.setenv(key, "test")
+    monkeypatch.setenv("BASE_MODEL", "test-model")
+    monkeypatch.setenv("BACKUP_MODEL", "test-backup")
+    monkeypatch.setenv("MEMORY_KEY", "chat_history")
+    use_fake_redis()
+    from src import Agents
+
+    monkeypatch.setattr(Agents, "create_routed_model", lambda *args, **kwargs: WordEchoModel())
+    # 两轮都构建好执行器后才继续，旧实现中后构建的一轮会覆盖共享的 agent_chain
+    barrier = threading.Barrier(2, timeout=10)
+
+    def get_user(key):
+        barrier.wait()
+        return None
+
+    monkeypatch.setattr(Agents, "get_user", get_user)
+    agent = Agents.AgentClass()
+
+    outputs = {}
+
+    def turn(word):
+        outputs[word] = list(agent.run_agent("例句", world=word, user_id=f"user-{word}"))[-1]
+
+    threads = [threading.Thread(target=turn, args=(word,)) for word in ("boy", "girl")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert outputs == {"boy": "boy", "girl": "girl"}
@@ -0,0 +1,50 @@
+"""
+EmbeddingCache 多实例测试：同一目录的两个实例交替写入，不能互相覆盖行
+
+运行: python -m pytest test/test_embedding_cache.py
+"""
+import numpy as np
+
+from src.Embedding import EmbeddingCache
+
+
+def _vectors(prefix, count, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    return {f"{prefix}-{i}": rng.random(dim, dtype=np.float32) for i in range(count)}
+
+
+def test_two_instances_do_not_overwrite_rows(tmp_path):
+    first = EmbeddingCache(str(tmp_path), "model")
+    second = EmbeddingCache(str(tmp_path), "model")
+    a, b, c = _vectors("a", 10, seed=1), _vectors("b", 10, seed=2), _vectors("c", 2000, seed=3)
+
+    first.put_many(a)
+    second.put_many(b)
+    # 第一个实例的映射仍是旧容量，这一批需要扩容到第二个实例不知道的行
+    first.put_many(c)
+
+    expected = {**a, **b, **c}
+    for cache in (first, second):
+        found = cache.get_many(list(expected))
+        assert found.keys() == expected.keys()
+        for digest, vector in expected.items():
+            np.testing.assert_array_equal(found[digest], vector)
+    assert len(first) == len(second) == len(expected)
+    first.close()
+    second.close()
+
+
+def test_reopen_keeps_vectors(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model")
+    vectors = _vectors("x", 5)
+    cache.put_many(vectors)
+    cache.put_many(vectors)  # 已存在的哈希不会再分配行
+    cache.close()
+
+    reopened = EmbeddingCache(str(tmp_path), "model")
+    assert len(reopened) == 5
+    found = reopened.get_many(list(vectors) + ["missing"])
+    assert found.keys() == vectors.keys()
+    for digest, vector in vectors.items():
+        np.testing.assert_array_equal(found[digest], vector)
+    reopened.close()
@@ -0,0 +1,70 @@
+"""
+HedgedChatModel 测试：非流式 invoke 也按首个 chunk 对冲，响应慢但持续输出的主模型不会触发备用模型
+
+运行: python -m pytest test/test_routing.py
+"""
+import time
+import uuid
+from typing import Any, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from src.Routing import HedgedChatModel
+
+
+class SlowStreamingModel(BaseChatModel):
+    """首个 chunk 很快返回，整个回答耗时 len(words) * delay 秒"""
+
+    model_name: str
+    words: List[str]
+    delay: float
+    calls: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-streaming"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        self.calls.append("generate")
+        time.sleep(len(self.words) * self.delay)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(self.words)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        self.calls.append("stream")
+        for word in self.words:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+            time.sleep(self.delay)
+
+
+def test_slow_streaming_primary_does_not_hedge_on_invoke():
+    # 熔断器按模型名共享，使用唯一名称避免受其他测试影响
+    primary = SlowStreamingModel(model_name=f"primary-{uuid.uuid4().hex}", words=["a", "b", "c", "d"], delay=0.3, calls=[])
+    backup = SlowStreamingModel(model_name=f"backup-{uuid.uuid4().hex}", words=["backup"], delay=0, calls=[])
+    model = HedgedChatModel(primary=primary, backup=backup, hedge_after=0.5, deadline=10)
+
+    start = time.perf_counter()
+    result = model.invoke("hi")
+
+    assert result.content == "abcd"
+    assert time.perf_counter() - start >= 1.0
+    assert backup.calls == []
+
+
+class SilentModel(SlowStreamingModel):
+    """delay 秒内没有任何输出"""
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        self.calls.append("stream")
+        time.sleep(self.delay)
+        yield ChatGenerationChunk(message=AIMessageChunk(content="late"))
+
+
+def test_silent_primary_is_hedged_on_invoke():
+    primary = SilentModel(model_name=f"primary-{uuid.uuid4().hex}", words=[], delay=2, calls=[])
+    backup = SlowStreamingModel(model_name=f"backup-{uuid.uuid4().hex}", words=["backup"], delay=0, calls=[])
+    model = HedgedChatModel(primary=primary, backup=backup, hedge_after=0.2, deadline=10)
+
+    assert model.invoke("hi").content == "backup"
+    assert backup.calls == ["stream"]
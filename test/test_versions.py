@@ -0,0 +1,61 @@
+"""
+DocumentProcessor 版本集合测试：同一秒内连续创建版本不能与线上版本重名，线上集合不能被构建或删除
+
+运行: python -m pytest test/test_versions.py
+"""
+import time
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from qdrant_client import QdrantClient
+
+from src import AddDoc
+
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_CACHE_DIR", "")
+    monkeypatch.setattr(AddDoc, "create_embeddings", lambda model=None: DeterministicFakeEmbedding(size=1024))
+    # 所有版本都在同一秒内创建
+    second = int(time.time()) * 10**9
+    counter = iter(range(10**6))
+    monkeypatch.setattr(AddDoc.time, "time_ns", lambda: second + next(counter))
+    client = QdrantClient(path=str(tmp_path / "store"))
+    return AddDoc.DocumentProcessor(collection_name="docs", persist_directory=str(tmp_path), client=client)
+
+
+def _builder(processor, version):
+    return AddDoc.DocumentProcessor(
+        collection_name="docs", persist_directory=processor.storage_dir, client=processor.client,
+        version=version, store_lock=processor._store_lock,
+    )
+
+
+def test_back_to_back_versions_in_same_second(processor):
+    live = processor.collection_name
+    first = processor._new_version()
+    _builder(processor, first)
+    second = processor._new_version()
+
+    assert len({live, first, second}) == 3
+    # 名称排序即创建顺序，_gc_versions 依赖这一点
+    assert sorted([second, first, live]) == [live, first, second]
+
+
+def test_failed_build_keeps_live_collection(processor):
+    live = processor.collection_name
+    builder = _builder(processor, processor._new_version())
+    builder._drop()
+
+    names = {collection.name for collection in processor.client.get_collections().collections}
+    assert names == {live}
+    assert processor._aliases() == {"docs": live}
+
+
+def test_refuses_to_build_into_or_drop_live_collection(processor):
+    live = processor.collection_name
+    with pytest.raises(RuntimeError):
+        _builder(processor, live)
+
+    processor._drop()
+    assert live in {collection.name for collection in processor.client.get_collections().collections}